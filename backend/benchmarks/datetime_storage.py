@@ -0,0 +1,73 @@
+"""Index size and range-scan speed: isoformat strings vs native dates.
+
+Seeds the same timestamps into two collections, one storing created_at as
+an isoformat string (the old layout) and one as a BSON date, indexes both,
+then reports the created_at index size and the time of random one-hour
+range queries.
+
+    cd backend && python benchmarks/datetime_storage.py [documents] [queries]
+"""
+import asyncio
+import os
+import random
+import statistics
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ['DB_NAME'] = f"bench_datetimes_{uuid.uuid4().hex[:8]}"
+
+import server  # noqa: E402
+
+db = server.db
+BATCH_SIZE = 10000
+SPAN = timedelta(days=30)
+
+
+async def seed(count, start):
+    for offset in range(0, count, BATCH_SIZE):
+        stamps = [start + SPAN * random.random() for _ in range(min(BATCH_SIZE, count - offset))]
+        await asyncio.gather(
+            db.string_dates.insert_many([{"created_at": at.isoformat()} for at in stamps], ordered=False),
+            db.native_dates.insert_many([{"created_at": at} for at in stamps], ordered=False)
+        )
+    await asyncio.gather(
+        db.string_dates.create_index("created_at"),
+        db.native_dates.create_index("created_at")
+    )
+
+
+async def range_scan(collection, windows, encode):
+    timings = []
+    for low in windows:
+        high = low + timedelta(hours=1)
+        started = time.perf_counter()
+        await collection.count_documents({"created_at": {"$gte": encode(low), "$lt": encode(high)}})
+        timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+    return statistics.median(timings), timings[min(len(timings) - 1, int(len(timings) * 0.99))]
+
+
+async def main(count, queries):
+    start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    try:
+        await seed(count, start)
+        windows = [start + SPAN * random.random() for _ in range(queries)]
+        print(f"{count} documents, {queries} one-hour range counts")
+        print(f"{'layout':>8} {'index KiB':>10} {'p50 ms':>8} {'p99 ms':>8}")
+        for label, name, encode in (("string", "string_dates", datetime.isoformat),
+                                    ("date", "native_dates", lambda at: at)):
+            stats = await db.command("collStats", name)
+            index_kib = stats['indexSizes']['created_at_1'] / 1024
+            p50, p99 = await range_scan(db[name], windows, encode)
+            print(f"{label:>8} {index_kib:>10.0f} {p50:>8.2f} {p99:>8.2f}")
+    finally:
+        await server.client.drop_database(os.environ['DB_NAME'])
+
+
+if __name__ == '__main__':
+    args = [int(a) for a in sys.argv[1:]]
+    asyncio.run(main(args[0] if args else 1_000_000, args[1] if len(args) > 1 else 500))
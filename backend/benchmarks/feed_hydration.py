@@ -0,0 +1,112 @@
+"""Round-trips and latency of feed hydration as the page size grows.
+
+Compares the old per-post enrichment loop with ``hydrate_posts``.
+
+    cd backend && python benchmarks/feed_hydration.py
+
+Needs a local mongod at MONGO_URL; data is seeded into a throwaway database.
+"""
+import asyncio
+import os
+import sys
+import time
+import uuid
+from pathlib import Path
+
+from pymongo import monitoring
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ['DB_NAME'] = f"bench_hydration_{uuid.uuid4().hex[:8]}"
+
+
+class CommandCounter(monitoring.CommandListener):
+    def __init__(self):
+        self.count = 0
+
+    def started(self, event):
+        self.count += 1
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+
+counter = CommandCounter()
+monitoring.register(counter)
+
+import server  # noqa: E402
+
+db = server.db
+PAGE_SIZES = [5, 10, 20, 50, 100]
+REACTION_TYPES = ["like", "love", "haha", "wow", "sad", "angry"]
+
+
+async def seed(post_count: int, users: int = 50, reactions_per_post: int = 30, comments_per_post: int = 10):
+    user_ids = [str(uuid.uuid4()) for _ in range(users)]
+    await db.users.insert_many([
+        {"id": uid, "email": f"{uid}@bench.local", "name": f"user-{i}", "created_at": "2024-01-01T00:00:00+00:00"}
+        for i, uid in enumerate(user_ids)
+    ])
+    posts, reactions, comments = [], [], []
+    for i in range(post_count):
+        post_id = str(uuid.uuid4())
+        posts.append({
+            "id": post_id, "user_id": user_ids[i % users], "content": f"post {i}",
+            "media_urls": [], "post_type": "regular", "hashtags": [], "mentions": [],
+            "created_at": f"2024-01-01T00:{i // 60:02d}:{i % 60:02d}+00:00"
+        })
+        for j in range(reactions_per_post):
+            reactions.append({
+                "id": str(uuid.uuid4()), "post_id": post_id, "user_id": user_ids[j % users],
+                "reaction_type": REACTION_TYPES[j % len(REACTION_TYPES)]
+            })
+        for j in range(comments_per_post):
+            comments.append({"id": str(uuid.uuid4()), "post_id": post_id, "user_id": user_ids[j % users], "content": "hi"})
+    await db.posts.insert_many(posts)
+    await db.reactions.insert_many(reactions)
+    await db.comments.insert_many(comments)
+    return user_ids[0]
+
+
+async def legacy_hydrate(posts, viewer_id):
+    for post in posts:
+        post['user'] = await db.users.find_one({"id": post['user_id']}, {"_id": 0, "password_hash": 0})
+        reactions = await db.reactions.find({"post_id": post['id']}, {"_id": 0}).to_list(1000)
+        post['reaction_counts'] = {}
+        for reaction in reactions:
+            rtype = reaction['reaction_type']
+            post['reaction_counts'][rtype] = post['reaction_counts'].get(rtype, 0) + 1
+        user_reaction = await db.reactions.find_one({"post_id": post['id'], "user_id": viewer_id})
+        post['user_reaction'] = user_reaction['reaction_type'] if user_reaction else None
+        post['comment_count'] = await db.comments.count_documents({"post_id": post['id']})
+    return posts
+
+
+async def measure(hydrate, page_size, viewer_id, repeats=5):
+    round_trips, elapsed = 0, 0.0
+    for _ in range(repeats):
+        posts = await db.posts.find({}, {"_id": 0}).sort("created_at", -1).limit(page_size).to_list(page_size)
+        before = counter.count
+        start = time.perf_counter()
+        await hydrate(posts, viewer_id)
+        elapsed += time.perf_counter() - start
+        round_trips += counter.count - before
+    return round_trips // repeats, elapsed / repeats * 1000
+
+
+async def main():
+    viewer_id = await seed(max(PAGE_SIZES))
+    try:
+        print(f"{'page':>6} {'legacy rt':>10} {'legacy ms':>10} {'batched rt':>11} {'batched ms':>11}")
+        for size in PAGE_SIZES:
+            legacy_rt, legacy_ms = await measure(legacy_hydrate, size, viewer_id)
+            batched_rt, batched_ms = await measure(server.hydrate_posts, size, viewer_id)
+            print(f"{size:>6} {legacy_rt:>10} {legacy_ms:>10.2f} {batched_rt:>11} {batched_ms:>11.2f}")
+    finally:
+        await server.client.drop_database(os.environ['DB_NAME'])
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,79 @@
+"""Per-page latency of skip/limit versus keyset cursors, 10k items deep.
+
+    cd backend && python benchmarks/keyset_pagination.py
+
+Needs a local mongod at MONGO_URL; data is seeded into a throwaway database.
+"""
+import asyncio
+import os
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ['DB_NAME'] = f"bench_keyset_{uuid.uuid4().hex[:8]}"
+
+import server  # noqa: E402
+
+db = server.db
+ITEMS = 12000
+PAGE_SIZE = 20
+DEPTHS = [0, 1000, 2500, 5000, 7500, 10000]
+
+
+async def seed():
+    start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    conversation_id = str(uuid.uuid4())
+    posts, messages = [], []
+    for i in range(ITEMS):
+        # Pairs of items share a timestamp so the id tie-breaker is exercised
+        created_at = start + timedelta(seconds=i // 2)
+        posts.append({"id": str(uuid.uuid4()), "user_id": "author", "content": f"reel {i}",
+                      "post_type": "reel", "created_at": created_at})
+        messages.append({"id": str(uuid.uuid4()), "conversation_id": conversation_id,
+                         "sender_id": "author", "content": f"message {i}", "created_at": created_at})
+    await db.posts.insert_many(posts)
+    await db.messages.insert_many(messages)
+    await db.posts.create_index([("post_type", 1), ("created_at", -1), ("id", -1)])
+    await db.messages.create_index([("conversation_id", 1), ("created_at", 1), ("id", 1)])
+    return conversation_id
+
+
+async def walk(collection, query, descending):
+    """Walk the collection page by page, timing the page fetched at each depth."""
+    skip_ms, cursor_ms = {}, {}
+    cursor = None
+    for offset in range(0, max(DEPTHS) + 1, PAGE_SIZE):
+        started = time.perf_counter()
+        items, cursor = await server.find_page(collection, query, PAGE_SIZE, cursor, descending=descending)
+        elapsed = (time.perf_counter() - started) * 1000
+        if offset in DEPTHS:
+            cursor_ms[offset] = elapsed
+            started = time.perf_counter()
+            skipped, _ = await server.find_page(collection, query, PAGE_SIZE, skip=offset, descending=descending)
+            skip_ms[offset] = (time.perf_counter() - started) * 1000
+            assert [i['id'] for i in skipped] == [i['id'] for i in items]
+    return skip_ms, cursor_ms
+
+
+async def main():
+    conversation_id = await seed()
+    try:
+        for label, collection, query, descending in (
+            ("reels (newest first)", db.posts, {"post_type": "reel"}, True),
+            ("messages (oldest first)", db.messages, {"conversation_id": conversation_id}, False),
+        ):
+            skip_ms, cursor_ms = await walk(collection, query, descending)
+            print(label)
+            print(f"{'depth':>8} {'skip ms':>9} {'cursor ms':>10}")
+            for depth in DEPTHS:
+                print(f"{depth:>8} {skip_ms[depth]:>9.2f} {cursor_ms[depth]:>10.2f}")
+            print()
+    finally:
+        await server.client.drop_database(os.environ['DB_NAME'])
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
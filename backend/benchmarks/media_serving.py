@@ -0,0 +1,80 @@
+"""Compare the old StaticFiles mount with MediaFiles on /uploads.
+
+Workloads: repeated full downloads of a large file, random 1 MiB range
+requests (video scrubbing) and conditional revalidation with If-None-Match.
+Both apps are driven in-process through httpx's ASGI transport.
+
+    cd backend && python benchmarks/media_serving.py [size_mb]
+"""
+import asyncio
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+upload_dir = tempfile.mkdtemp(prefix="bench_media_")
+os.environ['UPLOAD_DIR'] = upload_dir
+
+import httpx  # noqa: E402
+from starlette.applications import Starlette  # noqa: E402
+from starlette.routing import Mount  # noqa: E402
+from starlette.staticfiles import StaticFiles  # noqa: E402
+
+import server  # noqa: E402
+
+REQUESTS = 50
+
+
+async def run(app, path, size):
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        results = {}
+
+        started = time.perf_counter()
+        for _ in range(REQUESTS // 5):
+            response = await client.get(path)
+            assert response.status_code == 200
+        results['full MB/s'] = (REQUESTS // 5) * size / (time.perf_counter() - started) / (1024 * 1024)
+
+        started = time.perf_counter()
+        for _ in range(REQUESTS):
+            offset = random.randrange(0, size - (1 << 20))
+            response = await client.get(path, headers={"Range": f"bytes={offset}-{offset + (1 << 20) - 1}"})
+            assert response.status_code == 206
+        results['range req/s'] = REQUESTS / (time.perf_counter() - started)
+
+        etag = (await client.head(path)).headers['etag']
+        started = time.perf_counter()
+        for _ in range(REQUESTS):
+            response = await client.get(path, headers={"If-None-Match": etag})
+            assert response.status_code == 304
+        results['revalidate req/s'] = REQUESTS / (time.perf_counter() - started)
+        return results
+
+
+async def main(size_mb):
+    size = size_mb * 1024 * 1024
+    payload = os.urandom(size)
+    digest = server.hashlib.sha256(payload).hexdigest()
+    relative = f"media/{digest[:2]}/{digest}.mp4"
+    target = Path(upload_dir) / relative
+    target.parent.mkdir(parents=True, exist_ok=True)
+    target.write_bytes(payload)
+
+    static_app = Starlette(routes=[Mount("/uploads", StaticFiles(directory=upload_dir))])
+    media_app = Starlette(routes=[Mount("/uploads", server.MediaFiles(Path(upload_dir)))])
+    try:
+        print(f"{size_mb} MB file, {REQUESTS} requests per workload")
+        for label, app in (("StaticFiles", static_app), ("MediaFiles", media_app)):
+            results = await run(app, f"/uploads/{relative}", size)
+            print(f"{label:>12}: " + ", ".join(f"{k} {v:.1f}" for k, v in results.items()))
+    finally:
+        shutil.rmtree(upload_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 64))
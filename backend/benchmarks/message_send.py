@@ -0,0 +1,87 @@
+"""Send latency for conversations of 2, 50 and 500 participants.
+
+Every participant holds a simulated websocket. The old path (insert, re-read
+the conversation, one awaited send per participant) is compared with the
+``send_message`` endpoint, which checks membership against the cached
+participant list and hands delivery to ``manager.send_many`` once. Run with
+REALTIME_BUS=mongo (and a replica set) to include cross-worker publishes.
+
+    cd backend && python benchmarks/message_send.py [sends]
+"""
+import asyncio
+import os
+import statistics
+import sys
+import time
+import uuid
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ['DB_NAME'] = f"bench_messages_{uuid.uuid4().hex[:8]}"
+
+import server  # noqa: E402
+
+db = server.db
+GROUP_SIZES = [2, 50, 500]
+
+
+class SimulatedWebSocket:
+    async def accept(self):
+        pass
+
+    async def send_text(self, data):
+        await asyncio.sleep(0)
+
+    async def close(self, code=1000):
+        pass
+
+
+async def legacy_send(conversation_id, sender_id, content):
+    message = server.Message(conversation_id=conversation_id, sender_id=sender_id, content=content)
+    doc = server.to_document(message)
+    await db.messages.insert_one(dict(doc))
+    conversation = await db.conversations.find_one({"id": conversation_id})
+    for participant_id in conversation['participants']:
+        if participant_id != sender_id:
+            await server.manager.send_message(participant_id, {'type': 'message', 'data': doc})
+
+
+async def measure(send, sends):
+    timings = []
+    for i in range(sends):
+        started = time.perf_counter()
+        await send(f"message {i}")
+        timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+    return statistics.median(timings), timings[max(0, int(len(timings) * 0.99) - 1)]
+
+
+async def main(sends):
+    await server.ensure_indexes()
+    await server.manager.bus.start(server.manager.deliver_local)
+    print(f"{sends} sends per group size, bus: {server.REALTIME_BUS}")
+    print(f"{'members':>8} {'legacy p50':>11} {'legacy p99':>11} {'new p50':>9} {'new p99':>9}")
+    try:
+        for size in GROUP_SIZES:
+            members = [f"member-{size}-{i}" for i in range(size)]
+            for member in members:
+                await server.manager.connect(member, SimulatedWebSocket())
+            conversation = server.Conversation(participants=members, conversation_type="group")
+            doc = server.to_document(conversation)
+            doc['last_activity_at'] = doc['created_at']
+            await db.conversations.insert_one(doc)
+            token = server.create_jwt_token(members[0], "Sender")
+
+            legacy = await measure(lambda content: legacy_send(conversation.id, members[0], content), sends)
+            current = await measure(
+                lambda content: server.send_message(conversation.id, content=content, authorization=f"Bearer {token}"),
+                sends
+            )
+            print(f"{size:>8} {legacy[0]:>9.2f}ms {legacy[1]:>9.2f}ms {current[0]:>7.2f}ms {current[1]:>7.2f}ms")
+    finally:
+        await server.manager.bus.stop()
+        await server.client.drop_database(os.environ['DB_NAME'])
+
+
+if __name__ == '__main__':
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 200))
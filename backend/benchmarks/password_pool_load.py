@@ -0,0 +1,67 @@
+"""Event-loop latency while a login burst saturates password hashing.
+
+A ticker coroutine sleeps for 5ms in a loop and records how late it wakes
+up. The burst is run once with bcrypt called inline (the old behaviour) and
+once through ``password_hasher``.
+
+    cd backend && python benchmarks/password_pool_load.py [logins]
+"""
+import asyncio
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import server  # noqa: E402
+
+TICK = 0.005
+
+
+async def ticker(lags, stop):
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(TICK)
+        lags.append((time.perf_counter() - started - TICK) * 1000)
+
+
+async def inline_login(password, hashed):
+    return server.verify_password(password, hashed)
+
+
+async def pooled_login(password, hashed):
+    try:
+        return await server.password_hasher.verify(password, hashed)
+    except server.HTTPException:
+        return None
+
+
+async def run(login, logins, password, hashed):
+    lags, stop = [], asyncio.Event()
+    ticking = asyncio.create_task(ticker(lags, stop))
+    started = time.perf_counter()
+    results = await asyncio.gather(*(login(password, hashed) for _ in range(logins)))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await ticking
+    lags.sort()
+    p99 = lags[int(len(lags) * 0.99) - 1] if lags else 0.0
+    rejected = sum(1 for r in results if r is None)
+    return elapsed, statistics.median(lags) if lags else 0.0, p99, max(lags, default=0.0), rejected
+
+
+async def main(logins):
+    password = "correct horse battery staple"
+    hashed = server.hash_password(password)
+    print(f"{logins} logins, cost {server.BCRYPT_ROUNDS}, {server.password_hasher.stats()['workers']} workers, "
+          f"capacity {server.password_hasher.capacity}")
+    print(f"{'mode':>8} {'total s':>8} {'lag p50 ms':>11} {'lag p99 ms':>11} {'lag max ms':>11} {'rejected':>9}")
+    for label, login in (("inline", inline_login), ("pooled", pooled_login)):
+        elapsed, p50, p99, worst, rejected = await run(login, logins, password, hashed)
+        print(f"{label:>8} {elapsed:>8.2f} {p50:>11.2f} {p99:>11.2f} {worst:>11.2f} {rejected:>9}")
+    server.password_hasher.shutdown()
+
+
+if __name__ == '__main__':
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 50))
@@ -0,0 +1,109 @@
+"""Encoding cost per feed page: FastAPI's default path vs FastJSONResponse.
+
+Builds a 20-post feed page shaped like get_feed's output (author summaries,
+reaction maps, media variants, datetimes) and times:
+
+  default    jsonable_encoder + JSONResponse (what a plain dict return does)
+  orjson     FastJSONResponse over the same dicts
+  cold       FastJSONResponse, authors serialized into fresh fragments
+  warm       FastJSONResponse, authors spliced in from user_fragment_cache
+
+    cd backend && python benchmarks/response_encoding.py [iterations]
+"""
+import copy
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from fastapi.encoders import jsonable_encoder  # noqa: E402
+from fastapi.responses import JSONResponse  # noqa: E402
+
+import server  # noqa: E402
+
+POSTS = 20
+
+
+def make_page():
+    now = datetime.now(timezone.utc)
+    authors = [{
+        "id": str(uuid.uuid4()),
+        "email": f"author{i}@example.com",
+        "name": f"Author {i}",
+        "picture": f"/uploads/media/ab/{uuid.uuid4().hex}_thumb.webp",
+        "picture_variants": {size: f"/uploads/media/ab/{uuid.uuid4().hex}_{size}.webp"
+                             for size in server.IMAGE_VARIANT_WIDTHS},
+        "cover_photo": None,
+        "bio": "Photographer and occasional writer. " * 3,
+        "work": "Example Corp",
+        "education": "Example University",
+        "city": "Springfield",
+        "follower_count": 1234,
+        "created_at": now - timedelta(days=400),
+    } for i in range(5)]
+    posts = [{
+        "id": str(uuid.uuid4()),
+        "user_id": authors[i % 5]['id'],
+        "content": "Lorem ipsum dolor sit amet, consectetur adipiscing elit #python @someone " * 2,
+        "media_urls": [f"/uploads/media/cd/{uuid.uuid4().hex}_medium.webp"],
+        "media_variants": [{size: f"/uploads/media/cd/{uuid.uuid4().hex}_{size}.webp"
+                            for size in server.IMAGE_VARIANT_WIDTHS}],
+        "post_type": "regular",
+        "hashtags": ["python"],
+        "mentions": ["someone"],
+        "reaction_counts": {"like": 42, "love": 7, "haha": 3},
+        "reactions_count": 52,
+        "comments_count": 9,
+        "user_reaction": "like" if i % 3 == 0 else None,
+        "created_at": now - timedelta(minutes=i),
+        "user": server.user_summary(authors[i % 5]),
+    } for i in range(POSTS)]
+    return {"posts": posts, "next_cursor": server.encode_cursor(posts[-1]['created_at'], posts[-1]['id'])}
+
+
+def default_path(page):
+    return JSONResponse(jsonable_encoder(page)).body
+
+
+def orjson_path(page):
+    return server.FastJSONResponse(page).body
+
+
+def warm_path(page):
+    # Hydration hands out fresh dicts per request; embedding replaces them
+    posts = [dict(post) for post in page['posts']]
+    server.embed_user_fragments(posts)
+    return server.FastJSONResponse({"posts": posts, "next_cursor": page['next_cursor']}).body
+
+
+def cold_path(page):
+    for post in page['posts']:
+        server.user_fragment_cache.pop(post['user_id'])
+    return warm_path(page)
+
+
+def measure(encode, page, iterations):
+    encode(copy.deepcopy(page))
+    started = time.perf_counter()
+    for _ in range(iterations):
+        body = encode(page)
+    return (time.perf_counter() - started) / iterations * 1e6, len(body)
+
+
+def main(iterations):
+    page = make_page()
+    print(f"{POSTS}-post feed page, {iterations} iterations")
+    print(f"{'path':>10} {'us/page':>9} {'bytes':>7}")
+    baseline = None
+    for label, encode in (("default", default_path), ("orjson", orjson_path), ("cold", cold_path),
+                          ("warm", warm_path)):
+        cost, size = measure(encode, page, iterations)
+        baseline = baseline or cost
+        print(f"{label:>10} {cost:>9.1f} {size:>7}  ({baseline / cost:.1f}x)")
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
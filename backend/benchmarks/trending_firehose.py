@@ -0,0 +1,71 @@
+"""Trending accuracy and throughput against a synthetic post firehose.
+
+Generates posts over a simulated day whose hashtags follow a Zipf
+distribution, with a few tags bursting in the final hours. The SpaceSaving
+sketches in ``TrendingTags`` are compared with exact counts over each
+trending window (precision of the top-K and worst relative count error).
+
+    cd backend && python benchmarks/trending_firehose.py [posts] [tags]
+"""
+import itertools
+import random
+import sys
+import time
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import server  # noqa: E402
+
+TOP_K = 10
+HOURS = 24
+
+
+def firehose(posts, tag_count, rng):
+    cum_weights = list(itertools.accumulate(1 / (rank + 1) ** 1.1 for rank in range(tag_count)))
+    tags = [f"tag{rank}" for rank in range(tag_count)]
+    bursting = [f"burst{i}" for i in range(3)]
+    start = datetime.now(timezone.utc) - timedelta(hours=HOURS)
+    for i in range(posts):
+        at = start + timedelta(seconds=HOURS * 3600 * i / posts)
+        chosen = rng.choices(tags, cum_weights=cum_weights, k=rng.randint(1, 3))
+        if at > start + timedelta(hours=HOURS - 2) and rng.random() < 0.15:
+            chosen.append(rng.choice(bursting))
+        yield at, list(dict.fromkeys(chosen))
+
+
+def main(posts, tag_count):
+    rng = random.Random(11)
+    trending = server.TrendingTags()
+    # Exact counts per minute; windows are compared at minute resolution
+    exact = {}
+    started = time.perf_counter()
+    for at, tags in firehose(posts, tag_count, rng):
+        trending.observe(tags, at)
+        exact.setdefault(at.replace(second=0, microsecond=0), Counter()).update(tags)
+    elapsed = time.perf_counter() - started
+    print(f"{posts} posts, {tag_count} distinct tags, sketch capacity {trending.capacity}: "
+          f"{posts / elapsed:,.0f} posts/s")
+
+    now = datetime.now(timezone.utc)
+    for window, hours in server.TRENDING_WINDOWS.items():
+        start = now - timedelta(hours=hours)
+        truth = Counter()
+        for minute, counts in exact.items():
+            if minute >= start:
+                truth.update(counts)
+        started = time.perf_counter()
+        approx = trending.top(hours, TOP_K, now)
+        query_ms = (time.perf_counter() - started) * 1000
+        expected = {tag for tag, _ in truth.most_common(TOP_K)}
+        precision = len(expected & {entry['tag'] for entry in approx}) / TOP_K
+        error = max(abs(entry['count'] - truth[entry['tag']]) / max(truth[entry['tag']], 1) for entry in approx)
+        print(f"{window:>4}: top-{TOP_K} precision {precision:.2f}, max count error {error:.2%}, "
+              f"query {query_ms:.2f}ms, top {[entry['tag'] for entry in approx[:5]]}")
+
+
+if __name__ == '__main__':
+    args = [int(a) for a in sys.argv[1:]]
+    main(args[0] if args else 1_000_000, args[1] if len(args) > 1 else 100_000)
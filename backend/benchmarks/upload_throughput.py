@@ -0,0 +1,88 @@
+"""Upload throughput for 1, 10 and 50 concurrent multi-megabyte files.
+
+Compares the old synchronous ``shutil.copyfileobj`` path with the chunked
+``save_upload_files`` pipeline, and reports how late a 5ms ticker wakes up
+while each runs (event-loop blocking).
+
+    cd backend && python benchmarks/upload_throughput.py [size_mb]
+"""
+import asyncio
+import os
+import shutil
+import sys
+import tempfile
+import time
+import uuid
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+upload_dir = tempfile.mkdtemp(prefix="bench_uploads_")
+os.environ['UPLOAD_DIR'] = upload_dir
+os.environ.setdefault('MAX_UPLOAD_REQUEST_BYTES', str(1 << 40))
+
+from starlette.datastructures import UploadFile  # noqa: E402
+
+import server  # noqa: E402
+
+CONCURRENCY = [1, 10, 50]
+
+
+def make_uploads(count, payload):
+    uploads = []
+    for i in range(count):
+        spool = tempfile.SpooledTemporaryFile(max_size=1024 * 1024)
+        spool.write(payload)
+        spool.seek(0)
+        uploads.append(UploadFile(file=spool, filename=f"clip-{i}.mp4"))
+    return uploads
+
+
+async def legacy_save(uploads, folder):
+    urls = []
+    for upload in uploads:
+        filename = f"{uuid.uuid4().hex}{Path(upload.filename).suffix}"
+        path = Path(upload_dir) / folder / filename
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with path.open("wb") as buffer:
+            shutil.copyfileobj(upload.file, buffer)
+        urls.append(f"/uploads/{folder}/{filename}")
+    return urls
+
+
+async def ticker(lags, stop):
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(0.005)
+        lags.append((time.perf_counter() - started - 0.005) * 1000)
+
+
+async def measure(save, count, payload):
+    uploads = make_uploads(count, payload)
+    lags, stop = [], asyncio.Event()
+    ticking = asyncio.create_task(ticker(lags, stop))
+    await asyncio.sleep(0)
+    started = time.perf_counter()
+    await save(uploads, "bench")
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await ticking
+    for upload in uploads:
+        upload.file.close()
+    return count * len(payload) / elapsed / (1024 * 1024), max(lags, default=0.0)
+
+
+async def main(size_mb):
+    payload = os.urandom(size_mb * 1024 * 1024)
+    print(f"{size_mb} MB per file")
+    print(f"{'files':>6} {'legacy MB/s':>12} {'legacy lag':>11} {'chunked MB/s':>13} {'chunked lag':>12}")
+    try:
+        for count in CONCURRENCY:
+            legacy_rate, legacy_lag = await measure(legacy_save, count, payload)
+            chunked_rate, chunked_lag = await measure(server.save_upload_files, count, payload)
+            print(f"{count:>6} {legacy_rate:>12.1f} {legacy_lag:>9.1f}ms {chunked_rate:>13.1f} {chunked_lag:>10.1f}ms")
+    finally:
+        shutil.rmtree(upload_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 8))
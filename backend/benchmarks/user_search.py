@@ -0,0 +1,96 @@
+"""User search latency over a seeded collection (1M users by default).
+
+Seeds synthetic users with search fields, then times typeahead queries of
+1-6 characters through ``search_user_index`` and, for a small sample, the
+old unanchored case-insensitive $regex over name and email.
+
+    cd backend && python benchmarks/user_search.py [users] [queries]
+"""
+import asyncio
+import os
+import random
+import statistics
+import sys
+import time
+import uuid
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ['DB_NAME'] = f"bench_search_{uuid.uuid4().hex[:8]}"
+
+import server  # noqa: E402
+
+db = server.db
+SYLLABLES = ["an", "be", "ca", "da", "el", "fi", "go", "ha", "is", "jo", "ka", "li", "ma", "no", "or",
+             "pe", "qu", "ra", "si", "ta", "ul", "vi", "wa", "xe", "yo", "zu", "é", "ñ"]
+BATCH_SIZE = 10000
+REGEX_SAMPLE = 10
+
+
+def make_name(rng):
+    word = lambda: ''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))).capitalize()
+    return f"{word()} {word()}"
+
+
+async def seed(count, rng):
+    names = []
+    for start in range(0, count, BATCH_SIZE):
+        batch = []
+        for i in range(start, min(start + BATCH_SIZE, count)):
+            name = make_name(rng)
+            email = f"user{i}@example.com"
+            names.append(name)
+            batch.append({
+                "id": str(uuid.uuid4()),
+                "name": name,
+                "email": email,
+                "follower_count": int(rng.paretovariate(1.2)),
+                **server.search_fields(name, email)
+            })
+        await db.users.insert_many(batch, ordered=False)
+    return names
+
+
+def percentile(values, p):
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+async def timed(queries, run):
+    timings = []
+    for q in queries:
+        started = time.perf_counter()
+        await run(q)
+        timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+    return statistics.median(timings), percentile(timings, 0.99)
+
+
+async def legacy_search(q):
+    return await db.users.find(
+        {"$or": [{"name": {"$regex": q, "$options": "i"}}, {"email": {"$regex": q, "$options": "i"}}]},
+        {"_id": 0, "password_hash": 0}
+    ).limit(20).to_list(20)
+
+
+async def main(count, query_count):
+    rng = random.Random(7)
+    await server.ensure_indexes()
+    try:
+        started = time.perf_counter()
+        names = await seed(count, rng)
+        print(f"seeded {count} users in {time.perf_counter() - started:.1f}s")
+        queries = []
+        for _ in range(query_count):
+            name = rng.choice(names)
+            queries.append(name[:rng.randint(1, 6)])
+        p50, p99 = await timed(queries, lambda q: server.search_user_index(q, None))
+        print(f"{'prefix index':>14}: p50 {p50:.2f}ms  p99 {p99:.2f}ms over {len(queries)} queries")
+        p50, p99 = await timed(queries[:REGEX_SAMPLE], legacy_search)
+        print(f"{'legacy $regex':>14}: p50 {p50:.2f}ms  p99 {p99:.2f}ms over {REGEX_SAMPLE} queries")
+    finally:
+        await server.client.drop_database(os.environ['DB_NAME'])
+
+
+if __name__ == '__main__':
+    args = [int(a) for a in sys.argv[1:]]
+    asyncio.run(main(args[0] if args else 1_000_000, args[1] if len(args) > 1 else 1000))
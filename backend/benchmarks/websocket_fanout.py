@@ -0,0 +1,75 @@
+"""Broadcast latency percentiles across 10k simulated websocket clients.
+
+Clients are in-process stand-ins for starlette WebSockets; a fraction of
+them are slow consumers that take 200ms per frame. Latency is measured
+from the moment broadcast() is called until each client's send completes.
+
+    cd backend && python benchmarks/websocket_fanout.py [clients] [slow_fraction]
+"""
+import asyncio
+import json
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import server  # noqa: E402
+
+BROADCASTS = 20
+
+
+class SimulatedWebSocket:
+    def __init__(self, latencies, slow):
+        self.latencies = latencies
+        self.slow = slow
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, data):
+        message = json.loads(data)
+        await asyncio.sleep(0.2 if self.slow else 0)
+        if message.get('type') == 'bench':
+            self.latencies.append((time.perf_counter() - message['sent_at']) * 1000)
+
+    async def close(self, code=1000):
+        pass
+
+
+def percentile(values, p):
+    return values[min(len(values) - 1, int(len(values) * p))] if values else 0.0
+
+
+async def main(clients, slow_fraction):
+    hub = server.ConnectionManager()
+    fast, slow = [], []
+    slow_sockets = 0
+    for i in range(clients):
+        is_slow = random.random() < slow_fraction
+        slow_sockets += is_slow
+        # Several tabs per user: ten sockets share each user id
+        await hub.connect(f"user-{i // 10}", SimulatedWebSocket(slow if is_slow else fast, is_slow))
+
+    fanout_ms = []
+    for _ in range(BROADCASTS):
+        started = time.perf_counter()
+        await hub.broadcast({'type': 'bench', 'sent_at': started})
+        fanout_ms.append((time.perf_counter() - started) * 1000)
+        await asyncio.sleep(0.05)
+    await asyncio.sleep(1)
+
+    fast.sort()
+    fanout_ms.sort()
+    print(f"{clients} sockets, {slow_sockets} slow, {BROADCASTS} broadcasts")
+    print(f"broadcast() call   p50 {percentile(fanout_ms, .5):.2f}ms  p99 {percentile(fanout_ms, .99):.2f}ms")
+    print(f"fast client recv   p50 {percentile(fast, .5):.2f}ms  p95 {percentile(fast, .95):.2f}ms  "
+          f"p99 {percentile(fast, .99):.2f}ms  max {fast[-1] if fast else 0:.2f}ms")
+    print(f"hub stats          {hub.stats()}")
+
+
+if __name__ == '__main__':
+    clients = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    slow_fraction = float(sys.argv[2]) if len(sys.argv) > 2 else 0.01
+    asyncio.run(main(clients, slow_fraction))
@@ -0,0 +1,42 @@
+"""Fill last_message/last_activity_at on conversations created before the
+inbox fields were maintained by send_message.
+
+Conversations without last_activity_at are invisible to the activity-sorted
+inbox query, so run this once after deploy:
+
+    cd backend && python scripts/backfill_conversation_activity.py
+"""
+import asyncio
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import server  # noqa: E402
+
+db = server.db
+
+
+async def main():
+    updated = 0
+    async for conversation in db.conversations.find(
+        {"last_activity_at": {"$exists": False}},
+        {"_id": 0, "id": 1, "created_at": 1}
+    ):
+        last_message = await db.messages.find_one(
+            {"conversation_id": conversation['id']},
+            {"_id": 0, "id": 1, "sender_id": 1, "content": 1, "created_at": 1},
+            sort=[("created_at", -1), ("id", -1)]
+        )
+        update = {"last_activity_at": conversation['created_at']}
+        if last_message:
+            last_message['content'] = last_message['content'][:server.CONVERSATION_PREVIEW_LENGTH]
+            update = {"last_message": last_message, "last_activity_at": last_message['created_at']}
+        await db.conversations.update_one({"id": conversation['id']}, {"$set": update})
+        updated += 1
+    print(f"Backfilled {updated} conversations")
+    server.client.close()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
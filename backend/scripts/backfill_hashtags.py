@@ -0,0 +1,42 @@
+"""Re-extract posts.hashtags with the normalized hashtag rules.
+
+Posts written before hashtag normalization store raw tags (e.g. "Python!")
+that never match a normalized lookup. Safe to re-run; only posts whose tags
+change are written:
+
+    cd backend && python scripts/backfill_hashtags.py
+"""
+import asyncio
+import sys
+from pathlib import Path
+
+from pymongo import UpdateOne
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import server  # noqa: E402
+
+BATCH_SIZE = 1000
+
+
+async def main():
+    updated = 0
+    operations = []
+    async for post in server.db.posts.find({}, {"_id": 0, "id": 1, "content": 1, "hashtags": 1}):
+        hashtags = server.extract_hashtags(post.get('content'))
+        if hashtags == post.get('hashtags'):
+            continue
+        operations.append(UpdateOne({"id": post['id']}, {"$set": {"hashtags": hashtags}}))
+        if len(operations) >= BATCH_SIZE:
+            await server.db.posts.bulk_write(operations, ordered=False)
+            updated += len(operations)
+            operations = []
+    if operations:
+        await server.db.posts.bulk_write(operations, ordered=False)
+        updated += len(operations)
+    print(f"Re-normalized hashtags on {updated} posts")
+    server.client.close()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
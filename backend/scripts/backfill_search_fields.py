@@ -0,0 +1,45 @@
+"""Populate search_name/search_tokens/search_prefixes on existing users.
+
+Users created before the search index have no prefixes and so never appear
+in /api/search/users. Safe to re-run; only users missing the fields are
+touched:
+
+    cd backend && python scripts/backfill_search_fields.py
+"""
+import asyncio
+import sys
+from pathlib import Path
+
+from pymongo import UpdateOne
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import server  # noqa: E402
+
+BATCH_SIZE = 1000
+
+
+async def main():
+    updated = 0
+    operations = []
+    async for user in server.db.users.find(
+        {"search_prefixes": {"$exists": False}},
+        {"_id": 0, "id": 1, "name": 1, "email": 1}
+    ):
+        operations.append(UpdateOne(
+            {"id": user['id']},
+            {"$set": server.search_fields(user.get('name', ''), user.get('email'))}
+        ))
+        if len(operations) >= BATCH_SIZE:
+            await server.db.users.bulk_write(operations, ordered=False)
+            updated += len(operations)
+            operations = []
+    if operations:
+        await server.db.users.bulk_write(operations, ordered=False)
+        updated += len(operations)
+    print(f"Indexed {updated} users for search")
+    server.client.close()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
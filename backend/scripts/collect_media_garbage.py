@@ -0,0 +1,25 @@
+"""Recount media references and delete files nothing points at any more.
+
+Safe to run while the app is live; media acquired within
+MEDIA_GC_GRACE_SECONDS is never touched.
+
+    cd backend && python scripts/collect_media_garbage.py [--no-recount]
+"""
+import asyncio
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import server  # noqa: E402
+
+
+async def main(recount):
+    result = await server.collect_media_garbage(recount=recount)
+    print(f"Recounted {result['recounted']} media, removed {result['removed']} orphans "
+          f"and {result['stale_partials']} stale partial uploads")
+    server.client.close()
+
+
+if __name__ == '__main__':
+    asyncio.run(main('--no-recount' not in sys.argv[1:]))
@@ -0,0 +1,106 @@
+"""Convert ISO-string timestamps to native BSON dates, online.
+
+Older documents store created_at (and expires_at, event_date, ...) as
+isoformat strings. This walks each collection in _id order, converting a
+batch at a time; every update re-checks that the field is still a string, so
+it is safe to run against the live app and to re-run after an interruption.
+Until it has finished, keyset pages and date range queries skip unconverted
+documents (strings and dates never compare equal in MongoDB).
+
+    cd backend && python scripts/migrate_datetimes.py [--batch N] [--pause S] [collection ...]
+"""
+import argparse
+import asyncio
+import sys
+from pathlib import Path
+
+from pymongo import UpdateOne
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import server  # noqa: E402
+
+db = server.db
+
+DATETIME_FIELDS = {
+    "users": ["created_at"],
+    "user_sessions": ["created_at", "expires_at"],
+    "posts": ["created_at"],
+    "reactions": ["created_at"],
+    "comments": ["created_at"],
+    "connections": ["created_at"],
+    "timelines": ["created_at"],
+    "media": ["created_at", "last_acquired_at"],
+    "conversations": ["created_at", "last_activity_at", "last_message.created_at"],
+    "messages": ["created_at"],
+    "stories": ["created_at", "expires_at"],
+    "notifications": ["created_at"],
+    "groups": ["created_at"],
+    "group_members": ["joined_at"],
+    "marketplace_items": ["created_at"],
+    "events": ["created_at", "event_date"],
+    "job_posts": ["created_at"],
+    "job_profiles": ["created_at"],
+}
+
+
+def get_path(doc, path):
+    for part in path.split('.'):
+        if not isinstance(doc, dict):
+            return None
+        doc = doc.get(part)
+    return doc
+
+
+async def migrate_collection(name, fields, batch_size, pause):
+    collection = db[name]
+    string_filter = {"$or": [{field: {"$type": "string"}} for field in fields]}
+    projection = {field: 1 for field in fields}
+    converted = skipped = 0
+    last_id = None
+    while True:
+        query = string_filter if last_id is None else {"$and": [string_filter, {"_id": {"$gt": last_id}}]}
+        batch = await collection.find(query, projection).sort("_id", 1).limit(batch_size).to_list(batch_size)
+        if not batch:
+            break
+        last_id = batch[-1]['_id']
+        operations = []
+        for doc in batch:
+            for field in fields:
+                value = get_path(doc, field)
+                if not isinstance(value, str):
+                    continue
+                try:
+                    parsed = server.as_utc(value)
+                except ValueError:
+                    skipped += 1
+                    continue
+                # Only convert if nobody rewrote the field in the meantime
+                operations.append(UpdateOne({"_id": doc['_id'], field: value}, {"$set": {field: parsed}}))
+        if operations:
+            result = await collection.bulk_write(operations, ordered=False)
+            converted += result.modified_count
+        if pause:
+            await asyncio.sleep(pause)
+    return converted, skipped
+
+
+async def main(collections, batch_size, pause):
+    try:
+        for name in collections or DATETIME_FIELDS:
+            converted, skipped = await migrate_collection(name, DATETIME_FIELDS[name], batch_size, pause)
+            print(f"{name:<20} converted {converted:>9}  unparseable {skipped:>6}")
+    finally:
+        server.client.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("collections", nargs="*")
+    parser.add_argument("--batch", type=int, default=1000)
+    parser.add_argument("--pause", type=float, default=0.0, help="seconds to sleep between batches")
+    args = parser.parse_args()
+    unknown = set(args.collections) - set(DATETIME_FIELDS)
+    if unknown:
+        parser.error(f"unknown collections: {', '.join(sorted(unknown))}")
+    asyncio.run(main(args.collections, args.batch, args.pause))
@@ -0,0 +1,33 @@
+"""Rebuild the per-post reaction_counts/comment_count fields and the per-user
+unread notification counters and follower counts.
+
+Run once after deploying the materialized counters, and afterwards whenever
+counters are suspected to have drifted. Post and follower counts that change
+while a batch is being counted are left alone (run again to pick them up),
+but unread counts are overwritten, so run it while notification traffic is
+quiet:
+
+    cd backend && python scripts/reconcile_counters.py [post_id ...]
+"""
+import asyncio
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import server  # noqa: E402
+
+
+async def main(post_ids):
+    reconciled = await server.reconcile_post_counters(post_ids or None)
+    print(f"Corrected counters on {reconciled} posts")
+    if not post_ids:
+        reconciled = await server.reconcile_notification_counters()
+        print(f"Reconciled unread counts for {reconciled} users")
+        reconciled = await server.reconcile_follower_counts()
+        print(f"Corrected follower counts for {reconciled} users")
+    server.client.close()
+
+
+if __name__ == '__main__':
+    asyncio.run(main(sys.argv[1:]))
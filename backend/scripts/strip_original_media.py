@@ -0,0 +1,77 @@
+"""Replace stored image originals with their EXIF-stripped "full" render.
+
+Images uploaded before store_media switched to the stripped render still
+keep the original file (camera and GPS metadata included) at their public
+URL. For each such media document this points every reference at the
+"full" variant, makes it the canonical object and deletes the original.
+Images whose render failed (stored with no variants) are rendered first.
+Safe to re-run; run it once after deploy:
+
+    cd backend && python scripts/strip_original_media.py
+"""
+import asyncio
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import server  # noqa: E402
+
+db = server.db
+
+
+async def repoint(original, full):
+    for collection_name, field in server.MEDIA_REFERENCES:
+        collection = db[collection_name]
+        # Array fields are rewritten element-wise, scalar fields directly
+        await collection.update_many(
+            {field: original, f"{field}.0": {"$exists": True}},
+            {"$set": {f"{field}.$[url]": full}},
+            array_filters=[{"url": original}]
+        )
+        await collection.update_many({field: original}, {"$set": {field: full}})
+
+
+async def rerender():
+    rendered = 0
+    async for media in db.media.find(
+        {"variants": {}, "content_type": {"$regex": "^image/", "$ne": "image/gif"}},
+        {"_id": 0, "sha256": 1, "path": 1}
+    ):
+        try:
+            variants = await server.create_image_variants(media['path'])
+        except Exception as e:
+            print(f"Could not render {media['path']}: {e}")
+            continue
+        await db.media.update_one({"sha256": media['sha256'], "variants": {}}, {"$set": {"variants": variants}})
+        rendered += 1
+    return rendered
+
+
+async def main():
+    print(f"Rendered {await rerender()} images that had no variants")
+    stripped = 0
+    async for media in db.media.find(
+        {"variants.full": {"$exists": True}, "$expr": {"$ne": ["$url", "$variants.full"]}},
+        {"_id": 0, "sha256": 1, "url": 1, "path": 1, "variants": 1}
+    ):
+        full = media['variants']['full']
+        await repoint(media['url'], full)
+        await db.media.update_one(
+            {"sha256": media['sha256']},
+            {"$set": {
+                "url": full,
+                "path": full.removeprefix("/uploads/"),
+                "content_type": f"image/{Path(full).suffix.lstrip('.').replace('jpg', 'jpeg')}"
+            }}
+        )
+        await asyncio.to_thread((server.UPLOAD_ROOT / media['path']).unlink, True)
+        stripped += 1
+    print(f"Replaced {stripped} originals with their stripped renders")
+    if server._image_pool is not None:
+        server._image_pool.shutdown()
+    server.client.close()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -1,70 +1,551 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, File, UploadFile, Form, Query, WebSocket, WebSocketDisconnect
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, BackgroundTasks, File, UploadFile, Form, Query, WebSocket, WebSocketDisconnect
 from fastapi.responses import FileResponse, JSONResponse
-from fastapi.staticfiles import StaticFiles
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ASCENDING, DESCENDING, IndexModel, InsertOne, ReturnDocument, UpdateOne
+from pymongo.errors import OperationFailure
 from pydantic import BaseModel, Field, ConfigDict, EmailStr
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Callable, Awaitable
+from collections import OrderedDict, Counter
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from datetime import datetime, timezone, timedelta
 from dotenv import load_dotenv
 from pathlib import Path
 import os
 import uuid
+import asyncio
+import base64
+import json
 import logging
+import time
 import bcrypt
 import jwt
-import requests
+import httpx
+import random
 import socketio
-import shutil
-from PIL import Image
+import hashlib
+import mimetypes
+import stat as stat_module
+import re
+import unicodedata
+import heapq
+import orjson
+from PIL import Image, ImageOps, features
 import io
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
 # MongoDB connection
+# tz_aware: stored dates come back as UTC-aware datetimes
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
+client = AsyncIOMotorClient(mongo_url, tz_aware=True)
 db = client[os.environ['DB_NAME']]
 
+# Persistence
+# Documents keep datetimes as native BSON dates; they become ISO strings only
+# at the JSON boundary (FastAPI responses and websocket frames).
+def to_document(model: BaseModel) -> dict:
+    doc = model.model_dump()
+    for key, value in doc.items():
+        # Naive values (e.g. parsed from a form) are taken to be UTC
+        if isinstance(value, datetime) and value.tzinfo is None:
+            doc[key] = value.replace(tzinfo=timezone.utc)
+    return doc
+
+def json_default(value: Any):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
 # JWT Secret
 JWT_SECRET = os.environ.get('JWT_SECRET', 'your-secret-key-change-in-production')
 
+# Authenticated-user cache
+AUTH_CACHE_SIZE = int(os.environ.get('AUTH_CACHE_SIZE', '10000'))
+AUTH_CACHE_TTL_SECONDS = float(os.environ.get('AUTH_CACHE_TTL_SECONDS', '60'))
+
+# Conversation participant lists, checked on every message send/read
+CONVERSATION_CACHE_SIZE = int(os.environ.get('CONVERSATION_CACHE_SIZE', '50000'))
+CONVERSATION_CACHE_TTL_SECONDS = float(os.environ.get('CONVERSATION_CACHE_TTL_SECONDS', '300'))
+
+# Per-viewer story rings
+STORY_RING_CACHE_SIZE = int(os.environ.get('STORY_RING_CACHE_SIZE', '20000'))
+STORY_RING_CACHE_TTL_SECONDS = float(os.environ.get('STORY_RING_CACHE_TTL_SECONDS', '60'))
+
+# Author summaries (id, name, thumbnail) embedded in listings
+USER_SUMMARY_CACHE_SIZE = int(os.environ.get('USER_SUMMARY_CACHE_SIZE', '100000'))
+USER_SUMMARY_CACHE_TTL_SECONDS = float(os.environ.get('USER_SUMMARY_CACHE_TTL_SECONDS', '120'))
+
+# Pre-serialized JSON for embedded user objects
+USER_FRAGMENT_CACHE_SIZE = int(os.environ.get('USER_FRAGMENT_CACHE_SIZE', '50000'))
+USER_FRAGMENT_CACHE_TTL_SECONDS = float(os.environ.get('USER_FRAGMENT_CACHE_TTL_SECONDS', '30'))
+
+# Password hashing runs on a dedicated pool; requests beyond the queue limit
+# are rejected instead of piling up behind a login burst.
+BCRYPT_ROUNDS = int(os.environ.get('BCRYPT_ROUNDS', '12'))
+PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', str(min(4, os.cpu_count() or 1))))
+PASSWORD_HASH_QUEUE_LIMIT = int(os.environ.get('PASSWORD_HASH_QUEUE_LIMIT', '64'))
+
+# Uploads are streamed to disk in fixed-size chunks with per-file and
+# per-request byte limits
+UPLOAD_ROOT = Path(os.environ.get('UPLOAD_DIR', '/app/backend/uploads'))
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+MAX_UPLOAD_FILE_BYTES = int(os.environ.get('MAX_UPLOAD_FILE_BYTES', str(100 * 1024 * 1024)))
+MAX_UPLOAD_REQUEST_BYTES = int(os.environ.get('MAX_UPLOAD_REQUEST_BYTES', str(250 * 1024 * 1024)))
+# Unreferenced media younger than this is left alone by the garbage collector
+MEDIA_GC_GRACE_SECONDS = int(os.environ.get('MEDIA_GC_GRACE_SECONDS', '3600'))
+
+# Image derivatives rendered for every uploaded image. "thumb" is a square
+# crop for avatars, "full" keeps the original size; all are EXIF-stripped.
+IMAGE_VARIANT_WIDTHS: Dict[str, Optional[int]] = {"thumb": 150, "small": 320, "medium": 720, "large": 1280, "full": None}
+IMAGE_VARIANT_FORMAT = "WEBP" if features.check("webp") else "JPEG"
+IMAGE_WORKERS = int(os.environ.get('IMAGE_WORKERS', str(min(4, os.cpu_count() or 1))))
+# Larger images are refused before decoding; PIL alone only warns below twice its limit
+IMAGE_MAX_PIXELS = int(os.environ.get('IMAGE_MAX_PIXELS', str(50_000_000)))
+Image.MAX_IMAGE_PIXELS = IMAGE_MAX_PIXELS
+
+# Upstream OAuth session service
+OAUTH_SESSION_URL = os.environ.get('OAUTH_SESSION_URL', 'https://demobackend.emergentagent.com/auth/v1/env/oauth/session-data')
+UPSTREAM_TIMEOUT_SECONDS = float(os.environ.get('UPSTREAM_TIMEOUT_SECONDS', '5'))
+UPSTREAM_RETRIES = int(os.environ.get('UPSTREAM_RETRIES', '2'))
+
+# Home timelines: authors with at least this many followers are merged into
+# feeds at read time instead of being fanned out on write.
+TIMELINE_CELEBRITY_THRESHOLD = int(os.environ.get('TIMELINE_CELEBRITY_THRESHOLD', '10000'))
+TIMELINE_MAX_ENTRIES = int(os.environ.get('TIMELINE_MAX_ENTRIES', '800'))
+TIMELINE_BACKFILL_POSTS = int(os.environ.get('TIMELINE_BACKFILL_POSTS', '50'))
+# Each fan-out write trims the receiving timeline with probability
+# 1/TIMELINE_TRIM_INTERVAL, so timelines overshoot the cap by only a few
+# intervals' worth of entries
+TIMELINE_TRIM_INTERVAL = int(os.environ.get('TIMELINE_TRIM_INTERVAL', '20'))
+
+# Notifications are queued by write endpoints and persisted in batches by
+# background workers; bursts for the same (user, type, link) are coalesced.
+NOTIFICATION_WORKERS = int(os.environ.get('NOTIFICATION_WORKERS', '2'))
+NOTIFICATION_QUEUE_SIZE = int(os.environ.get('NOTIFICATION_QUEUE_SIZE', '10000'))
+NOTIFICATION_BATCH_SIZE = int(os.environ.get('NOTIFICATION_BATCH_SIZE', '500'))
+NOTIFICATION_BATCH_WINDOW_SECONDS = float(os.environ.get('NOTIFICATION_BATCH_WINDOW_SECONDS', '0.05'))
+
 # Create FastAPI app
 app = FastAPI(title="Social X API")
 api_router = APIRouter(prefix="/api")
 
 # WebSocket manager for real-time features
-class ConnectionManager:
-    def __init__(self):
-        self.active_connections: Dict[str, WebSocket] = {}
+# A user may hold many sockets (tabs, devices). Each socket has its own
+# bounded send queue drained by a writer task, so fan-out never waits on a
+# slow client; a client whose queue fills up is disconnected.
+WS_SHARDS = int(os.environ.get('WS_SHARDS', '16'))
+WS_SEND_QUEUE_SIZE = int(os.environ.get('WS_SEND_QUEUE_SIZE', '256'))
+WS_SEND_TIMEOUT_SECONDS = float(os.environ.get('WS_SEND_TIMEOUT_SECONDS', '10'))
+WS_HEARTBEAT_SECONDS = float(os.environ.get('WS_HEARTBEAT_SECONDS', '25'))
+WS_IDLE_TIMEOUT_SECONDS = float(os.environ.get('WS_IDLE_TIMEOUT_SECONDS', '75'))
+# "memory" for a single process, "mongo" to route pushes between workers
+REALTIME_BUS = os.environ.get('REALTIME_BUS', 'memory')
+WORKER_ID = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+
+class ClientConnection:
+    def __init__(self, user_id: str, websocket: WebSocket, queue_size: int):
+        self.user_id = user_id
+        self.websocket = websocket
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.last_seen = time.monotonic()
+        self.closed = False
+        self.writer: Optional[asyncio.Task] = None
+
+    def enqueue(self, message: dict) -> bool:
+        if self.closed:
+            return False
+        try:
+            self.queue.put_nowait(message)
+            return True
+        except asyncio.QueueFull:
+            return False
+
+    async def run_writer(self, on_failure: Callable[["ClientConnection"], None]):
+        try:
+            while True:
+                message = await self.queue.get()
+                async with asyncio.timeout(WS_SEND_TIMEOUT_SECONDS):
+                    await self.websocket.send_text(json.dumps(message, default=json_default))
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            on_failure(self)
+
+    async def close(self, code: int = 1000):
+        if self.closed:
+            return
+        self.closed = True
+        if self.writer and self.writer is not asyncio.current_task():
+            self.writer.cancel()
+        try:
+            await self.websocket.close(code=code)
+        except Exception:
+            pass
 
-    async def connect(self, user_id: str, websocket: WebSocket):
-        await websocket.accept()
-        self.active_connections[user_id] = websocket
+class ConnectionManager:
+    def __init__(self, bus: Optional["RealtimeBus"] = None, shards: int = WS_SHARDS, queue_size: int = WS_SEND_QUEUE_SIZE):
+        self.bus = bus or InMemoryBus()
+        self.shards: List[Dict[str, set]] = [{} for _ in range(shards)]
+        self.queue_size = queue_size
+        self.dropped = 0
+        self.delivered = 0
 
-    def disconnect(self, user_id: str):
-        if user_id in self.active_connections:
-            del self.active_connections[user_id]
+    def _shard(self, user_id: str) -> Dict[str, set]:
+        return self.shards[hash(user_id) % len(self.shards)]
 
+    async def connect(self, user_id: str, websocket: WebSocket) -> ClientConnection:
+        await websocket.accept()
+        connection = ClientConnection(user_id, websocket, self.queue_size)
+        connection.writer = asyncio.create_task(connection.run_writer(self._drop))
+        connections = self._shard(user_id).setdefault(user_id, set())
+        connections.add(connection)
+        if len(connections) == 1:
+            await self.bus.user_online(user_id)
+        return connection
+
+    def disconnect(self, connection: ClientConnection):
+        shard = self._shard(connection.user_id)
+        connections = shard.get(connection.user_id)
+        if connections is not None and connection in connections:
+            connections.discard(connection)
+            if not connections:
+                del shard[connection.user_id]
+                asyncio.create_task(self._user_offline(connection.user_id))
+        if connection.writer:
+            connection.writer.cancel()
+
+    # Runs after disconnect returns, so a quick reconnect (a page reload) can
+    # register before or during the presence delete; re-announce if it did
+    async def _user_offline(self, user_id: str):
+        if self.is_online(user_id):
+            return
+        await self.bus.user_offline(user_id)
+        if self.is_online(user_id):
+            await self.bus.user_online(user_id)
+
+    def _drop(self, connection: ClientConnection):
+        self.dropped += 1
+        self.disconnect(connection)
+        # 1013: try again later
+        asyncio.create_task(connection.close(code=1013))
+
+    def _deliver(self, connection: ClientConnection, message: dict):
+        if connection.enqueue(message):
+            self.delivered += 1
+        else:
+            self._drop(connection)
+
+    def is_online(self, user_id: str) -> bool:
+        return bool(self._shard(user_id).get(user_id))
+
+    # Sockets held by this process
+    async def deliver_local(self, user_ids: Optional[List[str]], message: dict):
+        if user_ids is None:
+            for shard in self.shards:
+                for connections in list(shard.values()):
+                    for connection in list(connections):
+                        self._deliver(connection, message)
+                # Yield between shards so a large broadcast doesn't hog the loop
+                await asyncio.sleep(0)
+            return
+        for user_id in user_ids:
+            for connection in list(self._shard(user_id).get(user_id, ())):
+                self._deliver(connection, message)
+
+    # Sockets anywhere: local ones directly, the rest through the bus
     async def send_message(self, user_id: str, message: dict):
-        if user_id in self.active_connections:
-            try:
-                await self.active_connections[user_id].send_json(message)
-            except:
-                self.disconnect(user_id)
+        await self.send_many([user_id], message)
+
+    async def send_many(self, user_ids: List[str], message: dict):
+        user_ids = list(user_ids)
+        await self.deliver_local(user_ids, message)
+        await self.bus.publish(user_ids, message)
 
     async def broadcast(self, message: dict):
-        disconnected = []
-        for user_id, connection in self.active_connections.items():
+        await self.deliver_local(None, message)
+        await self.bus.publish(None, message)
+
+    async def heartbeat(self, connection: ClientConnection):
+        while not connection.closed:
+            await asyncio.sleep(WS_HEARTBEAT_SECONDS)
+            if time.monotonic() - connection.last_seen > WS_IDLE_TIMEOUT_SECONDS:
+                self.disconnect(connection)
+                await connection.close(code=1001)
+                return
+            self._deliver(connection, {'type': 'ping', 'ts': time.time()})
+
+    def stats(self) -> Dict[str, int]:
+        users = sum(len(shard) for shard in self.shards)
+        sockets = sum(len(connections) for shard in self.shards for connections in shard.values())
+        return {"users": users, "sockets": sockets, "delivered": self.delivered, "dropped": self.dropped}
+
+# Real-time delivery bus
+# Carries pushes between worker processes. Each bus delivers to the other
+# workers only; the publishing worker has already delivered locally.
+DeliverFn = Callable[[Optional[List[str]], dict], Awaitable[None]]
+
+class RealtimeBus:
+    async def start(self, deliver: DeliverFn):
+        self.deliver = deliver
+
+    async def stop(self):
+        pass
+
+    async def publish(self, user_ids: Optional[List[str]], message: dict):
+        pass
+
+    async def user_online(self, user_id: str):
+        pass
+
+    async def user_offline(self, user_id: str):
+        pass
+
+# Buses attached to the same broker behave like workers of one deployment.
+# With the default broker and a single process, publish is a no-op.
+class InMemoryBroker:
+    def __init__(self):
+        self.buses: List["InMemoryBus"] = []
+
+class InMemoryBus(RealtimeBus):
+    default_broker = InMemoryBroker()
+
+    def __init__(self, broker: Optional[InMemoryBroker] = None):
+        self.broker = broker or self.default_broker
+
+    async def start(self, deliver: DeliverFn):
+        await super().start(deliver)
+        self.broker.buses.append(self)
+
+    async def stop(self):
+        if self in self.broker.buses:
+            self.broker.buses.remove(self)
+
+    async def publish(self, user_ids: Optional[List[str]], message: dict):
+        for bus in list(self.broker.buses):
+            if bus is not self:
+                await bus.deliver(user_ids, message)
+
+# Routes through MongoDB: a presence collection records which worker holds
+# each online user, publishes are buffered briefly and written as one
+# document per target worker, and every worker tails a change stream
+# filtered to its own id. Requires a replica set (change streams).
+class MongoChangeStreamBus(RealtimeBus):
+    PRESENCE_TTL_SECONDS = 90
+
+    def __init__(self, database, worker_id: str = WORKER_ID, batch_window: float = 0.005, batch_size: int = 500):
+        self.events = database.realtime_events
+        self.presence = database.realtime_presence
+        self.worker_id = worker_id
+        self.batch_window = batch_window
+        self.batch_size = batch_size
+        self.online: set = set()
+        self._buffer: List[tuple] = []
+        self._wake = asyncio.Event()
+        self._tasks: List[asyncio.Task] = []
+
+    async def start(self, deliver: DeliverFn):
+        await super().start(deliver)
+        self._tasks = [
+            asyncio.create_task(self._watch()),
+            asyncio.create_task(self._flush_loop()),
+            asyncio.create_task(self._refresh_presence())
+        ]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await self._flush()
+        await self.presence.delete_many({"worker_id": self.worker_id})
+
+    async def publish(self, user_ids: Optional[List[str]], message: dict):
+        self._buffer.append((user_ids, message))
+        if len(self._buffer) >= self.batch_size:
+            await self._flush()
+        else:
+            self._wake.set()
+
+    async def user_online(self, user_id: str):
+        self.online.add(user_id)
+        await self.presence.update_one(
+            {"user_id": user_id, "worker_id": self.worker_id},
+            {"$set": {"expires_at": datetime.now(timezone.utc) + timedelta(seconds=self.PRESENCE_TTL_SECONDS)}},
+            upsert=True
+        )
+
+    async def user_offline(self, user_id: str):
+        self.online.discard(user_id)
+        await self.presence.delete_one({"user_id": user_id, "worker_id": self.worker_id})
+
+    async def _flush_loop(self):
+        while True:
+            await self._wake.wait()
+            await asyncio.sleep(self.batch_window)
+            self._wake.clear()
+            try:
+                await self._flush()
+            except Exception as e:
+                logger.error(f"Realtime bus publish failed: {e}")
+
+    async def _flush(self):
+        batch, self._buffer = self._buffer, []
+        if not batch:
+            return
+        targeted = {uid for user_ids, _ in batch if user_ids for uid in user_ids}
+        workers_by_user: Dict[str, set] = {}
+        all_workers = set()
+        query = {"worker_id": {"$ne": self.worker_id}}
+        if all(user_ids is not None for user_ids, _ in batch):
+            query["user_id"] = {"$in": list(targeted)}
+        async for row in self.presence.find(query, {"_id": 0, "user_id": 1, "worker_id": 1}):
+            workers_by_user.setdefault(row['user_id'], set()).add(row['worker_id'])
+            all_workers.add(row['worker_id'])
+
+        deliveries: Dict[str, List[dict]] = {}
+        for user_ids, message in batch:
+            if user_ids is None:
+                for worker_id in all_workers:
+                    deliveries.setdefault(worker_id, []).append({"user_ids": None, "message": message})
+                continue
+            per_worker: Dict[str, List[str]] = {}
+            for user_id in user_ids:
+                for worker_id in workers_by_user.get(user_id, ()):
+                    per_worker.setdefault(worker_id, []).append(user_id)
+            for worker_id, worker_users in per_worker.items():
+                deliveries.setdefault(worker_id, []).append({"user_ids": worker_users, "message": message})
+
+        if deliveries:
+            now = datetime.now(timezone.utc)
+            await self.events.insert_many([
+                {"worker_id": worker_id, "deliveries": items, "created_at": now}
+                for worker_id, items in deliveries.items()
+            ], ordered=False)
+
+    async def _watch(self):
+        pipeline = [{"$match": {"operationType": "insert", "fullDocument.worker_id": self.worker_id}}]
+        resume_token = None
+        while True:
             try:
-                await connection.send_json(message)
-            except:
-                disconnected.append(user_id)
-        for user_id in disconnected:
-            self.disconnect(user_id)
+                async with self.events.watch(pipeline, resume_after=resume_token) as stream:
+                    async for change in stream:
+                        resume_token = stream.resume_token
+                        for item in change['fullDocument']['deliveries']:
+                            await self.deliver(item['user_ids'], item['message'])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Realtime bus change stream failed, retrying: {e}")
+                await asyncio.sleep(1)
+
+    async def _refresh_presence(self):
+        while True:
+            await asyncio.sleep(self.PRESENCE_TTL_SECONDS / 3)
+            if self.online:
+                await self.presence.update_many(
+                    {"worker_id": self.worker_id},
+                    {"$set": {"expires_at": datetime.now(timezone.utc) + timedelta(seconds=self.PRESENCE_TTL_SECONDS)}}
+                )
+
+def create_realtime_bus() -> RealtimeBus:
+    if REALTIME_BUS == "mongo":
+        return MongoChangeStreamBus(db)
+    return InMemoryBus()
+
+manager = ConnectionManager(create_realtime_bus())
+
+# Bounded LRU cache with per-entry expiry, shared by the in-process caches
+class LRUCache:
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: "OrderedDict[Any, tuple]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        expires, value = entry
+        if expires <= time.monotonic():
+            del self._entries[key]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key, value, ttl: Optional[float] = None):
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        if ttl <= 0:
+            return
+        self._entries[key] = (time.monotonic() + ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def pop(self, key):
+        entry = self._entries.pop(key, None)
+        return entry[1] if entry else None
+
+    def discard_where(self, predicate: Callable[[Any, Any], bool]) -> int:
+        keys = [key for key, (_, value) in self._entries.items() if predicate(key, value)]
+        for key in keys:
+            del self._entries[key]
+        return len(keys)
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions
+        }
 
-manager = ConnectionManager()
+auth_cache = LRUCache(AUTH_CACHE_SIZE, AUTH_CACHE_TTL_SECONDS)
+conversation_cache = LRUCache(CONVERSATION_CACHE_SIZE, CONVERSATION_CACHE_TTL_SECONDS)
+story_ring_cache = LRUCache(STORY_RING_CACHE_SIZE, STORY_RING_CACHE_TTL_SECONDS)
+user_summary_cache = LRUCache(USER_SUMMARY_CACHE_SIZE, USER_SUMMARY_CACHE_TTL_SECONDS)
+user_fragment_cache = LRUCache(USER_FRAGMENT_CACHE_SIZE, USER_FRAGMENT_CACHE_TTL_SECONDS)
+
+# JSON responses
+# Listing endpoints return FastJSONResponse directly, skipping
+# jsonable_encoder; orjson handles datetimes itself. Embedded users are
+# serialized once and spliced into later responses as orjson.Fragment, so
+# payloads holding fragments must go through FastJSONResponse.
+def orjson_default(value: Any):
+    if isinstance(value, BaseModel):
+        return value.model_dump()
+    if isinstance(value, set):
+        return list(value)
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+class FastJSONResponse(JSONResponse):
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content, default=orjson_default)
+
+def user_fragment(user: Optional[dict]):
+    if user is None:
+        return None
+    fragment = user_fragment_cache.get(user['id'])
+    if fragment is None:
+        fragment = orjson.Fragment(orjson.dumps(user, default=orjson_default))
+        user_fragment_cache.set(user['id'], fragment)
+    return fragment
+
+def embed_user_fragments(docs: List[dict], field: str = 'user') -> List[dict]:
+    for doc in docs:
+        doc[field] = user_fragment(doc.get(field))
+    return docs
 
 # Models
 class User(BaseModel):
@@ -80,8 +561,16 @@ class User(BaseModel):
     city: Optional[str] = None
     phone: Optional[str] = None
     password_hash: Optional[str] = None
+    picture_variants: Dict[str, str] = {}
+    cover_photo_variants: Dict[str, str] = {}
+    follower_count: int = 0  # maintained by follow_user/unfollow_user
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
+# Identity carried in a JWT; enough for handlers that only need who is calling
+class AuthIdentity(BaseModel):
+    id: str
+    name: str
+
 class UserSession(BaseModel):
     model_config = ConfigDict(extra="ignore")
     user_id: str
@@ -95,17 +584,23 @@ class Post(BaseModel):
     user_id: str
     content: str
     media_urls: List[str] = []
+    media_variants: List[Dict[str, str]] = []  # sized derivatives, aligned with media_urls
     post_type: str = "regular"  # regular, reel
     hashtags: List[str] = []
     mentions: List[str] = []
+    reaction_counts: Dict[str, int] = {}  # maintained by add_reaction/remove_reaction
+    comment_count: int = 0  # maintained by add_comment
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
+# Reaction types double as keys of posts.reaction_counts
+REACTION_TYPES = ("like", "love", "haha", "wow", "sad", "angry")
+
 class Reaction(BaseModel):
     model_config = ConfigDict(extra="ignore")
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     post_id: str
     user_id: str
-    reaction_type: str  # like, love, haha, wow, sad, angry
+    reaction_type: str  # one of REACTION_TYPES
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
 class Comment(BaseModel):
@@ -133,6 +628,7 @@ class Message(BaseModel):
     sender_id: str
     content: str
     read: bool = False
+    read_by: List[str] = []
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
 class Conversation(BaseModel):
@@ -141,6 +637,9 @@ class Conversation(BaseModel):
     participants: List[str]
     conversation_type: str = "direct"  # direct, group
     name: Optional[str] = None
+    last_message: Optional[Dict[str, Any]] = None
+    last_activity_at: Optional[datetime] = None
+    unread_counts: Dict[str, int] = {}
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
 class Story(BaseModel):
@@ -148,6 +647,7 @@ class Story(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     user_id: str
     media_url: str
+    media_variants: Dict[str, str] = {}
     media_type: str
     expires_at: datetime
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
@@ -160,6 +660,9 @@ class Notification(BaseModel):
     content: str
     read: bool = False
     link: Optional[str] = None
+    actor_ids: List[str] = []
+    actor_names: List[str] = []
+    count: int = 1
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
 class Group(BaseModel):
@@ -179,6 +682,7 @@ class MarketplaceItem(BaseModel):
     description: str
     price: float
     images: List[str] = []
+    image_variants: List[Dict[str, str]] = []  # sized derivatives, aligned with images
     status: str = "active"  # active, sold
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
@@ -213,23 +717,105 @@ class JobPost(BaseModel):
     salary_range: Optional[str] = None
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
+# Shared HTTP client for upstream calls; keeps connections alive between requests
+http_client = httpx.AsyncClient(
+    timeout=httpx.Timeout(UPSTREAM_TIMEOUT_SECONDS),
+    limits=httpx.Limits(max_connections=100, max_keepalive_connections=20)
+)
+
+# Stops calling an upstream that keeps failing, then lets a single probe
+# through after reset_timeout to see whether it has recovered.
+class CircuitBreaker:
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half-open"
+        return "open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "half-open":
+            # Let one probe through and re-arm the timer for everyone else
+            self.opened_at = time.monotonic()
+            return True
+        return state == "closed"
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+
+    def record_failure(self):
+        self.failures += 1
+        if self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+
+    def stats(self) -> Dict[str, Any]:
+        return {"state": self.state, "failures": self.failures}
+
+oauth_breaker = CircuitBreaker()
+
+async def fetch_oauth_session(session_id: str) -> dict:
+    if not oauth_breaker.allow():
+        raise HTTPException(status_code=503, detail="Authentication service unavailable")
+    
+    for attempt in range(UPSTREAM_RETRIES + 1):
+        if attempt:
+            await asyncio.sleep(0.2 * 2 ** (attempt - 1) + random.uniform(0, 0.1))
+        try:
+            response = await http_client.get(OAUTH_SESSION_URL, headers={"X-Session-ID": session_id})
+        except httpx.TransportError:
+            oauth_breaker.record_failure()
+            continue
+        if response.status_code >= 500:
+            oauth_breaker.record_failure()
+            continue
+        oauth_breaker.record_success()
+        if response.status_code != 200:
+            raise HTTPException(status_code=400, detail="Invalid session")
+        return response.json()
+    
+    raise HTTPException(status_code=503, detail="Authentication service unavailable")
+
 # Helper functions
+def as_utc(value: Any) -> datetime:
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value
+
+def parse_token(authorization: str) -> str:
+    if authorization.startswith('Bearer '):
+        return authorization.replace('Bearer ', '')
+    return authorization
+
 async def get_current_user(authorization: str = None) -> Optional[User]:
     if not authorization:
         return None
     
+    token = parse_token(authorization)
+    cached = auth_cache.get(token)
+    if cached is not None:
+        return cached
+    now = datetime.now(timezone.utc)
+    
     # Try session token first
     try:
-        if authorization.startswith('Bearer '):
-            token = authorization.replace('Bearer ', '')
-        else:
-            token = authorization
-        
         session = await db.user_sessions.find_one({"session_token": token})
-        if session and session['expires_at'] > datetime.now(timezone.utc):
+        if session and as_utc(session['expires_at']) > now:
             user_doc = await db.users.find_one({"id": session['user_id']}, {"_id": 0})
             if user_doc:
-                return User(**user_doc)
+                user = User(**user_doc)
+                auth_cache.set(token, user, (as_utc(session['expires_at']) - now).total_seconds())
+                return user
     except:
         pass
     
@@ -238,52 +824,1595 @@ async def get_current_user(authorization: str = None) -> Optional[User]:
         payload = jwt.decode(token, JWT_SECRET, algorithms=['HS256'])
         user_doc = await db.users.find_one({"id": payload['user_id']}, {"_id": 0})
         if user_doc:
-            return User(**user_doc)
+            user = User(**user_doc)
+            auth_cache.set(token, user, payload['exp'] - now.timestamp())
+            return user
     except:
         pass
     
     return None
 
-def create_jwt_token(user_id: str) -> str:
+# Resolves the caller without loading the profile when the token carries
+# enough claims; falls back to get_current_user otherwise.
+async def get_current_identity(authorization: str = None) -> Optional[AuthIdentity]:
+    if not authorization:
+        return None
+    
+    token = parse_token(authorization)
+    cached = auth_cache.get(token)
+    if cached is not None:
+        return AuthIdentity(id=cached.id, name=cached.name)
+    
+    try:
+        payload = jwt.decode(token, JWT_SECRET, algorithms=['HS256'])
+        if 'name' in payload:
+            return AuthIdentity(id=payload['user_id'], name=payload['name'])
+    except jwt.PyJWTError:
+        pass
+    
+    user = await get_current_user(authorization)
+    return AuthIdentity(id=user.id, name=user.name) if user else None
+
+def invalidate_cached_user(user_id: str):
+    auth_cache.discard_where(lambda token, user: user.id == user_id)
+
+def create_jwt_token(user_id: str, name: Optional[str] = None) -> str:
     payload = {
         'user_id': user_id,
         'exp': datetime.now(timezone.utc) + timedelta(days=7)
     }
+    if name is not None:
+        payload['name'] = name
     return jwt.encode(payload, JWT_SECRET, algorithm='HS256')
 
-def hash_password(password: str) -> str:
-    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+def hash_password(password: str, rounds: int = BCRYPT_ROUNDS) -> str:
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds)).decode('utf-8')
 
 def verify_password(password: str, hashed: str) -> bool:
     return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
 
-async def create_notification(user_id: str, notification_type: str, content: str, link: Optional[str] = None):
-    notification = Notification(
-        user_id=user_id,
-        type=notification_type,
-        content=content,
-        link=link
+# bcrypt releases the GIL, so a thread pool keeps the event loop free
+class PasswordHasher:
+    def __init__(self, workers: int, queue_limit: int, rounds: int):
+        self.workers = workers
+        self.capacity = workers + queue_limit
+        self.rounds = rounds
+        self.pending = 0
+        self.rejected = 0
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="password-hash")
+
+    async def _run(self, fn, *args):
+        if self.pending >= self.capacity:
+            self.rejected += 1
+            raise HTTPException(status_code=503, detail="Server busy, please retry")
+        self.pending += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+        finally:
+            self.pending -= 1
+
+    async def hash(self, password: str) -> str:
+        return await self._run(hash_password, password, self.rounds)
+
+    async def verify(self, password: str, hashed: str) -> bool:
+        return await self._run(verify_password, password, hashed)
+
+    def needs_rehash(self, hashed: str) -> bool:
+        # $2b$<cost>$<salt+hash>
+        try:
+            return int(hashed.split('$')[2]) != self.rounds
+        except (IndexError, ValueError):
+            return True
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "workers": self.workers,
+            "capacity": self.capacity,
+            "rounds": self.rounds,
+            "pending": self.pending,
+            "rejected": self.rejected
+        }
+
+password_hasher = PasswordHasher(PASSWORD_HASH_WORKERS, PASSWORD_HASH_QUEUE_LIMIT, BCRYPT_ROUNDS)
+
+async def rehash_password(user_id: str, password: str):
+    await db.users.update_one({"id": user_id}, {"$set": {"password_hash": await password_hasher.hash(password)}})
+
+# Notification pipeline
+# Wording used once several actors are coalesced into one notification
+NOTIFICATION_SUMMARIES = {
+    "follow": "started following you",
+    "reaction": "reacted to your post",
+    "comment": "commented on your post",
+    "mention": "mentioned you in a post"
+}
+NOTIFICATION_RECENT_ACTORS = 20
+
+def coalesced_content(notification_type: str, actor_names: List[str], count: int, content: str) -> str:
+    if count <= 1 or notification_type not in NOTIFICATION_SUMMARIES:
+        return content
+    others = count - 1
+    return f"{actor_names[-1]} and {others} other{'s' if others != 1 else ''} {NOTIFICATION_SUMMARIES[notification_type]}"
+
+class NotificationPipeline:
+    def __init__(self, workers: int, queue_size: int, batch_size: int, batch_window: float):
+        self.workers = workers
+        self.batch_size = batch_size
+        self.batch_window = batch_window
+        # One queue per worker, picked by recipient, so a user's groups are
+        # only ever merged by a single worker
+        self.queues = [asyncio.Queue(maxsize=max(1, queue_size // workers)) for _ in range(workers)]
+        self.tasks: List[asyncio.Task] = []
+        self.enqueued = 0
+        self.dropped = 0
+        self.written = 0
+        self.coalesced = 0
+
+    def enqueue(self, user_id: str, notification_type: str, actor: AuthIdentity, content: str, link: Optional[str] = None):
+        event = {
+            "user_id": user_id,
+            "type": notification_type,
+            "link": link,
+            "content": content,
+            "actor_id": actor.id,
+            "actor_name": actor.name
+        }
+        try:
+            self.queues[hash(user_id) % self.workers].put_nowait(event)
+            self.enqueued += 1
+        except asyncio.QueueFull:
+            self.dropped += 1
+            logger.warning(f"Notification queue full, dropped {notification_type} for {user_id}")
+
+    def start(self):
+        if not self.tasks:
+            self.tasks = [asyncio.create_task(self._run(queue)) for queue in self.queues]
+
+    async def stop(self):
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+        # Drain whatever was still queued
+        for queue in self.queues:
+            batch = []
+            while not queue.empty():
+                batch.append(queue.get_nowait())
+            if batch:
+                await self.flush(batch)
+
+    async def _run(self, queue: asyncio.Queue):
+        while True:
+            batch = [await queue.get()]
+            deadline = time.monotonic() + self.batch_window
+            while len(batch) < self.batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    async with asyncio.timeout(timeout):
+                        batch.append(await queue.get())
+                except TimeoutError:
+                    break
+            try:
+                await self.flush(batch)
+            except Exception as e:
+                logger.error(f"Failed to write {len(batch)} notifications: {e}")
+
+    async def flush(self, events: List[dict]):
+        groups: Dict[tuple, dict] = {}
+        for event in events:
+            key = (event['user_id'], event['type'], event['link'])
+            group = groups.setdefault(key, {"actor_ids": [], "actor_names": [], "content": event['content']})
+            # Repeat actions by the same actor don't grow the count
+            if event['actor_id'] in group['actor_ids']:
+                continue
+            group['actor_ids'].append(event['actor_id'])
+            group['actor_names'].append(event['actor_name'])
+            group['content'] = event['content']
+        
+        existing = {}
+        cursor = db.notifications.find(
+            {"$or": [{"user_id": u, "type": t, "link": l, "read": False} for u, t, l in groups]},
+            {"_id": 0, "id": 1, "user_id": 1, "type": 1, "link": 1, "actor_ids": 1, "actor_names": 1, "count": 1}
+        )
+        async for doc in cursor:
+            existing.setdefault((doc['user_id'], doc['type'], doc['link']), doc)
+        
+        # Truncated to BSON's millisecond precision so written docs can be
+        # matched on it below
+        now = datetime.now(timezone.utc)
+        now = now.replace(microsecond=now.microsecond // 1000 * 1000)
+        operations = []
+        # (coalesced doc, doc to insert instead if it was read meanwhile)
+        coalescing: List[tuple] = []
+        docs: List[dict] = []
+        new_unread: Dict[str, int] = {}
+        for (user_id, notification_type, link), group in groups.items():
+            current = existing.get((user_id, notification_type, link))
+            if current:
+                known = set(current.get('actor_ids', []))
+                new_ids = [a for a in group['actor_ids'] if a not in known]
+                if not new_ids:
+                    continue
+                new_names = [n for a, n in zip(group['actor_ids'], group['actor_names']) if a not in known]
+                count = current.get('count', 1) + len(new_ids)
+                actor_ids = (current.get('actor_ids', []) + new_ids)[-NOTIFICATION_RECENT_ACTORS:]
+                actor_names = (current.get('actor_names', []) + new_names)[-NOTIFICATION_RECENT_ACTORS:]
+                doc = {
+                    "id": current['id'],
+                    "user_id": user_id,
+                    "type": notification_type,
+                    "content": coalesced_content(notification_type, actor_names, count, group['content']),
+                    "read": False,
+                    "link": link,
+                    "actor_ids": actor_ids,
+                    "actor_names": actor_names,
+                    "count": count,
+                    "created_at": now
+                }
+                operations.append(UpdateOne(
+                    {"id": current['id'], "read": False},
+                    {"$set": {k: doc[k] for k in ("content", "actor_ids", "actor_names", "count", "created_at")}}
+                ))
+                fallback = self._new_notification(user_id, notification_type, link, new_ids, new_names,
+                                                  group['content'], now)
+                coalescing.append((doc, fallback))
+                self.coalesced += len(new_ids)
+            else:
+                doc = self._new_notification(user_id, notification_type, link, group['actor_ids'],
+                                             group['actor_names'], group['content'], now)
+                operations.append(InsertOne(dict(doc)))
+                new_unread[user_id] = new_unread.get(user_id, 0) + 1
+                self.coalesced += len(group['actor_ids']) - 1
+                docs.append(doc)
+        
+        updated = {doc['id'] for doc, _ in coalescing}
+        if operations:
+            result = await db.notifications.bulk_write(operations, ordered=False)
+            self.written += len(operations)
+            if result.matched_count < len(coalescing):
+                # Read between the lookup and the update: the new actors get
+                # a notification of their own instead
+                updated = set()
+                async for row in db.notifications.find(
+                    {"id": {"$in": [doc['id'] for doc, _ in coalescing]}, "created_at": now},
+                    {"_id": 0, "id": 1}
+                ):
+                    updated.add(row['id'])
+                missed = [fallback for doc, fallback in coalescing if doc['id'] not in updated]
+                if missed:
+                    await db.notifications.insert_many([dict(doc) for doc in missed], ordered=False)
+                self.written += len(missed)
+                self.coalesced -= len(missed)
+                for doc in missed:
+                    new_unread[doc['user_id']] = new_unread.get(doc['user_id'], 0) + 1
+        docs += [doc if doc['id'] in updated else fallback for doc, fallback in coalescing]
+        
+        # One socket frame per recipient per batch
+        delivered: Dict[str, List[dict]] = {}
+        for doc in docs:
+            delivered.setdefault(doc['user_id'], []).append(doc)
+        for user_id, user_docs in delivered.items():
+            await manager.send_message(user_id, {'type': 'notifications', 'data': user_docs})
+        await adjust_unread_counts(new_unread)
+
+    def _new_notification(self, user_id: str, notification_type: str, link: Optional[str], actor_ids: List[str],
+                          actor_names: List[str], content: str, now: datetime) -> dict:
+        count = len(actor_ids)
+        return to_document(Notification(
+            user_id=user_id,
+            type=notification_type,
+            content=coalesced_content(notification_type, actor_names, count, content),
+            link=link,
+            actor_ids=actor_ids[-NOTIFICATION_RECENT_ACTORS:],
+            actor_names=actor_names[-NOTIFICATION_RECENT_ACTORS:],
+            count=count,
+            created_at=now
+        ))
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "workers": self.workers,
+            "queued": sum(queue.qsize() for queue in self.queues),
+            "enqueued": self.enqueued,
+            "dropped": self.dropped,
+            "written": self.written,
+            "coalesced": self.coalesced
+        }
+
+notification_pipeline = NotificationPipeline(
+    NOTIFICATION_WORKERS, NOTIFICATION_QUEUE_SIZE, NOTIFICATION_BATCH_SIZE, NOTIFICATION_BATCH_WINDOW_SECONDS
+)
+
+# Unread badge counts, kept in notification_counters. Coalescing onto an
+# unread notification doesn't change the count; only new documents do.
+# Deltas only move existing counters; a missing counter is seeded from the
+# notifications themselves (which already reflect the change) on first use.
+async def adjust_unread_counts(deltas: Dict[str, int]):
+    deltas = {user_id: delta for user_id, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    await db.notification_counters.bulk_write([
+        UpdateOne({"user_id": user_id}, {"$inc": {"unread": delta}})
+        for user_id, delta in deltas.items()
+    ], ordered=False)
+    counts = {}
+    async for counter in db.notification_counters.find({"user_id": {"$in": list(deltas)}}, {"_id": 0}):
+        counts[counter['user_id']] = counter['unread']
+    for user_id in deltas:
+        unread = counts[user_id] if user_id in counts else await seed_unread_count(user_id)
+        await manager.send_message(user_id, {'type': 'notification_count', 'data': {'unread': unread}})
+
+async def seed_unread_count(user_id: str) -> int:
+    unread = await db.notifications.count_documents({"user_id": user_id, "read": False})
+    counter = await db.notification_counters.find_one_and_update(
+        {"user_id": user_id},
+        {"$setOnInsert": {"unread": unread}},
+        projection={"_id": 0, "unread": 1},
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
+    return counter['unread']
+
+async def get_unread_count(user_id: str) -> int:
+    counter = await db.notification_counters.find_one({"user_id": user_id}, {"_id": 0, "unread": 1})
+    if counter:
+        return counter['unread']
+    return await seed_unread_count(user_id)
+
+async def reconcile_notification_counters(batch_size: int = 500) -> int:
+    reconciled = 0
+    pipeline = [{"$match": {"read": False}}, {"$group": {"_id": "$user_id", "unread": {"$sum": 1}}}]
+    seen = set()
+    operations = []
+    async for row in db.notifications.aggregate(pipeline):
+        seen.add(row['_id'])
+        operations.append(UpdateOne({"user_id": row['_id']}, {"$set": {"unread": row['unread']}}, upsert=True))
+        if len(operations) >= batch_size:
+            await db.notification_counters.bulk_write(operations, ordered=False)
+            reconciled += len(operations)
+            operations = []
+    if operations:
+        await db.notification_counters.bulk_write(operations, ordered=False)
+        reconciled += len(operations)
+    # Users whose notifications are all read
+    cleared = []
+    async for counter in db.notification_counters.find({"unread": {"$ne": 0}}, {"_id": 0, "user_id": 1}):
+        if counter['user_id'] not in seen:
+            cleared.append(counter['user_id'])
+    for start in range(0, len(cleared), batch_size):
+        result = await db.notification_counters.update_many(
+            {"user_id": {"$in": cleared[start:start + batch_size]}},
+            {"$set": {"unread": 0}}
+        )
+        reconciled += result.modified_count
+    return reconciled
+
+def create_notification(user_id: str, notification_type: str, actor: AuthIdentity, content: str, link: Optional[str] = None):
+    notification_pipeline.enqueue(user_id, notification_type, actor, content, link)
+
+# File upload helpers
+class StoredUpload(BaseModel):
+    url: str
+    sha256: str
+    size: int
+    content_type: Optional[str] = None
+    variants: Dict[str, str] = {}
+
+# Byte allowance shared by every file in one request
+class UploadBudget:
+    def __init__(self, limit: int = MAX_UPLOAD_REQUEST_BYTES):
+        self.remaining = limit
+
+    def consume(self, size: int):
+        self.remaining -= size
+        if self.remaining < 0:
+            raise HTTPException(status_code=413, detail="Upload exceeds request size limit")
+
+def _open_upload_target(path: Path):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    return path.open("wb")
+
+def _write_upload_chunk(buffer, digest, chunk: bytes):
+    digest.update(chunk)
+    buffer.write(chunk)
+
+async def stream_upload(file: UploadFile, folder: str, budget: Optional[UploadBudget] = None) -> StoredUpload:
+    file_ext = Path(file.filename or "").suffix.lower()
+    partial_path = UPLOAD_ROOT / "tmp" / f"{uuid.uuid4().hex}.part"
+    digest = hashlib.sha256()
+    size = 0
+    
+    buffer = await asyncio.to_thread(_open_upload_target, partial_path)
+    try:
+        while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+            size += len(chunk)
+            if size > MAX_UPLOAD_FILE_BYTES:
+                raise HTTPException(status_code=413, detail=f"{file.filename} exceeds the file size limit")
+            if budget:
+                budget.consume(len(chunk))
+            await asyncio.to_thread(_write_upload_chunk, buffer, digest, chunk)
+        await asyncio.to_thread(buffer.close)
+        return await store_media(partial_path, digest.hexdigest(), size, file_ext, file.content_type, folder)
+    except BaseException:
+        await asyncio.to_thread(buffer.close)
+        await asyncio.to_thread(partial_path.unlink, True)
+        raise
+
+# Content-addressed media store
+# Files are stored once per SHA-256 under media/; the media collection maps
+# each hash to its path and counts the document fields that reference it.
+# For images the EXIF-stripped "full" render becomes the stored object and
+# the uploaded original (GPS tags and all) is deleted once it is rendered.
+def _place_media_file(partial_path: Path, target: Path):
+    if target.exists():
+        partial_path.unlink(missing_ok=True)
+    else:
+        target.parent.mkdir(parents=True, exist_ok=True)
+        partial_path.replace(target)
+
+# Runs in the image process pool
+def render_image_variants(source: str, target_stem: str, widths: Dict[str, Optional[int]], image_format: str) -> Dict[str, str]:
+    extension = "webp" if image_format == "WEBP" else "jpg"
+    rendered = {}
+    try:
+        with Image.open(source) as original:
+            if original.width * original.height > Image.MAX_IMAGE_PIXELS:
+                raise Image.DecompressionBombError(f"{original.width}x{original.height} exceeds the pixel limit")
+            image = ImageOps.exif_transpose(original)
+            has_alpha = image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info)
+            image = image.convert("RGBA" if has_alpha and image_format == "WEBP" else "RGB")
+            for name, width in widths.items():
+                if name == "thumb":
+                    variant = ImageOps.fit(image, (width, width), Image.Resampling.LANCZOS)
+                else:
+                    variant = image.copy()
+                    if width and variant.width > width:
+                        variant.thumbnail((width, variant.height), Image.Resampling.LANCZOS)
+                path = f"{target_stem}_{name}.{extension}"
+                # Saving without exif= drops the original metadata
+                variant.save(path, image_format, quality=80)
+                rendered[name] = path
+    except BaseException:
+        for path in rendered.values():
+            Path(path).unlink(missing_ok=True)
+        raise
+    return rendered
+
+_image_pool: Optional[ProcessPoolExecutor] = None
+
+def get_image_pool() -> ProcessPoolExecutor:
+    global _image_pool
+    if _image_pool is None:
+        _image_pool = ProcessPoolExecutor(max_workers=IMAGE_WORKERS)
+    return _image_pool
+
+# A worker that dies (e.g. OOM-killed) breaks the whole pool; only the
+# first caller to notice replaces it
+def reset_image_pool(broken: ProcessPoolExecutor):
+    global _image_pool
+    if _image_pool is broken:
+        _image_pool = None
+        broken.shutdown(wait=False)
+
+# Raises if the image can't be rendered; callers must not keep an image
+# without its stripped render
+async def create_image_variants(relative_path: str) -> Dict[str, str]:
+    source = UPLOAD_ROOT / relative_path
+    args = (render_image_variants, str(source), str(source.with_suffix("")), IMAGE_VARIANT_WIDTHS, IMAGE_VARIANT_FORMAT)
+    for attempt in range(2):
+        pool = get_image_pool()
+        try:
+            rendered = await asyncio.get_running_loop().run_in_executor(pool, *args)
+            break
+        except BrokenProcessPool:
+            reset_image_pool(pool)
+            if attempt:
+                raise
+    return {name: "/uploads/" + Path(path).relative_to(UPLOAD_ROOT).as_posix() for name, path in rendered.items()}
+
+def pick_variant(url: Optional[str], variants: Optional[Dict[str, str]], size: str) -> Optional[str]:
+    return (variants or {}).get(size) or url
+
+def pick_variants(urls: List[str], variants: Optional[List[Dict[str, str]]], size: str) -> List[str]:
+    variants = variants or []
+    return [pick_variant(url, variants[i] if i < len(variants) else None, size) for i, url in enumerate(urls)]
+
+MEDIA_PROJECTION = {"_id": 0, "url": 1, "path": 1, "content_type": 1, "variants": 1}
+
+async def store_media(partial_path: Path, sha256: str, size: int, file_ext: str,
+                      content_type: Optional[str], folder: str) -> StoredUpload:
+    relative_path = f"media/{sha256[:2]}/{sha256}{file_ext}"
+    now = datetime.now(timezone.utc)
+    media = await db.media.find_one_and_update(
+        {"sha256": sha256},
+        {
+            "$inc": {"ref_count": 1},
+            "$set": {"last_acquired_at": now},
+            "$setOnInsert": {
+                "url": f"/uploads/{relative_path}",
+                "path": relative_path,
+                "size": size,
+                "content_type": content_type,
+                "folder": folder,
+                "created_at": now
+            }
+        },
+        projection=MEDIA_PROJECTION,
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
+    if media['path'] != relative_path:
+        # Already replaced by its stripped render
+        await asyncio.to_thread(partial_path.unlink, True)
+    else:
+        await asyncio.to_thread(_place_media_file, partial_path, UPLOAD_ROOT / relative_path)
+    
+    variants = media.get('variants')
+    if variants is None and (content_type or "").startswith("image/") and content_type != "image/gif":
+        try:
+            variants = await create_image_variants(relative_path)
+        except Exception as e:
+            # Nothing is recorded, so the next upload of these bytes tries again
+            await db.media.update_one({"sha256": sha256}, {"$inc": {"ref_count": -1}})
+            if isinstance(e, BrokenProcessPool):
+                logger.error(f"Image workers failed rendering {relative_path}")
+                raise HTTPException(status_code=503, detail="Image processing is unavailable, try again")
+            logger.warning(f"Could not render variants for {relative_path}: {e}")
+            raise HTTPException(status_code=400, detail="Unsupported or corrupt image")
+        update = {"variants": variants}
+        if variants.get('full'):
+            update.update(
+                url=variants['full'],
+                path=variants['full'].removeprefix("/uploads/"),
+                content_type=f"image/{IMAGE_VARIANT_FORMAT.lower()}"
+            )
+        media = await db.media.find_one_and_update(
+            {"sha256": sha256, "variants": {"$exists": False}},
+            {"$set": update},
+            projection=MEDIA_PROJECTION,
+            return_document=ReturnDocument.AFTER
+        )
+        if media is None:
+            # A concurrent upload of the same bytes finished first
+            media = await db.media.find_one({"sha256": sha256}, MEDIA_PROJECTION)
+        variants = media.get('variants')
+    if media['path'] != relative_path:
+        await asyncio.to_thread((UPLOAD_ROOT / relative_path).unlink, True)
+    
+    return StoredUpload(
+        url=media['url'],
+        sha256=sha256,
+        size=size,
+        content_type=media['content_type'],
+        variants=variants or {}
     )
-    doc = notification.model_dump()
-    doc['created_at'] = doc['created_at'].isoformat()
-    await db.notifications.insert_one(doc)
-    
-    # Send real-time notification
-    await manager.send_message(user_id, {
-        'type': 'notification',
-        'data': doc
-    })
 
-# File upload helper
-async def save_upload_file(file: UploadFile, folder: str) -> str:
-    file_ext = Path(file.filename).suffix
-    filename = f"{uuid.uuid4().hex}{file_ext}"
-    file_path = Path(f"/app/backend/uploads/{folder}/{filename}")
-    
-    with file_path.open("wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
-    
-    return f"/uploads/{folder}/{filename}"
+async def release_media(urls: List[Optional[str]]):
+    urls = [url for url in urls if url and url.startswith("/uploads/media/")]
+    if urls:
+        await db.media.bulk_write([
+            UpdateOne({"url": url}, {"$inc": {"ref_count": -1}}) for url in urls
+        ], ordered=False)
+
+# Document fields that hold media URLs, for reference recounting
+MEDIA_REFERENCES = [
+    ("users", "picture"),
+    ("users", "cover_photo"),
+    ("posts", "media_urls"),
+    ("marketplace_items", "images"),
+    ("stories", "media_url"),
+    ("job_profiles", "resume_url"),
+]
+
+async def recount_media_references(cutoff: datetime) -> int:
+    counts = Counter()
+    for collection_name, field in MEDIA_REFERENCES:
+        pipeline = [
+            {"$match": {field: {"$exists": True, "$ne": None}}},
+            {"$project": {"_id": 0, "url": f"${field}"}},
+            {"$unwind": "$url"},
+            {"$match": {"url": {"$regex": "^/uploads/media/"}}},
+            {"$group": {"_id": "$url", "count": {"$sum": 1}}}
+        ]
+        async for row in db[collection_name].aggregate(pipeline):
+            counts[row['_id']] += row['count']
+    
+    # Media acquired during the grace period may not be referenced yet
+    updates = []
+    async for media in db.media.find({"last_acquired_at": {"$lt": cutoff}}, {"_id": 0, "url": 1, "ref_count": 1}):
+        if media['ref_count'] != counts[media['url']]:
+            updates.append(UpdateOne(
+                {"url": media['url'], "last_acquired_at": {"$lt": cutoff}},
+                {"$set": {"ref_count": counts[media['url']]}}
+            ))
+    if updates:
+        await db.media.bulk_write(updates, ordered=False)
+    return len(updates)
+
+def _remove_stale_partials(cutoff_timestamp: float) -> int:
+    removed = 0
+    for partial in (UPLOAD_ROOT / "tmp").glob("*.part"):
+        if partial.stat().st_mtime < cutoff_timestamp:
+            partial.unlink(missing_ok=True)
+            removed += 1
+    return removed
+
+async def collect_media_garbage(recount: bool = True) -> Dict[str, int]:
+    cutoff = datetime.now(timezone.utc) - timedelta(seconds=MEDIA_GC_GRACE_SECONDS)
+    recounted = await recount_media_references(cutoff) if recount else 0
+    
+    removed = 0
+    orphans = db.media.find(
+        {"ref_count": {"$lte": 0}, "last_acquired_at": {"$lt": cutoff}},
+        {"_id": 0, "sha256": 1, "path": 1, "variants": 1}
+    )
+    async for media in orphans:
+        result = await db.media.delete_one({
+            "sha256": media['sha256'],
+            "ref_count": {"$lte": 0},
+            "last_acquired_at": {"$lt": cutoff}
+        })
+        if result.deleted_count:
+            paths = [media['path']] + [url.removeprefix("/uploads/") for url in (media.get('variants') or {}).values()]
+            for path in paths:
+                await asyncio.to_thread((UPLOAD_ROOT / path).unlink, True)
+            removed += 1
+    
+    partials = await asyncio.to_thread(_remove_stale_partials, cutoff.timestamp())
+    return {"recounted": recounted, "removed": removed, "stale_partials": partials}
+
+async def save_upload_file(file: UploadFile, folder: str, budget: Optional[UploadBudget] = None) -> str:
+    return (await stream_upload(file, folder, budget)).url
+
+async def save_upload_files(files: List[UploadFile], folder: str) -> List[StoredUpload]:
+    budget = UploadBudget()
+    uploads = await asyncio.gather(
+        *(stream_upload(file, folder, budget) for file in files),
+        return_exceptions=True
+    )
+    failed = [upload for upload in uploads if isinstance(upload, BaseException)]
+    if failed:
+        # Give back the references taken by the files that did make it
+        await release_media([upload.url for upload in uploads if isinstance(upload, StoredUpload)])
+        raise failed[0]
+    return uploads
+
+# Rejects request bodies over MAX_UPLOAD_REQUEST_BYTES while they are still
+# being received, before multipart parsing spools them to disk
+class RequestSizeLimitMiddleware:
+    def __init__(self, app, max_bytes: int):
+        self.app = app
+        self.max_bytes = max_bytes
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+        
+        headers = dict(scope['headers'])
+        content_length = headers.get(b'content-length')
+        if content_length:
+            try:
+                declared = int(content_length)
+            except ValueError:
+                response = JSONResponse({"detail": "Invalid Content-Length"}, status_code=400)
+                return await response(scope, receive, send)
+            if declared > self.max_bytes:
+                response = JSONResponse({"detail": "Request body too large"}, status_code=413)
+                return await response(scope, receive, send)
+        
+        received = 0
+        
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message['type'] == 'http.request':
+                received += len(message.get('body', b''))
+                if received > self.max_bytes:
+                    raise HTTPException(status_code=413, detail="Request body too large")
+            return message
+        
+        await self.app(scope, limited_receive, send)
+
+# Media serving
+# Serves /uploads with strong ETags, single byte ranges, precompressed .br/.gz
+# siblings and immutable caching for content-addressed files. Uses the ASGI
+# zero-copy extension when the server offers it, chunked reads otherwise.
+MEDIA_CHUNK_SIZE = 256 * 1024
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+MUTABLE_CACHE_CONTROL = "public, max-age=3600"
+RANGE_PATTERN = re.compile(r"^bytes=(\d*)-(\d*)$")
+PRECOMPRESSED_ENCODINGS = [("br", ".br"), ("gzip", ".gz")]
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+# Single byte range per RFC 9110 §14.1.2. Returns (first, last) inclusive, or
+# None when the header is to be ignored (malformed, multiple ranges or
+# last < first) and the full representation sent.
+def parse_byte_range(header: str, size: int) -> Optional[tuple]:
+    match = RANGE_PATTERN.match(header.strip())
+    if not match or not (match.group(1) or match.group(2)):
+        return None
+    first, last = match.group(1), match.group(2)
+    if first:
+        if last and int(last) < int(first):
+            return None
+        offset = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    else:
+        offset = max(size - int(last), 0)
+        end = size - 1
+    if offset >= size or end < offset:
+        raise RangeNotSatisfiable()
+    return offset, end
+
+# If-None-Match uses the weak comparison (RFC 9110 §13.1.2)
+def etag_matches(header: str, etag: str) -> bool:
+    tags = [tag.strip() for tag in header.split(",")]
+    return "*" in tags or etag.removeprefix("W/") in [tag.removeprefix("W/") for tag in tags]
+
+media_logger = logging.getLogger("media")
+media_metrics = {"requests": 0, "bytes_served": 0, "not_modified": 0, "partial": 0, "not_found": 0}
+_content_etags = LRUCache(10000, 24 * 3600)
+
+def _hash_file(path: Path) -> str:
+    digest = hashlib.sha256()
+    with path.open("rb") as f:
+        while chunk := f.read(MEDIA_CHUNK_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+class MediaFiles:
+    def __init__(self, directory: Path):
+        self.directory = directory.resolve()
+
+    def resolve(self, request_path: str) -> Optional[Path]:
+        relative = request_path.lstrip("/")
+        if not relative:
+            return None
+        path = (self.directory / relative).resolve()
+        if self.directory not in path.parents:
+            return None
+        # Checked after resolving so media/../tmp/ can't reach partial uploads
+        if path.relative_to(self.directory).parts[0] == "tmp":
+            return None
+        return path
+
+    async def etag(self, path: Path, stat) -> str:
+        # Content-addressed names already are the content hash
+        if path.parent.parent.name == "media":
+            return f'"{path.stem}"'
+        key = (str(path), stat.st_mtime_ns, stat.st_size)
+        digest = _content_etags.get(key)
+        if digest is None:
+            digest = await asyncio.to_thread(_hash_file, path)
+            _content_etags.set(key, digest)
+        return f'"{digest}"'
+
+    async def __call__(self, scope, receive, send):
+        started = time.perf_counter()
+        status, sent = await self.serve(scope, send)
+        media_metrics['requests'] += 1
+        media_metrics['bytes_served'] += sent
+        media_logger.info(
+            f"{scope['method']} {scope['path']} {status} {sent}B {(time.perf_counter() - started) * 1000:.1f}ms"
+        )
+
+    async def serve(self, scope, send) -> tuple:
+        if scope['method'] not in ("GET", "HEAD"):
+            return await self.respond(send, 405, {"allow": "GET, HEAD"})
+        route_path = scope['path']
+        root_path = scope.get('root_path', '')
+        if root_path and route_path.startswith(root_path):
+            route_path = route_path[len(root_path):]
+        path = self.resolve(route_path)
+        try:
+            stat = await asyncio.to_thread(path.stat) if path else None
+        except OSError:
+            stat = None
+        if stat is None or not stat_module.S_ISREG(stat.st_mode):
+            media_metrics['not_found'] += 1
+            return await self.respond(send, 404)
+        
+        request_headers = {k.decode('latin-1').lower(): v.decode('latin-1') for k, v in scope['headers']}
+        range_header = request_headers.get("range")
+        etag = await self.etag(path, stat)
+        if range_header and request_headers.get("if-range", etag) != etag:
+            range_header = None
+        
+        # Precompressed siblings are separate representations with their own ETag
+        body_path, size, encoding = path, stat.st_size, None
+        if not range_header:
+            accepted = request_headers.get("accept-encoding", "")
+            for candidate_encoding, suffix in PRECOMPRESSED_ENCODINGS:
+                candidate = path.with_name(path.name + suffix)
+                if candidate_encoding in accepted and await asyncio.to_thread(candidate.is_file):
+                    body_path, encoding = candidate, candidate_encoding
+                    size = (await asyncio.to_thread(candidate.stat)).st_size
+                    etag = f'{etag[:-1]}-{encoding}"'
+                    break
+        
+        content_type = mimetypes.guess_type(path.name)[0] or "application/octet-stream"
+        headers = {
+            "etag": etag,
+            "cache-control": IMMUTABLE_CACHE_CONTROL if path.relative_to(self.directory).parts[0] == "media" else MUTABLE_CACHE_CONTROL,
+            "accept-ranges": "bytes",
+            "content-type": content_type,
+            "vary": "Accept-Encoding"
+        }
+        if encoding:
+            headers["content-encoding"] = encoding
+        
+        if etag_matches(request_headers.get("if-none-match", ""), etag):
+            media_metrics['not_modified'] += 1
+            return await self.respond(send, 304, headers)
+        
+        status, offset, length = 200, 0, size
+        if range_header:
+            try:
+                byte_range = parse_byte_range(range_header, size)
+            except RangeNotSatisfiable:
+                headers["content-range"] = f"bytes */{size}"
+                return await self.respond(send, 416, headers)
+            if byte_range:
+                offset, end = byte_range
+                status, length = 206, end - offset + 1
+                headers["content-range"] = f"bytes {offset}-{end}/{size}"
+                media_metrics['partial'] += 1
+        
+        headers["content-length"] = str(length)
+        await send({
+            "type": "http.response.start",
+            "status": status,
+            "headers": [(k.encode('latin-1'), v.encode('latin-1')) for k, v in headers.items()]
+        })
+        if scope['method'] == "HEAD" or length == 0:
+            await send({"type": "http.response.body", "body": b""})
+            return status, 0
+        
+        if "http.response.zerocopysend" in scope.get("extensions", {}):
+            with body_path.open("rb") as f:
+                await send({"type": "http.response.zerocopysend", "file": f.fileno(), "offset": offset, "count": length})
+            return status, length
+        
+        remaining = length
+        f = await asyncio.to_thread(body_path.open, "rb")
+        try:
+            await asyncio.to_thread(f.seek, offset)
+            while remaining > 0:
+                chunk = await asyncio.to_thread(f.read, min(MEDIA_CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                await send({"type": "http.response.body", "body": chunk, "more_body": remaining > 0})
+        finally:
+            await asyncio.to_thread(f.close)
+        if remaining > 0:
+            await send({"type": "http.response.body", "body": b""})
+        return status, length - remaining
+
+    async def respond(self, send, status: int, headers: Optional[Dict[str, str]] = None) -> tuple:
+        headers = dict(headers or {})
+        headers["content-length"] = "0"
+        await send({
+            "type": "http.response.start",
+            "status": status,
+            "headers": [(k.encode('latin-1'), v.encode('latin-1')) for k, v in headers.items()]
+        })
+        await send({"type": "http.response.body", "body": b""})
+        return status, 0
+
+# Keyset pagination
+# Cursors are opaque tokens over (created_at, id); pages are fetched with a
+# range predicate on that pair instead of skip, so depth does not matter and
+# inserts at the head do not shift later pages. time_field swaps created_at
+# for another timestamp (e.g. last_activity_at).
+def encode_cursor(created_at: Any, item_id: str) -> str:
+    if isinstance(created_at, datetime):
+        created_at = created_at.isoformat()
+    raw = json.dumps([created_at, item_id], separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+def decode_cursor(cursor: str) -> tuple:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        created_at, item_id = json.loads(raw)
+        created_at = as_utc(created_at)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return created_at, item_id
+
+def keyset_filter(cursor: Optional[str], descending: bool = True, id_field: str = 'id',
+                  time_field: str = 'created_at') -> dict:
+    if not cursor:
+        return {}
+    created_at, item_id = decode_cursor(cursor)
+    op = "$lt" if descending else "$gt"
+    return {"$or": [
+        {time_field: {op: created_at}},
+        {time_field: created_at, id_field: {op: item_id}}
+    ]}
+
+def keyset_sort(descending: bool = True, id_field: str = 'id', time_field: str = 'created_at') -> List[tuple]:
+    direction = -1 if descending else 1
+    return [(time_field, direction), (id_field, direction)]
+
+def next_page_cursor(items: List[dict], limit: int, id_field: str = 'id',
+                     time_field: str = 'created_at') -> Optional[str]:
+    if len(items) < limit or not items:
+        return None
+    return encode_cursor(items[-1][time_field], items[-1][id_field])
+
+async def find_page(collection, query: dict, limit: int, cursor: Optional[str] = None, skip: int = 0,
+                    descending: bool = True, projection: Optional[dict] = None,
+                    time_field: str = 'created_at') -> tuple:
+    if cursor:
+        query = {"$and": [query, keyset_filter(cursor, descending, time_field=time_field)]}
+    find = collection.find(query, projection or {"_id": 0}).sort(keyset_sort(descending, time_field=time_field))
+    if skip and not cursor:
+        find = find.skip(skip)
+    items = await find.limit(limit).to_list(limit)
+    return items, next_page_cursor(items, limit, time_field=time_field)
+
+# Batched hydration helpers
+# Listing endpoints collect the ids on a page and resolve authors, reaction
+# counts, viewer reactions and comment counts with one bulk query each.
+USER_PUBLIC_PROJECTION = {
+    "_id": 0, "password_hash": 0, "search_name": 0, "search_tokens": 0, "search_prefixes": 0, "timeline_built": 0
+}
+
+# Embedded users (authors, senders, sellers, participants) carry only what
+# an avatar row needs. Summaries are cached per process and dropped by
+# update_profile; the JSON fragments built from them share the same key.
+USER_SUMMARY_PROJECTION = {"_id": 0, "id": 1, "name": 1, "picture": 1, "picture_variants": 1}
+
+def user_summary(user: dict) -> dict:
+    return {
+        "id": user['id'],
+        "name": user.get('name'),
+        "picture": pick_variant(user.get('picture'), user.get('picture_variants'), 'thumb')
+    }
+
+def invalidate_user_summary(user_id: str):
+    user_summary_cache.pop(user_id)
+    user_fragment_cache.pop(user_id)
+
+async def fetch_users_by_id(user_ids) -> Dict[str, dict]:
+    users = {}
+    missing = []
+    for uid in {uid for uid in user_ids if uid}:
+        summary = user_summary_cache.get(uid)
+        if summary is None:
+            missing.append(uid)
+        else:
+            users[uid] = summary
+    if missing:
+        async for doc in db.users.find({"id": {"$in": missing}}, USER_SUMMARY_PROJECTION):
+            summary = user_summary(doc)
+            user_summary_cache.set(summary['id'], summary)
+            users[summary['id']] = summary
+    return users
+
+async def attach_users(docs: List[dict], id_field: str = 'user_id', target_field: str = 'user') -> List[dict]:
+    users = await fetch_users_by_id(doc[id_field] for doc in docs)
+    for doc in docs:
+        doc[target_field] = users.get(doc[id_field])
+    return docs
+
+async def fetch_reaction_counts(post_ids: List[str]) -> Dict[str, Dict[str, int]]:
+    counts = {post_id: {} for post_id in post_ids}
+    pipeline = [
+        {"$match": {"post_id": {"$in": post_ids}}},
+        {"$group": {"_id": {"post_id": "$post_id", "type": "$reaction_type"}, "count": {"$sum": 1}}}
+    ]
+    async for row in db.reactions.aggregate(pipeline):
+        counts[row['_id']['post_id']][row['_id']['type']] = row['count']
+    return counts
+
+async def fetch_viewer_reactions(post_ids: List[str], viewer_id: str) -> Dict[str, str]:
+    reactions = await db.reactions.find(
+        {"post_id": {"$in": post_ids}, "user_id": viewer_id},
+        {"_id": 0, "post_id": 1, "reaction_type": 1}
+    ).to_list(len(post_ids))
+    return {r['post_id']: r['reaction_type'] for r in reactions}
+
+async def fetch_comment_counts(post_ids: List[str]) -> Dict[str, int]:
+    pipeline = [
+        {"$match": {"post_id": {"$in": post_ids}}},
+        {"$group": {"_id": "$post_id", "count": {"$sum": 1}}}
+    ]
+    counts = {post_id: 0 for post_id in post_ids}
+    async for row in db.comments.aggregate(pipeline):
+        counts[row['_id']] = row['count']
+    return counts
+
+async def hydrate_posts(posts: List[dict], viewer_id: str) -> List[dict]:
+    if not posts:
+        return posts
+    post_ids = [post['id'] for post in posts]
+    # Counters live on the post document; only posts written before they
+    # existed (and not yet reconciled) fall back to counting.
+    legacy_ids = [post['id'] for post in posts if 'reaction_counts' not in post or 'comment_count' not in post]
+    lookups = [
+        fetch_users_by_id(post['user_id'] for post in posts),
+        fetch_viewer_reactions(post_ids, viewer_id)
+    ]
+    if legacy_ids:
+        lookups += [fetch_reaction_counts(legacy_ids), fetch_comment_counts(legacy_ids)]
+    results = await asyncio.gather(*lookups)
+    users, viewer_reactions = results[0], results[1]
+    legacy_reactions, legacy_comments = (results[2], results[3]) if legacy_ids else ({}, {})
+    for post in posts:
+        if post['id'] in legacy_reactions:
+            post['reaction_counts'] = legacy_reactions[post['id']]
+            post['comment_count'] = legacy_comments[post['id']]
+        post['user'] = users.get(post['user_id'])
+        post['media_urls'] = pick_variants(post.get('media_urls', []), post.get('media_variants'), 'medium')
+        post['reaction_counts'] = {rtype: n for rtype, n in post['reaction_counts'].items() if n > 0}
+        post['user_reaction'] = viewer_reactions.get(post['id'])
+    return posts
+
+# Rebuilds the denormalized reaction_counts/comment_count fields from the
+# reactions and comments collections. Each write is conditional on the
+# counters read before counting, so a post reacted to or commented on
+# mid-batch is skipped rather than overwritten; rerun to pick it up.
+async def reconcile_post_counters(post_ids: Optional[List[str]] = None, batch_size: int = 500) -> int:
+    query = {"id": {"$in": post_ids}} if post_ids is not None else {}
+    cursor = db.posts.find(query, {"_id": 0, "id": 1, "reaction_counts": 1, "comment_count": 1}).sort("id", 1)
+    reconciled = 0
+    batch = []
+    async for post in cursor:
+        batch.append(post)
+        if len(batch) >= batch_size:
+            reconciled += await _reconcile_counter_batch(batch)
+            batch = []
+    if batch:
+        reconciled += await _reconcile_counter_batch(batch)
+    return reconciled
+
+async def _reconcile_counter_batch(posts: List[dict]) -> int:
+    post_ids = [post['id'] for post in posts]
+    reaction_counts, comment_counts = await asyncio.gather(
+        fetch_reaction_counts(post_ids),
+        fetch_comment_counts(post_ids)
+    )
+    operations = [
+        UpdateOne(
+            {"id": post['id'], "reaction_counts": post.get('reaction_counts'), "comment_count": post.get('comment_count')},
+            {"$set": {"reaction_counts": reaction_counts[post['id']], "comment_count": comment_counts[post['id']]}}
+        )
+        for post in posts
+        if post.get('reaction_counts') != reaction_counts[post['id']] or post.get('comment_count') != comment_counts[post['id']]
+    ]
+    if not operations:
+        return 0
+    result = await db.posts.bulk_write(operations, ordered=False)
+    return result.modified_count
+
+# Rebuilds users.follower_count from the connections collection. The write
+# is conditional on the count read before counting, so a user followed or
+# unfollowed mid-batch is skipped rather than overwritten; rerun to pick
+# them up.
+async def reconcile_follower_counts(batch_size: int = 500) -> int:
+    cursor = db.users.find({}, {"_id": 0, "id": 1, "follower_count": 1}).sort("id", 1)
+    reconciled = 0
+    batch = []
+    async for user in cursor:
+        batch.append(user)
+        if len(batch) >= batch_size:
+            reconciled += await _reconcile_follower_batch(batch)
+            batch = []
+    if batch:
+        reconciled += await _reconcile_follower_batch(batch)
+    return reconciled
+
+async def _reconcile_follower_batch(users: List[dict]) -> int:
+    pipeline = [
+        {"$match": {"target_user_id": {"$in": [user['id'] for user in users]}}},
+        {"$group": {"_id": "$target_user_id", "followers": {"$sum": 1}}}
+    ]
+    counts = {row['_id']: row['followers'] async for row in db.connections.aggregate(pipeline)}
+    operations = [
+        UpdateOne(
+            {"id": user['id'], "follower_count": user.get('follower_count')},
+            {"$set": {"follower_count": counts.get(user['id'], 0)}}
+        )
+        for user in users if user.get('follower_count') != counts.get(user['id'], 0)
+    ]
+    if not operations:
+        return 0
+    result = await db.users.bulk_write(operations, ordered=False)
+    return result.modified_count
+
+# Home timeline store
+# One document per (timeline owner, post). Posts are pushed to followers'
+# timelines on write unless the author is above the celebrity threshold, in
+# which case followers pick them up at read time. A timeline is built from
+# the follow graph once per user (users.timeline_built); until then it may
+# hold only entries fanned out since deploy.
+_celebrity_cache = {"expires": 0.0, "ids": []}
+_built_timelines = LRUCache(100000, 3600)
+
+def timeline_entry(owner_id: str, post: dict) -> dict:
+    return {
+        "user_id": owner_id,
+        "post_id": post['id'],
+        "author_id": post['user_id'],
+        "created_at": post['created_at']
+    }
+
+async def write_timeline_entries(entries: List[dict]):
+    for start in range(0, len(entries), 1000):
+        await db.timelines.bulk_write([
+            UpdateOne(
+                {"user_id": entry['user_id'], "post_id": entry['post_id']},
+                {"$setOnInsert": entry},
+                upsert=True
+            )
+            for entry in entries[start:start + 1000]
+        ], ordered=False)
+
+async def fan_out_post(post: dict, follower_count: int):
+    entries = [timeline_entry(post['user_id'], post)]
+    if follower_count < TIMELINE_CELEBRITY_THRESHOLD:
+        followers = db.connections.find({"target_user_id": post['user_id']}, {"_id": 0, "user_id": 1})
+        async for connection in followers:
+            entries.append(timeline_entry(connection['user_id'], post))
+    await write_timeline_entries(entries)
+    owners = [entry['user_id'] for entry in entries if random.random() * TIMELINE_TRIM_INTERVAL < 1]
+    for start in range(0, len(owners), 50):
+        await asyncio.gather(*(trim_timeline(owner_id) for owner_id in owners[start:start + 50]))
+
+async def backfill_timeline(owner_id: str, author_ids: List[str], limit: int):
+    posts = await db.posts.find(
+        {"user_id": {"$in": author_ids}, "post_type": "regular"},
+        {"_id": 0, "id": 1, "user_id": 1, "created_at": 1}
+    ).sort("created_at", -1).limit(limit).to_list(limit)
+    await write_timeline_entries([timeline_entry(owner_id, post) for post in posts])
+    return len(posts)
+
+async def trim_timeline(owner_id: str):
+    cutoff = await db.timelines.find(
+        {"user_id": owner_id}, {"_id": 0, "created_at": 1}
+    ).sort("created_at", -1).skip(TIMELINE_MAX_ENTRIES).limit(1).to_list(1)
+    if cutoff:
+        await db.timelines.delete_many({"user_id": owner_id, "created_at": {"$lte": cutoff[0]['created_at']}})
+
+async def rebuild_timeline(owner_id: str) -> int:
+    connections = await db.connections.find({"user_id": owner_id}, {"_id": 0, "target_user_id": 1}).to_list(None)
+    celebrities = set(await get_celebrity_ids())
+    author_ids = [c['target_user_id'] for c in connections if c['target_user_id'] not in celebrities]
+    author_ids.append(owner_id)
+    return await backfill_timeline(owner_id, author_ids, TIMELINE_MAX_ENTRIES)
+
+async def ensure_timeline(owner_id: str):
+    if _built_timelines.get(owner_id):
+        return
+    built = await db.users.find_one({"id": owner_id, "timeline_built": True}, {"_id": 0, "id": 1})
+    if not built:
+        # Upserts are idempotent, so concurrent fan-out or a second builder is harmless
+        await rebuild_timeline(owner_id)
+        await trim_timeline(owner_id)
+        await db.users.update_one({"id": owner_id}, {"$set": {"timeline_built": True}})
+    _built_timelines.set(owner_id, True)
+
+async def get_celebrity_ids() -> List[str]:
+    now = datetime.now(timezone.utc).timestamp()
+    if _celebrity_cache['expires'] <= now:
+        users = await db.users.find(
+            {"follower_count": {"$gte": TIMELINE_CELEBRITY_THRESHOLD}},
+            {"_id": 0, "id": 1}
+        ).to_list(None)
+        _celebrity_cache['ids'] = [u['id'] for u in users]
+        _celebrity_cache['expires'] = now + 60
+    return _celebrity_cache['ids']
+
+async def get_followed_celebrity_ids(user_id: str) -> List[str]:
+    celebrity_ids = await get_celebrity_ids()
+    if not celebrity_ids:
+        return []
+    connections = await db.connections.find(
+        {"user_id": user_id, "target_user_id": {"$in": celebrity_ids}},
+        {"_id": 0, "target_user_id": 1}
+    ).to_list(len(celebrity_ids))
+    return [c['target_user_id'] for c in connections]
+
+async def read_timeline(user_id: str, limit: int, cursor: Optional[str] = None, skip: int = 0) -> tuple:
+    await ensure_timeline(user_id)
+    window = limit if cursor else skip + limit
+    query = {"user_id": user_id}
+    if cursor:
+        query.update(keyset_filter(cursor, id_field='post_id'))
+    entries, celebrity_ids = await asyncio.gather(
+        db.timelines.find(
+            query, {"_id": 0, "post_id": 1, "created_at": 1}
+        ).sort(keyset_sort(id_field='post_id')).limit(window).to_list(window),
+        get_followed_celebrity_ids(user_id)
+    )
+    if celebrity_ids:
+        celebrity_query = {"user_id": {"$in": celebrity_ids}, "post_type": "regular"}
+        if cursor:
+            celebrity_query.update(keyset_filter(cursor))
+        celebrity_posts = await db.posts.find(
+            celebrity_query, {"_id": 0, "id": 1, "created_at": 1}
+        ).sort(keyset_sort()).limit(window).to_list(window)
+        seen = {entry['post_id'] for entry in entries}
+        entries += [{"post_id": p['id'], "created_at": p['created_at']} for p in celebrity_posts if p['id'] not in seen]
+        # as_utc: rows not yet migrated to native dates still hold strings
+        entries.sort(key=lambda entry: (as_utc(entry['created_at']), entry['post_id']), reverse=True)
+    
+    page = entries[window - limit:window]
+    return [entry['post_id'] for entry in page], next_page_cursor(page, limit, 'post_id')
+
+# User search
+# Names are folded (accents stripped, casefolded) and split into tokens;
+# every prefix of every token is stored in search_prefixes, a multikey index,
+# so a typeahead query is an equality lookup per query token. Raw input never
+# reaches a regex. Candidates are the most-followed prefix matches, plus
+# prefix matches among the viewer's follows and exact name matches, which
+# would otherwise fall outside that cut.
+SEARCH_MAX_PREFIX = 12
+SEARCH_CANDIDATES = 200
+SEARCH_FOLLOWED_CANDIDATES = 5000
+SEARCH_PROJECTION = {"_id": 0, "password_hash": 0, "search_prefixes": 0, "timeline_built": 0}
+SEARCH_TOKEN_PATTERN = re.compile(r"[^\W_]+")
+
+def normalize_search_text(text: str) -> List[str]:
+    folded = unicodedata.normalize('NFKD', text or '')
+    folded = ''.join(c for c in folded if not unicodedata.combining(c)).casefold()
+    return SEARCH_TOKEN_PATTERN.findall(folded)
+
+def search_fields(name: str, email: Optional[str] = None) -> dict:
+    tokens = normalize_search_text(name)
+    if email:
+        # The local part is searchable too ("jdoe" for jdoe@example.com)
+        tokens += [t for t in normalize_search_text(email.split('@')[0]) if t not in tokens]
+    prefixes = {token[:length] for token in tokens for length in range(1, min(len(token), SEARCH_MAX_PREFIX) + 1)}
+    return {
+        "search_name": ' '.join(normalize_search_text(name)),
+        "search_tokens": tokens,
+        "search_prefixes": sorted(prefixes)
+    }
+
+# Exact name, then all tokens whole, then the name starting with the query,
+# then any other token-prefix match; followed users get a boost within that
+def search_rank(candidate: dict, query: str, query_tokens: List[str], followed: set) -> tuple:
+    tokens = candidate.get('search_tokens', [])
+    name = candidate.get('search_name', '')
+    if name == query:
+        match = 3
+    elif all(token in tokens for token in query_tokens):
+        match = 2
+    elif name.startswith(query):
+        match = 1
+    else:
+        match = 0
+    return (match + (1.5 if candidate['id'] in followed else 0), candidate.get('follower_count', 0))
+
+async def search_user_index(q: str, viewer_id: Optional[str], limit: int = 20) -> List[dict]:
+    query_tokens = normalize_search_text(q)
+    if not query_tokens:
+        return []
+    
+    query = ' '.join(query_tokens)
+    prefix_match = {"search_prefixes": {"$all": [token[:SEARCH_MAX_PREFIX] for token in query_tokens]}}
+    prefix_filter = prefix_match
+    if '@' in q:
+        prefix_filter = {"$or": [prefix_match, {"email": q.strip().lower()}]}
+    followed_ids = []
+    if viewer_id:
+        followed_ids = [row['target_user_id'] for row in await db.connections.find(
+            {"user_id": viewer_id}, {"_id": 0, "target_user_id": 1}
+        ).sort(keyset_sort()).limit(SEARCH_FOLLOWED_CANDIDATES).to_list(SEARCH_FOLLOWED_CANDIDATES)]
+    
+    async def fetch(query_filter: dict) -> List[dict]:
+        return await db.users.find(query_filter, SEARCH_PROJECTION).sort(
+            "follower_count", -1
+        ).limit(SEARCH_CANDIDATES).to_list(SEARCH_CANDIDATES)
+    
+    lookups = [fetch(prefix_filter), fetch({"search_name": query})]
+    if followed_ids:
+        lookups.append(fetch({**prefix_match, "id": {"$in": followed_ids}}))
+    candidates = list({c['id']: c for batch in await asyncio.gather(*lookups) for c in batch}.values())
+    # Prefixes are capped, so long tokens need a final check
+    candidates = [
+        c for c in candidates
+        if c.get('email', '').lower() == q.strip().lower()
+        or all(any(t.startswith(q_token) for t in c.get('search_tokens', [])) for q_token in query_tokens)
+    ]
+    
+    followed = set()
+    if viewer_id and candidates:
+        async for row in db.connections.find(
+            {"user_id": viewer_id, "target_user_id": {"$in": [c['id'] for c in candidates]}},
+            {"_id": 0, "target_user_id": 1}
+        ):
+            followed.add(row['target_user_id'])
+    
+    candidates.sort(key=lambda c: search_rank(c, query, query_tokens, followed), reverse=True)
+    results = candidates[:limit]
+    for candidate in results:
+        candidate.pop('search_name', None)
+        candidate.pop('search_tokens', None)
+        candidate['picture'] = pick_variant(candidate.get('picture'), candidate.get('picture_variants'), 'thumb')
+        candidate['followed'] = candidate['id'] in followed
+    return results
+
+# Hashtags
+# Tags are stored normalized (NFKC, casefolded, word characters only) so
+# #Python, #python and #python! are one tag. Per-hour counts are kept in
+# hashtag_counts; trending is answered from in-process SpaceSaving sketches,
+# one per hour, merged over the requested sliding window. The hour holding
+# the window start is weighted by the share of it inside the window. Each
+# worker's sketches only see its own posts, so they are rebuilt from
+# hashtag_counts every TRENDING_REFRESH_SECONDS.
+HASHTAG_PATTERN = re.compile(r"#(\w+)")
+HASHTAG_MAX_LENGTH = 64
+TRENDING_WINDOWS = {"1h": 1, "6h": 6, "24h": 24}
+TRENDING_SKETCH_CAPACITY = int(os.environ.get('TRENDING_SKETCH_CAPACITY', '2000'))
+TRENDING_REFRESH_SECONDS = float(os.environ.get('TRENDING_REFRESH_SECONDS', '60'))
+
+def normalize_hashtag(tag: str) -> str:
+    return unicodedata.normalize('NFKC', tag).casefold().lstrip('#')[:HASHTAG_MAX_LENGTH]
+
+def extract_hashtags(content: str) -> List[str]:
+    return list(dict.fromkeys(normalize_hashtag(tag) for tag in HASHTAG_PATTERN.findall(content or '')))
+
+def hour_bucket(at: datetime) -> str:
+    return at.astimezone(timezone.utc).strftime('%Y-%m-%dT%H')
+
+# Metwally et al.'s SpaceSaving: at most `capacity` counters; an unseen item
+# replaces the current minimum and inherits its count as error. Any item
+# with true frequency above n/capacity is guaranteed to be tracked.
+class SpaceSaving:
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.counts: Dict[str, int] = {}
+        self.errors: Dict[str, int] = {}
+        self._heap: List[tuple] = []
+
+    def add(self, item: str, count: int = 1):
+        if item in self.counts:
+            self.counts[item] += count
+        elif len(self.counts) < self.capacity:
+            self.counts[item] = count
+            self.errors[item] = 0
+        else:
+            floor, evicted = self._pop_min()
+            del self.counts[evicted]
+            del self.errors[evicted]
+            self.counts[item] = floor + count
+            self.errors[item] = floor
+        heapq.heappush(self._heap, (self.counts[item], item))
+        # Entries go stale as counts grow; rebuild before the heap bloats
+        if len(self._heap) > 4 * self.capacity:
+            self._heap = [(c, i) for i, c in self.counts.items()]
+            heapq.heapify(self._heap)
+
+    def _pop_min(self) -> tuple:
+        while True:
+            count, item = heapq.heappop(self._heap)
+            if self.counts.get(item) == count:
+                return count, item
+
+    def top(self, k: int) -> List[tuple]:
+        return heapq.nlargest(k, self.counts.items(), key=lambda entry: entry[1])
+
+class TrendingTags:
+    # One hour more than the longest window: its edge bucket is partly inside
+    def __init__(self, capacity: int = TRENDING_SKETCH_CAPACITY, retain_hours: int = max(TRENDING_WINDOWS.values()) + 1):
+        self.capacity = capacity
+        self.retain_hours = retain_hours
+        self.buckets: "OrderedDict[str, SpaceSaving]" = OrderedDict()
+
+    def observe(self, tags: List[str], at: Optional[datetime] = None, count: int = 1):
+        at = at or datetime.now(timezone.utc)
+        key = hour_bucket(at)
+        sketch = self.buckets.get(key)
+        if sketch is None:
+            sketch = self.buckets[key] = SpaceSaving(self.capacity)
+            self.buckets = OrderedDict(sorted(self.buckets.items()))
+            self._expire(at)
+        for tag in tags:
+            sketch.add(tag, count)
+
+    def _expire(self, now: datetime):
+        oldest = hour_bucket(now - timedelta(hours=self.retain_hours))
+        for key in [key for key in self.buckets if key < oldest]:
+            del self.buckets[key]
+
+    def top(self, hours: int, k: int, now: Optional[datetime] = None) -> List[dict]:
+        now = now or datetime.now(timezone.utc)
+        start = now - timedelta(hours=hours)
+        edge = hour_bucket(start)
+        # Assumes uniform arrivals within the edge hour
+        edge_weight = 1 - (start.minute * 60 + start.second + start.microsecond / 1e6) / 3600
+        merged: Counter = Counter()
+        for key, sketch in self.buckets.items():
+            if key >= edge:
+                weight = edge_weight if key == edge else 1
+                for tag, count in sketch.top(self.capacity):
+                    merged[tag] += count * weight
+        return [{"tag": tag, "count": round(count)} for tag, count in merged.most_common(k) if round(count) > 0]
+
+trending_tags = TrendingTags()
+# Merging a day of sketches takes tens of milliseconds; results are reused briefly
+trending_cache = LRUCache(64, 15)
+
+async def record_hashtags(tags: List[str], at: datetime):
+    if not tags:
+        return
+    trending_tags.observe(tags, at)
+    hour = hour_bucket(at)
+    await db.hashtag_counts.bulk_write([
+        UpdateOne({"tag": tag, "hour": hour}, {"$inc": {"count": 1}}, upsert=True)
+        for tag in tags
+    ], ordered=False)
+
+# Builds sketches from the stored hourly counts, which every worker writes
+# to; reads only the top tags of each retained hour
+async def load_trending_tags(per_hour: int = TRENDING_SKETCH_CAPACITY) -> TrendingTags:
+    trending = TrendingTags()
+    now = datetime.now(timezone.utc)
+    for offset in range(trending.retain_hours):
+        at = now - timedelta(hours=offset)
+        rows = await db.hashtag_counts.find(
+            {"hour": hour_bucket(at)},
+            {"_id": 0, "tag": 1, "count": 1}
+        ).sort("count", -1).limit(per_hour).to_list(per_hour)
+        for row in rows:
+            trending.observe([row['tag']], at, row['count'])
+    return trending
+
+async def refresh_trending_tags():
+    global trending_tags
+    while True:
+        try:
+            trending_tags = await load_trending_tags()
+        except Exception as e:
+            logger.error(f"Failed to refresh trending tags: {e}")
+        await asyncio.sleep(TRENDING_REFRESH_SECONDS)
+
+# Index provisioning
+# Every query pattern in this file should be served by one of these. They are
+# created on startup; creating an index that already exists is a no-op.
+INDEX_SPECS: Dict[str, List[IndexModel]] = {
+    "users": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel([("email", ASCENDING)], name="email_unique", unique=True),
+        IndexModel([("name", ASCENDING)], name="name"),
+        IndexModel([("follower_count", DESCENDING)], name="follower_count"),
+        IndexModel([("search_prefixes", ASCENDING), ("follower_count", DESCENDING)], name="search_prefixes"),
+        IndexModel([("search_name", ASCENDING), ("follower_count", DESCENDING)], name="search_name"),
+    ],
+    "user_sessions": [
+        IndexModel([("session_token", ASCENDING)], name="session_token_unique", unique=True),
+        IndexModel([("user_id", ASCENDING)], name="user_id"),
+        IndexModel([("expires_at", ASCENDING)], name="expires_at_ttl", expireAfterSeconds=0),
+    ],
+    "posts": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel([("post_type", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)], name="post_type_created"),
+        IndexModel(
+            [("user_id", ASCENDING), ("post_type", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)],
+            name="user_post_type_created"
+        ),
+        IndexModel([("hashtags", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)], name="hashtags_created"),
+        IndexModel([("mentions", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)], name="mentions_created"),
+    ],
+    "hashtag_counts": [
+        IndexModel([("tag", ASCENDING), ("hour", ASCENDING)], name="tag_hour_unique", unique=True),
+        IndexModel([("hour", ASCENDING), ("count", DESCENDING)], name="hour_count"),
+    ],
+    "reactions": [
+        IndexModel([("post_id", ASCENDING), ("user_id", ASCENDING)], name="post_user_unique", unique=True),
+    ],
+    "comments": [
+        IndexModel([("post_id", ASCENDING), ("created_at", ASCENDING), ("id", ASCENDING)], name="post_created"),
+    ],
+    "connections": [
+        IndexModel([("user_id", ASCENDING), ("target_user_id", ASCENDING)], name="user_target_unique", unique=True),
+        IndexModel([("user_id", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)], name="user_created"),
+        IndexModel([("target_user_id", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)], name="target_created"),
+    ],
+    "media": [
+        IndexModel([("sha256", ASCENDING)], name="sha256_unique", unique=True),
+        IndexModel([("url", ASCENDING)], name="url_unique", unique=True),
+        IndexModel([("ref_count", ASCENDING), ("last_acquired_at", ASCENDING)], name="ref_count_acquired"),
+    ],
+    "realtime_presence": [
+        IndexModel([("user_id", ASCENDING), ("worker_id", ASCENDING)], name="user_worker_unique", unique=True),
+        IndexModel([("worker_id", ASCENDING)], name="worker_id"),
+        IndexModel([("expires_at", ASCENDING)], name="expires_at_ttl", expireAfterSeconds=0),
+    ],
+    "realtime_events": [
+        IndexModel([("created_at", ASCENDING)], name="created_at_ttl", expireAfterSeconds=60),
+    ],
+    "timelines": [
+        IndexModel([("user_id", ASCENDING), ("post_id", ASCENDING)], name="user_post_unique", unique=True),
+        IndexModel([("user_id", ASCENDING), ("created_at", DESCENDING), ("post_id", DESCENDING)], name="user_created"),
+        IndexModel([("user_id", ASCENDING), ("author_id", ASCENDING)], name="user_author"),
+        IndexModel([("post_id", ASCENDING)], name="post_id"),
+    ],
+    "conversations": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel([("participants", ASCENDING), ("created_at", DESCENDING)], name="participants_created"),
+        IndexModel([("participants", ASCENDING), ("last_activity_at", DESCENDING), ("id", DESCENDING)], name="participants_activity"),
+    ],
+    "messages": [
+        IndexModel([("conversation_id", ASCENDING), ("created_at", ASCENDING), ("id", ASCENDING)], name="conversation_created"),
+    ],
+    "stories": [
+        IndexModel([("user_id", ASCENDING), ("expires_at", ASCENDING)], name="user_expires"),
+        IndexModel([("expires_at", ASCENDING)], name="expires_at_ttl", expireAfterSeconds=0),
+    ],
+    "notifications": [
+        IndexModel([("user_id", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)], name="user_created"),
+        IndexModel([("id", ASCENDING), ("user_id", ASCENDING)], name="id_user"),
+        IndexModel([("user_id", ASCENDING), ("type", ASCENDING), ("link", ASCENDING), ("read", ASCENDING)], name="user_group_key"),
+        IndexModel([("user_id", ASCENDING), ("read", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)], name="user_read_created"),
+    ],
+    "notification_counters": [
+        IndexModel([("user_id", ASCENDING)], name="user_id_unique", unique=True),
+    ],
+    "groups": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+    ],
+    "group_members": [
+        IndexModel([("user_id", ASCENDING), ("group_id", ASCENDING)], name="user_group_unique", unique=True),
+    ],
+    "marketplace_items": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel([("status", ASCENDING), ("created_at", DESCENDING)], name="status_created"),
+    ],
+    "events": [
+        IndexModel([("event_date", ASCENDING)], name="event_date"),
+    ],
+    "job_posts": [
+        IndexModel([("created_at", DESCENDING)], name="created"),
+    ],
+    "job_profiles": [
+        IndexModel([("user_id", ASCENDING)], name="user_id"),
+    ],
+}
+
+async def ensure_indexes():
+    for collection_name, indexes in INDEX_SPECS.items():
+        collection = db[collection_name]
+        for index in indexes:
+            try:
+                await collection.create_indexes([index])
+            except OperationFailure as e:
+                logger.error(f"Could not create index {collection_name}.{index.document['name']}: {e}")
+
+async def index_report() -> Dict[str, Dict[str, List[str]]]:
+    report = {}
+    read_usage = True
+    for collection_name, indexes in INDEX_SPECS.items():
+        collection = db[collection_name]
+        declared = {index.document['name'] for index in indexes}
+        existing = set((await collection.index_information()).keys()) - {"_id_"}
+        unused = []
+        try:
+            if read_usage:
+                async for stats in collection.aggregate([{"$indexStats": {}}]):
+                    if stats['name'] != "_id_" and stats['accesses']['ops'] == 0:
+                        unused.append(stats['name'])
+        except OperationFailure as e:
+            # $indexStats needs the indexStats privilege; usage is optional
+            logger.warning(f"Index usage not reported: {e}")
+            read_usage = False
+        report[collection_name] = {
+            "missing": sorted(declared - existing),
+            "undeclared": sorted(existing - declared),
+            "unused": sorted(unused)
+        }
+    return report
 
 # Auth Routes
 @api_router.post("/auth/register")
@@ -295,14 +2424,14 @@ async def register(email: EmailStr = Form(...), password: str = Form(...), name:
     user = User(
         email=email,
         name=name,
-        password_hash=hash_password(password)
+        password_hash=await password_hasher.hash(password)
     )
     
-    doc = user.model_dump()
-    doc['created_at'] = doc['created_at'].isoformat()
+    doc = to_document(user)
+    doc.update(search_fields(user.name, user.email))
     await db.users.insert_one(doc)
     
-    token = create_jwt_token(user.id)
+    token = create_jwt_token(user.id, user.name)
     
     return {
         "success": True,
@@ -311,15 +2440,19 @@ async def register(email: EmailStr = Form(...), password: str = Form(...), name:
     }
 
 @api_router.post("/auth/login")
-async def login(email: EmailStr = Form(...), password: str = Form(...)):
+async def login(background_tasks: BackgroundTasks, email: EmailStr = Form(...), password: str = Form(...)):
     user_doc = await db.users.find_one({"email": email}, {"_id": 0})
-    if not user_doc:
+    if not user_doc or not user_doc.get('password_hash'):
         raise HTTPException(status_code=401, detail="Invalid credentials")
     
-    if not verify_password(password, user_doc['password_hash']):
+    if not await password_hasher.verify(password, user_doc['password_hash']):
         raise HTTPException(status_code=401, detail="Invalid credentials")
     
-    token = create_jwt_token(user_doc['id'])
+    # Upgrade hashes made with a different cost factor after responding
+    if password_hasher.needs_rehash(user_doc['password_hash']):
+        background_tasks.add_task(rehash_password, user_doc['id'], password)
+    
+    token = create_jwt_token(user_doc['id'], user_doc['name'])
     
     return {
         "success": True,
@@ -336,33 +2469,25 @@ async def get_me(authorization: str = Query(None)):
 
 @api_router.post("/auth/google/callback")
 async def google_auth_callback(session_id: str = Form(...)):
+    data = await fetch_oauth_session(session_id)
     try:
-        response = requests.get(
-            "https://demobackend.emergentagent.com/auth/v1/env/oauth/session-data",
-            headers={"X-Session-ID": session_id}
+        # Find or create the user in one round-trip
+        user = User(
+            email=data['email'],
+            name=data['name'],
+            picture=data.get('picture')
         )
-        
-        if response.status_code != 200:
-            raise HTTPException(status_code=400, detail="Invalid session")
-        
-        data = response.json()
-        
-        # Check if user exists
-        user_doc = await db.users.find_one({"email": data['email']}, {"_id": 0})
-        
-        if not user_doc:
-            # Create new user
-            user = User(
-                email=data['email'],
-                name=data['name'],
-                picture=data.get('picture')
-            )
-            doc = user.model_dump()
-            doc['created_at'] = doc['created_at'].isoformat()
-            await db.users.insert_one(doc)
-            user_id = user.id
-        else:
-            user_id = user_doc['id']
+        doc = to_document(user)
+        doc.update(search_fields(user.name, user.email))
+        del doc['email']
+        user_doc = await db.users.find_one_and_update(
+            {"email": data['email']},
+            {"$setOnInsert": doc},
+            projection={"_id": 0, "id": 1},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        user_id = user_doc['id']
         
         # Create session
         session = UserSession(
@@ -371,9 +2496,7 @@ async def google_auth_callback(session_id: str = Form(...)):
             expires_at=datetime.now(timezone.utc) + timedelta(days=7)
         )
         
-        session_doc = session.model_dump()
-        session_doc['expires_at'] = session_doc['expires_at'].isoformat()
-        session_doc['created_at'] = session_doc['created_at'].isoformat()
+        session_doc = to_document(session)
         await db.user_sessions.insert_one(session_doc)
         
         return {
@@ -387,11 +2510,11 @@ async def google_auth_callback(session_id: str = Form(...)):
 # Profile Routes
 @api_router.get("/profile/{user_id}")
 async def get_profile(user_id: str, authorization: str = Query(None)):
-    current_user = await get_current_user(authorization)
+    current_user = await get_current_identity(authorization)
     if not current_user:
         raise HTTPException(status_code=401, detail="Not authenticated")
     
-    user = await db.users.find_one({"id": user_id}, {"_id": 0, "password_hash": 0})
+    user = await db.users.find_one({"id": user_id}, USER_PUBLIC_PROJECTION)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     
@@ -402,6 +2525,8 @@ async def get_profile(user_id: str, authorization: str = Query(None)):
     })
     
     user['connection_status'] = connection['status'] if connection else None
+    user['picture'] = pick_variant(user.get('picture'), user.get('picture_variants'), 'small')
+    user['cover_photo'] = pick_variant(user.get('cover_photo'), user.get('cover_photo_variants'), 'large')
     
     return user
 
@@ -429,23 +2554,37 @@ async def update_profile(
     if city is not None:
         update_data['city'] = city
     
+    budget = UploadBudget()
     if picture:
-        picture_url = await save_upload_file(picture, "profiles")
-        update_data['picture'] = picture_url
+        upload = await stream_upload(picture, "profiles", budget)
+        update_data['picture'] = upload.url
+        update_data['picture_variants'] = upload.variants
     
     if cover_photo:
-        cover_url = await save_upload_file(cover_photo, "profiles")
-        update_data['cover_photo'] = cover_url
+        upload = await stream_upload(cover_photo, "profiles", budget)
+        update_data['cover_photo'] = upload.url
+        update_data['cover_photo_variants'] = upload.variants
     
     if update_data:
-        await db.users.update_one({"id": user.id}, {"$set": update_data})
+        previous = await db.users.find_one_and_update(
+            {"id": user.id},
+            {"$set": update_data},
+            projection={"_id": 0, "picture": 1, "cover_photo": 1}
+        )
+        invalidate_cached_user(user.id)
+        invalidate_user_summary(user.id)
+        invalidate_story_rings(user.id)
+        
+        # Drop the references held by replaced images
+        if previous:
+            await release_media([previous.get(field) for field in ('picture', 'cover_photo') if field in update_data])
     
     return {"success": True, "message": "Profile updated"}
 
 # Connection Routes
 @api_router.post("/connections/follow/{target_user_id}")
 async def follow_user(target_user_id: str, authorization: str = Query(None)):
-    user = await get_current_user(authorization)
+    user = await get_current_identity(authorization)
     if not user:
         raise HTTPException(status_code=401, detail="Not authenticated")
     
@@ -463,64 +2602,97 @@ async def follow_user(target_user_id: str, authorization: str = Query(None)):
         connection_type="follow"
     )
     
-    doc = connection.model_dump()
-    doc['created_at'] = doc['created_at'].isoformat()
+    doc = to_document(connection)
     await db.connections.insert_one(doc)
+    story_ring_cache.pop(user.id)
     
-    # Create notification
-    target_user = await db.users.find_one({"id": target_user_id}, {"_id": 0})
+    target_user = await db.users.find_one_and_update(
+        {"id": target_user_id},
+        {"$inc": {"follower_count": 1}},
+        projection={"_id": 0, "follower_count": 1},
+        return_document=ReturnDocument.AFTER
+    )
+    
+    # Backfill the follower's timeline with the author's recent posts
+    if target_user and target_user['follower_count'] < TIMELINE_CELEBRITY_THRESHOLD:
+        await backfill_timeline(user.id, [target_user_id], TIMELINE_BACKFILL_POSTS)
+        await trim_timeline(user.id)
+    
+    # Linked to the recipient's own profile (not the follower's) so a burst
+    # of follows coalesces into one notification
     if target_user:
-        await create_notification(
+        create_notification(
             target_user_id,
             "follow",
+            user,
             f"{user.name} started following you",
-            f"/profile/{user.id}"
+            f"/profile/{target_user_id}"
         )
     
     return {"success": True}
 
 @api_router.delete("/connections/unfollow/{target_user_id}")
 async def unfollow_user(target_user_id: str, authorization: str = Query(None)):
-    user = await get_current_user(authorization)
+    user = await get_current_identity(authorization)
     if not user:
         raise HTTPException(status_code=401, detail="Not authenticated")
     
-    await db.connections.delete_one({
+    result = await db.connections.delete_one({
         "user_id": user.id,
         "target_user_id": target_user_id
     })
     
+    if result.deleted_count:
+        story_ring_cache.pop(user.id)
+        # Guarded: follows made before follower_count existed were never counted
+        await db.users.update_one(
+            {"id": target_user_id, "follower_count": {"$gt": 0}},
+            {"$inc": {"follower_count": -1}}
+        )
+        await db.timelines.delete_many({"user_id": user.id, "author_id": target_user_id})
+    
     return {"success": True}
 
 @api_router.get("/connections/followers")
-async def get_followers(authorization: str = Query(None)):
-    user = await get_current_user(authorization)
+async def get_followers(
+    authorization: str = Query(None),
+    cursor: Optional[str] = Query(None),
+    limit: int = Query(100)
+):
+    user = await get_current_identity(authorization)
     if not user:
         raise HTTPException(status_code=401, detail="Not authenticated")
     
-    connections = await db.connections.find({"target_user_id": user.id}, {"_id": 0}).to_list(1000)
+    connections, next_cursor = await find_page(db.connections, {"target_user_id": user.id}, limit, cursor)
     follower_ids = [c['user_id'] for c in connections]
     
-    followers = await db.users.find({"id": {"$in": follower_ids}}, {"_id": 0, "password_hash": 0}).to_list(1000)
+    users = await fetch_users_by_id(follower_ids)
+    followers = [user_fragment(users[uid]) for uid in follower_ids if uid in users]
     
-    return {"followers": followers}
+    return FastJSONResponse({"followers": followers, "next_cursor": next_cursor})
 
 @api_router.get("/connections/following")
-async def get_following(authorization: str = Query(None)):
-    user = await get_current_user(authorization)
+async def get_following(
+    authorization: str = Query(None),
+    cursor: Optional[str] = Query(None),
+    limit: int = Query(100)
+):
+    user = await get_current_identity(authorization)
     if not user:
         raise HTTPException(status_code=401, detail="Not authenticated")
     
-    connections = await db.connections.find({"user_id": user.id}, {"_id": 0}).to_list(1000)
+    connections, next_cursor = await find_page(db.connections, {"user_id": user.id}, limit, cursor)
     following_ids = [c['target_user_id'] for c in connections]
     
-    following = await db.users.find({"id": {"$in": following_ids}}, {"_id": 0, "password_hash": 0}).to_list(1000)
+    users = await fetch_users_by_id(following_ids)
+    following = [user_fragment(users[uid]) for uid in following_ids if uid in users]
     
-    return {"following": following}
+    return FastJSONResponse({"following": following, "next_cursor": next_cursor})
 
 # Post Routes
 @api_router.post("/posts")
 async def create_post(
+    background_tasks: BackgroundTasks,
     authorization: str = Query(None),
     content: str = Form(...),
     post_type: str = Form("regular"),
@@ -530,37 +2702,42 @@ async def create_post(
     if not user:
         raise HTTPException(status_code=401, detail="Not authenticated")
     
-    media_urls = []
+    uploads = []
     if files:
         folder = "posts" if post_type == "regular" else "reels"
-        for file in files:
-            url = await save_upload_file(file, folder)
-            media_urls.append(url)
+        uploads = await save_upload_files(files, folder)
     
     # Extract hashtags and mentions
-    hashtags = [word[1:] for word in content.split() if word.startswith('#')]
+    hashtags = extract_hashtags(content)
     mentions = [word[1:] for word in content.split() if word.startswith('@')]
     
     post = Post(
         user_id=user.id,
         content=content,
-        media_urls=media_urls,
+        media_urls=[upload.url for upload in uploads],
+        media_variants=[upload.variants for upload in uploads],
         post_type=post_type,
         hashtags=hashtags,
         mentions=mentions
     )
     
-    doc = post.model_dump()
-    doc['created_at'] = doc['created_at'].isoformat()
+    doc = to_document(post)
     await db.posts.insert_one(doc)
     
+    # The author sees the post straight away; followers' timelines are
+    # written after responding
+    if post.post_type == "regular":
+        await write_timeline_entries([timeline_entry(user.id, doc)])
+        background_tasks.add_task(fan_out_post, doc, user.follower_count)
+    await record_hashtags(hashtags, post.created_at)
+    
     # Notify mentioned users
-    for mention in mentions:
-        mentioned_user = await db.users.find_one({"name": mention}, {"_id": 0})
-        if mentioned_user:
-            await create_notification(
+    if mentions:
+        async for mentioned_user in db.users.find({"name": {"$in": list(set(mentions))}}, {"_id": 0, "id": 1}):
+            create_notification(
                 mentioned_user['id'],
                 "mention",
+                user,
                 f"{user.name} mentioned you in a post",
                 f"/post/{post.id}"
             )
@@ -568,65 +2745,49 @@ async def create_post(
     return {"success": True, "post": doc}
 
 @api_router.get("/posts/feed")
-async def get_feed(authorization: str = Query(None), skip: int = Query(0), limit: int = Query(20)):
-    user = await get_current_user(authorization)
+async def get_feed(
+    authorization: str = Query(None),
+    cursor: Optional[str] = Query(None),
+    skip: int = Query(0),
+    limit: int = Query(20)
+):
+    user = await get_current_identity(authorization)
     if not user:
         raise HTTPException(status_code=401, detail="Not authenticated")
     
-    # Get following users
-    connections = await db.connections.find({"user_id": user.id}, {"_id": 0}).to_list(1000)
-    following_ids = [c['target_user_id'] for c in connections]
-    following_ids.append(user.id)  # Include own posts
-    
-    # Get posts
-    posts = await db.posts.find(
-        {"user_id": {"$in": following_ids}, "post_type": "regular"},
-        {"_id": 0}
-    ).sort("created_at", -1).skip(skip).limit(limit).to_list(limit)
+    # Page through the precomputed timeline (own posts included)
+    post_ids, next_cursor = await read_timeline(user.id, limit, cursor, skip)
+    posts = await db.posts.find({"id": {"$in": post_ids}}, {"_id": 0}).to_list(len(post_ids))
+    positions = {post_id: i for i, post_id in enumerate(post_ids)}
+    posts.sort(key=lambda post: positions[post['id']])
     
     # Enrich with user data and stats
-    for post in posts:
-        post_user = await db.users.find_one({"id": post['user_id']}, {"_id": 0, "password_hash": 0})
-        post['user'] = post_user
-        
-        # Get reaction counts
-        reactions = await db.reactions.find({"post_id": post['id']}, {"_id": 0}).to_list(1000)
-        post['reaction_counts'] = {}
-        for reaction in reactions:
-            rtype = reaction['reaction_type']
-            post['reaction_counts'][rtype] = post['reaction_counts'].get(rtype, 0) + 1
-        
-        # Check if current user reacted
-        user_reaction = await db.reactions.find_one({"post_id": post['id'], "user_id": user.id})
-        post['user_reaction'] = user_reaction['reaction_type'] if user_reaction else None
-        
-        # Get comment count
-        comment_count = await db.comments.count_documents({"post_id": post['id']})
-        post['comment_count'] = comment_count
+    await hydrate_posts(posts, user.id)
+    embed_user_fragments(posts)
     
-    return {"posts": posts}
+    return FastJSONResponse({"posts": posts, "next_cursor": next_cursor})
 
 @api_router.get("/posts/reels")
-async def get_reels(authorization: str = Query(None), skip: int = Query(0), limit: int = Query(10)):
-    user = await get_current_user(authorization)
+async def get_reels(
+    authorization: str = Query(None),
+    cursor: Optional[str] = Query(None),
+    skip: int = Query(0),
+    limit: int = Query(10)
+):
+    user = await get_current_identity(authorization)
     if not user:
         raise HTTPException(status_code=401, detail="Not authenticated")
     
-    reels = await db.posts.find(
-        {"post_type": "reel"},
-        {"_id": 0}
-    ).sort("created_at", -1).skip(skip).limit(limit).to_list(limit)
+    reels, next_cursor = await find_page(db.posts, {"post_type": "reel"}, limit, cursor, skip)
     
-    # Enrich with user data
-    for reel in reels:
-        reel_user = await db.users.find_one({"id": reel['user_id']}, {"_id": 0, "password_hash": 0})
-        reel['user'] = reel_user
+    await hydrate_posts(reels, user.id)
+    embed_user_fragments(reels)
     
-    return {"reels": reels}
+    return FastJSONResponse({"reels": reels, "next_cursor": next_cursor})
 
 @api_router.get("/posts/{post_id}")
 async def get_post(post_id: str, authorization: str = Query(None)):
-    user = await get_current_user(authorization)
+    user = await get_current_identity(authorization)
     if not user:
         raise HTTPException(status_code=401, detail="Not authenticated")
     
@@ -634,11 +2795,32 @@ async def get_post(post_id: str, authorization: str = Query(None)):
     if not post:
         raise HTTPException(status_code=404, detail="Post not found")
     
-    # Get user data
-    post_user = await db.users.find_one({"id": post['user_id']}, {"_id": 0, "password_hash": 0})
-    post['user'] = post_user
+    await hydrate_posts([post], user.id)
+    embed_user_fragments([post])
     
-    return post
+    return FastJSONResponse(post)
+
+@api_router.delete("/posts/{post_id}")
+async def delete_post(post_id: str, authorization: str = Query(None)):
+    user = await get_current_identity(authorization)
+    if not user:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    
+    post = await db.posts.find_one_and_delete(
+        {"id": post_id, "user_id": user.id},
+        projection={"_id": 0, "media_urls": 1}
+    )
+    if not post:
+        raise HTTPException(status_code=404, detail="Post not found")
+    
+    await asyncio.gather(
+        db.reactions.delete_many({"post_id": post_id}),
+        db.comments.delete_many({"post_id": post_id}),
+        db.timelines.delete_many({"post_id": post_id}),
+        release_media(post.get('media_urls', []))
+    )
+    
+    return {"success": True}
 
 # Reaction Routes
 @api_router.post("/reactions/{post_id}")
@@ -647,30 +2829,53 @@ async def add_reaction(
     reaction_type: str = Form(...),
     authorization: str = Query(None)
 ):
-    user = await get_current_user(authorization)
+    user = await get_current_identity(authorization)
     if not user:
         raise HTTPException(status_code=401, detail="Not authenticated")
+    if reaction_type not in REACTION_TYPES:
+        raise HTTPException(status_code=400, detail=f"reaction_type must be one of {', '.join(REACTION_TYPES)}")
     
-    # Remove existing reaction
-    await db.reactions.delete_one({"post_id": post_id, "user_id": user.id})
-    
-    # Add new reaction
+    # Upsert so switching type is a single write; the previous document
+    # tells us which counters to move.
     reaction = Reaction(
         post_id=post_id,
         user_id=user.id,
         reaction_type=reaction_type
     )
     
-    doc = reaction.model_dump()
-    doc['created_at'] = doc['created_at'].isoformat()
-    await db.reactions.insert_one(doc)
+    previous = await db.reactions.find_one_and_update(
+        {"post_id": post_id, "user_id": user.id},
+        {
+            "$set": {"reaction_type": reaction_type, "created_at": reaction.created_at},
+            "$setOnInsert": {"id": reaction.id}
+        },
+        projection={"_id": 0, "reaction_type": 1},
+        upsert=True,
+        return_document=ReturnDocument.BEFORE
+    )
+    
+    counter_delta = {}
+    if not previous:
+        counter_delta[f"reaction_counts.{reaction_type}"] = 1
+    elif previous['reaction_type'] != reaction_type:
+        counter_delta[f"reaction_counts.{reaction_type}"] = 1
+        counter_delta[f"reaction_counts.{previous['reaction_type']}"] = -1
+    
+    if counter_delta:
+        post = await db.posts.find_one_and_update(
+            {"id": post_id},
+            {"$inc": counter_delta},
+            projection={"_id": 0, "user_id": 1}
+        )
+    else:
+        post = await db.posts.find_one({"id": post_id}, {"_id": 0, "user_id": 1})
     
     # Notify post owner
-    post = await db.posts.find_one({"id": post_id})
     if post and post['user_id'] != user.id:
-        await create_notification(
+        create_notification(
             post['user_id'],
             "reaction",
+            user,
             f"{user.name} reacted {reaction_type} to your post",
             f"/post/{post_id}"
         )
@@ -679,11 +2884,19 @@ async def add_reaction(
 
 @api_router.delete("/reactions/{post_id}")
 async def remove_reaction(post_id: str, authorization: str = Query(None)):
-    user = await get_current_user(authorization)
+    user = await get_current_identity(authorization)
     if not user:
         raise HTTPException(status_code=401, detail="Not authenticated")
     
-    await db.reactions.delete_one({"post_id": post_id, "user_id": user.id})
+    removed = await db.reactions.find_one_and_delete(
+        {"post_id": post_id, "user_id": user.id},
+        projection={"_id": 0, "reaction_type": 1}
+    )
+    if removed:
+        await db.posts.update_one(
+            {"id": post_id},
+            {"$inc": {f"reaction_counts.{removed['reaction_type']}": -1}}
+        )
     
     return {"success": True}
 
@@ -695,7 +2908,7 @@ async def add_comment(
     parent_comment_id: Optional[str] = Form(None),
     authorization: str = Query(None)
 ):
-    user = await get_current_user(authorization)
+    user = await get_current_identity(authorization)
     if not user:
         raise HTTPException(status_code=401, detail="Not authenticated")
     
@@ -706,16 +2919,20 @@ async def add_comment(
         content=content
     )
     
-    doc = comment.model_dump()
-    doc['created_at'] = doc['created_at'].isoformat()
+    doc = to_document(comment)
     await db.comments.insert_one(doc)
     
     # Notify post owner
-    post = await db.posts.find_one({"id": post_id})
+    post = await db.posts.find_one_and_update(
+        {"id": post_id},
+        {"$inc": {"comment_count": 1}},
+        projection={"_id": 0, "user_id": 1}
+    )
     if post and post['user_id'] != user.id:
-        await create_notification(
+        create_notification(
             post['user_id'],
             "comment",
+            user,
             f"{user.name} commented on your post",
             f"/post/{post_id}"
         )
@@ -723,105 +2940,192 @@ async def add_comment(
     return {"success": True, "comment": doc}
 
 @api_router.get("/comments/{post_id}")
-async def get_comments(post_id: str, authorization: str = Query(None)):
-    user = await get_current_user(authorization)
+async def get_comments(
+    post_id: str,
+    authorization: str = Query(None),
+    cursor: Optional[str] = Query(None),
+    limit: int = Query(100)
+):
+    user = await get_current_identity(authorization)
     if not user:
         raise HTTPException(status_code=401, detail="Not authenticated")
     
-    comments = await db.comments.find({"post_id": post_id}, {"_id": 0}).sort("created_at", 1).to_list(1000)
+    comments, next_cursor = await find_page(db.comments, {"post_id": post_id}, limit, cursor, descending=False)
     
-    # Enrich with user data
-    for comment in comments:
-        comment_user = await db.users.find_one({"id": comment['user_id']}, {"_id": 0, "password_hash": 0})
-        comment['user'] = comment_user
+    await attach_users(comments)
+    embed_user_fragments(comments)
     
-    return {"comments": comments}
+    return FastJSONResponse({"comments": comments, "next_cursor": next_cursor})
 
 # Story Routes
+# A viewer's ring is every active story by the people they follow (and
+# their own), grouped by author, newest author first. Rings are cached per
+# viewer together with the followed ids, so a new story can drop exactly the
+# rings of the author's followers.
+async def build_story_ring(viewer_id: str) -> dict:
+    following_ids = [viewer_id]
+    async for connection in db.connections.find({"user_id": viewer_id}, {"_id": 0, "target_user_id": 1}):
+        following_ids.append(connection['target_user_id'])
+    
+    now = datetime.now(timezone.utc)
+    pipeline = [
+        {"$match": {"user_id": {"$in": following_ids}, "expires_at": {"$gt": now}}},
+        {"$sort": {"created_at": -1}},
+        {"$project": {"_id": 0}},
+        {"$group": {
+            "_id": "$user_id",
+            "stories": {"$push": "$$ROOT"},
+            "latest": {"$max": "$created_at"},
+            "expires_at": {"$min": "$expires_at"}
+        }},
+        {"$sort": {"latest": -1}},
+        {"$lookup": {
+            "from": "users",
+            "localField": "_id",
+            "foreignField": "id",
+            "pipeline": [{"$project": USER_SUMMARY_PROJECTION}],
+            "as": "user"
+        }},
+        {"$unwind": "$user"}
+    ]
+    user_stories = []
+    next_expiry = None
+    async for group in db.stories.aggregate(pipeline):
+        user = user_summary(group['user'])
+        for story in group['stories']:
+            story['media_url'] = pick_variant(story['media_url'], story.get('media_variants'), 'large')
+        user_stories.append({"user": user_fragment(user), "stories": group['stories']})
+        expires_at = as_utc(group['expires_at'])
+        next_expiry = expires_at if next_expiry is None else min(next_expiry, expires_at)
+    
+    return {"user_stories": user_stories, "following": set(following_ids), "next_expiry": next_expiry}
+
+def invalidate_story_rings(author_id: str) -> int:
+    return story_ring_cache.discard_where(lambda viewer_id, ring: author_id in ring['following'])
+
 @api_router.post("/stories")
 async def create_story(
     authorization: str = Query(None),
     file: UploadFile = File(...)
 ):
-    user = await get_current_user(authorization)
+    user = await get_current_identity(authorization)
     if not user:
         raise HTTPException(status_code=401, detail="Not authenticated")
     
-    media_url = await save_upload_file(file, "stories")
+    upload = await stream_upload(file, "stories")
     
     story = Story(
         user_id=user.id,
-        media_url=media_url,
+        media_url=upload.url,
+        media_variants=upload.variants,
         media_type=file.content_type,
         expires_at=datetime.now(timezone.utc) + timedelta(hours=24)
     )
     
-    doc = story.model_dump()
-    doc['created_at'] = doc['created_at'].isoformat()
-    doc['expires_at'] = doc['expires_at'].isoformat()
-    await db.stories.insert_one(doc)
+    doc = to_document(story)
+    await db.stories.insert_one(dict(doc))
+    invalidate_story_rings(user.id)
     
     return {"success": True, "story": doc}
 
 @api_router.get("/stories")
 async def get_stories(authorization: str = Query(None)):
-    user = await get_current_user(authorization)
+    user = await get_current_identity(authorization)
     if not user:
         raise HTTPException(status_code=401, detail="Not authenticated")
     
-    # Get following users
-    connections = await db.connections.find({"user_id": user.id}, {"_id": 0}).to_list(1000)
-    following_ids = [c['target_user_id'] for c in connections]
-    following_ids.append(user.id)
+    ring = story_ring_cache.get(user.id)
+    if ring is None:
+        ring = await build_story_ring(user.id)
+        # Never serve a ring past its first story's expiry
+        ttl = None
+        if ring['next_expiry']:
+            ttl = (ring['next_expiry'] - datetime.now(timezone.utc)).total_seconds()
+        story_ring_cache.set(user.id, ring, ttl)
     
-    # Get active stories
-    now = datetime.now(timezone.utc).isoformat()
-    stories = await db.stories.find(
-        {"user_id": {"$in": following_ids}, "expires_at": {"$gt": now}},
-        {"_id": 0}
-    ).sort("created_at", -1).to_list(1000)
-    
-    # Group by user
-    user_stories = {}
-    for story in stories:
-        if story['user_id'] not in user_stories:
-            story_user = await db.users.find_one({"id": story['user_id']}, {"_id": 0, "password_hash": 0})
-            user_stories[story['user_id']] = {
-                "user": story_user,
-                "stories": []
-            }
-        user_stories[story['user_id']]['stories'].append(story)
-    
-    return {"user_stories": list(user_stories.values())}
+    return FastJSONResponse({"user_stories": ring['user_stories']})
 
 # Notification Routes
 @api_router.get("/notifications")
-async def get_notifications(authorization: str = Query(None)):
-    user = await get_current_user(authorization)
+async def get_notifications(
+    authorization: str = Query(None),
+    cursor: Optional[str] = Query(None),
+    limit: int = Query(50)
+):
+    user = await get_current_identity(authorization)
     if not user:
         raise HTTPException(status_code=401, detail="Not authenticated")
     
-    notifications = await db.notifications.find(
-        {"user_id": user.id},
-        {"_id": 0}
-    ).sort("created_at", -1).limit(50).to_list(50)
+    notifications, next_cursor = await find_page(db.notifications, {"user_id": user.id}, limit, cursor)
+    # Newest item on the page; pass it to PUT /notifications/read to mark
+    # read exactly what was shown
+    head_cursor = encode_cursor(notifications[0]['created_at'], notifications[0]['id']) if notifications else None
+    
+    return FastJSONResponse({"notifications": notifications, "next_cursor": next_cursor, "head_cursor": head_cursor})
+
+@api_router.get("/notifications/unread-count")
+async def get_notification_unread_count(authorization: str = Query(None)):
+    user = await get_current_identity(authorization)
+    if not user:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    
+    return {"unread": await get_unread_count(user.id)}
+
+# Marks everything at or older than the cursor read (all when no cursor)
+@api_router.put("/notifications/read")
+async def mark_notifications_read(
+    authorization: str = Query(None),
+    cursor: Optional[str] = Query(None)
+):
+    user = await get_current_identity(authorization)
+    if not user:
+        raise HTTPException(status_code=401, detail="Not authenticated")
     
-    return {"notifications": notifications}
+    query = {"user_id": user.id, "read": False}
+    if cursor:
+        created_at, notification_id = decode_cursor(cursor)
+        query["$or"] = [
+            {"created_at": {"$lt": created_at}},
+            {"created_at": created_at, "id": {"$lte": notification_id}}
+        ]
+    result = await db.notifications.update_many(query, {"$set": {"read": True}})
+    await adjust_unread_counts({user.id: -result.modified_count})
+    
+    return {"success": True, "marked": result.modified_count}
 
 @api_router.put("/notifications/{notification_id}/read")
 async def mark_notification_read(notification_id: str, authorization: str = Query(None)):
-    user = await get_current_user(authorization)
+    user = await get_current_identity(authorization)
     if not user:
         raise HTTPException(status_code=401, detail="Not authenticated")
     
-    await db.notifications.update_one(
-        {"id": notification_id, "user_id": user.id},
+    result = await db.notifications.update_one(
+        {"id": notification_id, "user_id": user.id, "read": False},
         {"$set": {"read": True}}
     )
+    await adjust_unread_counts({user.id: -result.modified_count})
     
     return {"success": True}
 
 # Message Routes
+CONVERSATION_PREVIEW_LENGTH = 200
+
+async def get_conversation_participants(conversation_id: str) -> List[str]:
+    participants = conversation_cache.get(conversation_id)
+    if participants is None:
+        conversation = await db.conversations.find_one({"id": conversation_id}, {"_id": 0, "participants": 1})
+        if not conversation:
+            raise HTTPException(status_code=404, detail="Conversation not found")
+        participants = list(dict.fromkeys(conversation['participants']))
+        conversation_cache.set(conversation_id, participants)
+    return participants
+
+async def require_participant(conversation_id: str, user_id: str) -> List[str]:
+    participants = await get_conversation_participants(conversation_id)
+    if user_id not in participants:
+        raise HTTPException(status_code=403, detail="Not a participant in this conversation")
+    return participants
+
 @api_router.post("/conversations")
 async def create_conversation(
     participant_ids: List[str] = Form(...),
@@ -829,7 +3133,7 @@ async def create_conversation(
     name: Optional[str] = Form(None),
     authorization: str = Query(None)
 ):
-    user = await get_current_user(authorization)
+    user = await get_current_identity(authorization)
     if not user:
         raise HTTPException(status_code=401, detail="Not authenticated")
     
@@ -850,38 +3154,86 @@ async def create_conversation(
         name=name
     )
     
-    doc = conversation.model_dump()
-    doc['created_at'] = doc['created_at'].isoformat()
+    doc = to_document(conversation)
+    doc['last_activity_at'] = doc['created_at']
     await db.conversations.insert_one(doc)
+    conversation_cache.set(conversation.id, list(dict.fromkeys(participants)))
     
     return {"conversation_id": conversation.id}
 
+# Inbox, most recently active first
 @api_router.get("/conversations")
-async def get_conversations(authorization: str = Query(None)):
-    user = await get_current_user(authorization)
+async def get_conversations(
+    authorization: str = Query(None),
+    cursor: Optional[str] = Query(None),
+    limit: int = Query(30)
+):
+    user = await get_current_identity(authorization)
     if not user:
         raise HTTPException(status_code=401, detail="Not authenticated")
     
-    conversations = await db.conversations.find(
-        {"participants": user.id},
-        {"_id": 0}
-    ).sort("created_at", -1).to_list(100)
+    conversations, next_cursor = await find_page(
+        db.conversations, {"participants": user.id}, limit, cursor, time_field='last_activity_at'
+    )
     
-    # Enrich with participant data and last message
+    # One user lookup for every participant on the page
+    users = await fetch_users_by_id(pid for conv in conversations for pid in conv['participants'])
     for conv in conversations:
-        participants = await db.users.find(
-            {"id": {"$in": conv['participants']}},
-            {"_id": 0, "password_hash": 0}
-        ).to_list(100)
-        conv['participant_users'] = participants
-        
-        last_message = await db.messages.find_one(
-            {"conversation_id": conv['id']},
-            {"_id": 0}
-        ).sort("created_at", -1)
-        conv['last_message'] = last_message
+        conv['participant_users'] = [user_fragment(users[pid]) for pid in conv['participants'] if pid in users]
+        conv['unread_count'] = conv.pop('unread_counts', {}).get(user.id, 0)
     
-    return {"conversations": conversations}
+    return FastJSONResponse({"conversations": conversations, "next_cursor": next_cursor})
+
+# Read receipt: marks every message from others at or before the cursor
+# (all of them when no cursor) read by the viewer in one update
+@api_router.put("/conversations/{conversation_id}/read")
+async def mark_conversation_read(
+    conversation_id: str,
+    authorization: str = Query(None),
+    cursor: Optional[str] = Query(None)
+):
+    user = await get_current_identity(authorization)
+    if not user:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    
+    participants = await require_participant(conversation_id, user.id)
+    
+    query = {"conversation_id": conversation_id, "sender_id": {"$ne": user.id}, "read_by": {"$ne": user.id}}
+    up_to = None
+    if cursor:
+        created_at, message_id = decode_cursor(cursor)
+        up_to = {"created_at": created_at, "id": message_id}
+        query["$or"] = [
+            {"created_at": {"$lt": created_at}},
+            {"created_at": created_at, "id": {"$lte": message_id}}
+        ]
+    result = await db.messages.update_many(query, {"$addToSet": {"read_by": user.id}, "$set": {"read": True}})
+    
+    # Whatever arrived after the cursor is still unread
+    unread = 0
+    if cursor:
+        unread = await db.messages.count_documents({
+            "conversation_id": conversation_id,
+            "sender_id": {"$ne": user.id},
+            "read_by": {"$ne": user.id}
+        })
+    await db.conversations.update_one(
+        {"id": conversation_id},
+        {"$set": {f"unread_counts.{user.id}": unread}}
+    )
+    
+    if result.modified_count:
+        await manager.send_many(
+            [pid for pid in participants if pid != user.id],
+            {'type': 'read_receipt', 'data': {
+                'conversation_id': conversation_id,
+                'user_id': user.id,
+                'up_to': up_to,
+                'read_at': datetime.now(timezone.utc)
+            }}
+        )
+    
+    return {"success": True, "marked": result.modified_count, "unread": unread}
 
 @api_router.post("/messages/{conversation_id}")
 async def send_message(
@@ -889,66 +3241,131 @@ async def send_message(
     content: str = Form(...),
     authorization: str = Query(None)
 ):
-    user = await get_current_user(authorization)
+    user = await get_current_identity(authorization)
     if not user:
         raise HTTPException(status_code=401, detail="Not authenticated")
     
+    participants = await require_participant(conversation_id, user.id)
+    
     message = Message(
         conversation_id=conversation_id,
         sender_id=user.id,
         content=content
     )
     
-    doc = message.model_dump()
-    doc['created_at'] = doc['created_at'].isoformat()
-    await db.messages.insert_one(doc)
+    doc = to_document(message)
+    
+    # Denormalized inbox state: preview, activity time and unread counters
+    recipients = [pid for pid in participants if pid != user.id]
+    update = {"$set": {
+        "last_message": {
+            "id": doc['id'],
+            "sender_id": user.id,
+            "content": content[:CONVERSATION_PREVIEW_LENGTH],
+            "created_at": doc['created_at']
+        },
+        "last_activity_at": doc['created_at']
+    }}
+    if recipients:
+        update["$inc"] = {f"unread_counts.{pid}": 1 for pid in recipients}
+    # insert_one adds an ObjectId _id to what it is given, so insert a copy
+    await asyncio.gather(
+        db.messages.insert_one(dict(doc)),
+        db.conversations.update_one({"id": conversation_id}, update)
+    )
     
-    # Get conversation participants
-    conversation = await db.conversations.find_one({"id": conversation_id})
-    if conversation:
-        for participant_id in conversation['participants']:
-            if participant_id != user.id:
-                await manager.send_message(participant_id, {
-                    'type': 'message',
-                    'data': doc
-                })
+    # One hand-off for every recipient: local sockets are queued directly and
+    # a single bus publish covers the other workers
+    await manager.send_many(recipients, {'type': 'message', 'data': doc})
     
     return {"success": True, "message": doc}
 
+# History window: the latest messages by default, or up to `limit` messages
+# before/after a cursor. Messages are always returned oldest first;
+# before_cursor/after_cursor continue the window in either direction.
 @api_router.get("/messages/{conversation_id}")
-async def get_messages(conversation_id: str, authorization: str = Query(None)):
-    user = await get_current_user(authorization)
+async def get_messages(
+    conversation_id: str,
+    authorization: str = Query(None),
+    before: Optional[str] = Query(None),
+    after: Optional[str] = Query(None),
+    cursor: Optional[str] = Query(None),
+    limit: int = Query(50, ge=1, le=200)
+):
+    user = await get_current_identity(authorization)
     if not user:
         raise HTTPException(status_code=401, detail="Not authenticated")
     
-    messages = await db.messages.find(
-        {"conversation_id": conversation_id},
-        {"_id": 0}
-    ).sort("created_at", 1).to_list(1000)
+    await require_participant(conversation_id, user.id)
     
-    # Enrich with sender data
-    for msg in messages:
-        sender = await db.users.find_one({"id": msg['sender_id']}, {"_id": 0, "password_hash": 0})
-        msg['sender'] = sender
+    # `cursor` is the older name for `after`
+    after = after or cursor
+    forward = bool(after) and not before
+    messages, _ = await find_page(
+        db.messages, {"conversation_id": conversation_id}, limit, after if forward else before,
+        descending=not forward
+    )
+    if not forward:
+        messages.reverse()
+    
+    await attach_users(messages, 'sender_id', 'sender')
+    embed_user_fragments(messages, 'sender')
+    
+    window = {"before_cursor": None, "after_cursor": None, "has_more": len(messages) == limit}
+    if messages:
+        window["before_cursor"] = encode_cursor(messages[0]['created_at'], messages[0]['id'])
+        window["after_cursor"] = encode_cursor(messages[-1]['created_at'], messages[-1]['id'])
     
-    return {"messages": messages}
+    return FastJSONResponse({"messages": messages, **window})
 
 # Search Routes
 @api_router.get("/search/users")
-async def search_users(q: str = Query(...), authorization: str = Query(None)):
-    user = await get_current_user(authorization)
+async def search_users(q: str = Query(..., max_length=100), authorization: str = Query(None), limit: int = Query(20, ge=1, le=50)):
+    user = await get_current_identity(authorization)
     if not user:
         raise HTTPException(status_code=401, detail="Not authenticated")
     
-    users = await db.users.find(
-        {"$or": [
-            {"name": {"$regex": q, "$options": "i"}},
-            {"email": {"$regex": q, "$options": "i"}}
-        ]},
-        {"_id": 0, "password_hash": 0}
-    ).limit(20).to_list(20)
+    users = await search_user_index(q, user.id, limit)
+    
+    return FastJSONResponse({"users": users})
+
+# Hashtag Routes
+@api_router.get("/hashtags/trending")
+async def get_trending_hashtags(
+    authorization: str = Query(None),
+    window: str = Query("24h"),
+    limit: int = Query(10, ge=1, le=50)
+):
+    user = await get_current_identity(authorization)
+    if not user:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    if window not in TRENDING_WINDOWS:
+        raise HTTPException(status_code=400, detail=f"window must be one of {', '.join(TRENDING_WINDOWS)}")
+    
+    hashtags = trending_cache.get((window, limit))
+    if hashtags is None:
+        hashtags = trending_tags.top(TRENDING_WINDOWS[window], limit)
+        trending_cache.set((window, limit), hashtags)
+    
+    return {"window": window, "hashtags": hashtags}
+
+@api_router.get("/hashtags/{tag}/posts")
+async def get_hashtag_posts(
+    tag: str,
+    authorization: str = Query(None),
+    cursor: Optional[str] = Query(None),
+    limit: int = Query(20, ge=1, le=50)
+):
+    user = await get_current_identity(authorization)
+    if not user:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    
+    posts, next_cursor = await find_page(db.posts, {"hashtags": normalize_hashtag(tag)}, limit, cursor)
+    
+    await hydrate_posts(posts, user.id)
+    embed_user_fragments(posts)
     
-    return {"users": users}
+    return FastJSONResponse({"tag": normalize_hashtag(tag), "posts": posts, "next_cursor": next_cursor})
 
 # Group Routes
 @api_router.post("/groups")
@@ -958,7 +3375,7 @@ async def create_group(
     group_type: str = Form("public"),
     authorization: str = Query(None)
 ):
-    user = await get_current_user(authorization)
+    user = await get_current_identity(authorization)
     if not user:
         raise HTTPException(status_code=401, detail="Not authenticated")
     
@@ -969,8 +3386,7 @@ async def create_group(
         admin_user_ids=[user.id]
     )
     
-    doc = group.model_dump()
-    doc['created_at'] = doc['created_at'].isoformat()
+    doc = to_document(group)
     await db.groups.insert_one(doc)
     
     # Add creator as member
@@ -978,14 +3394,14 @@ async def create_group(
         "group_id": group.id,
         "user_id": user.id,
         "role": "admin",
-        "joined_at": datetime.now(timezone.utc).isoformat()
+        "joined_at": datetime.now(timezone.utc)
     })
     
     return {"success": True, "group": doc}
 
 @api_router.get("/groups")
 async def get_groups(authorization: str = Query(None)):
-    user = await get_current_user(authorization)
+    user = await get_current_identity(authorization)
     if not user:
         raise HTTPException(status_code=401, detail="Not authenticated")
     
@@ -1006,33 +3422,31 @@ async def create_marketplace_item(
     authorization: str = Query(None),
     files: List[UploadFile] = File(None)
 ):
-    user = await get_current_user(authorization)
+    user = await get_current_identity(authorization)
     if not user:
         raise HTTPException(status_code=401, detail="Not authenticated")
     
-    images = []
+    uploads = []
     if files:
-        for file in files:
-            url = await save_upload_file(file, "marketplace")
-            images.append(url)
+        uploads = await save_upload_files(files, "marketplace")
     
     item = MarketplaceItem(
         user_id=user.id,
         title=title,
         description=description,
         price=price,
-        images=images
+        images=[upload.url for upload in uploads],
+        image_variants=[upload.variants for upload in uploads]
     )
     
-    doc = item.model_dump()
-    doc['created_at'] = doc['created_at'].isoformat()
+    doc = to_document(item)
     await db.marketplace_items.insert_one(doc)
     
     return {"success": True, "item": doc}
 
 @api_router.get("/marketplace")
 async def get_marketplace_items(authorization: str = Query(None)):
-    user = await get_current_user(authorization)
+    user = await get_current_identity(authorization)
     if not user:
         raise HTTPException(status_code=401, detail="Not authenticated")
     
@@ -1041,12 +3455,29 @@ async def get_marketplace_items(authorization: str = Query(None)):
         {"_id": 0}
     ).sort("created_at", -1).limit(50).to_list(50)
     
-    # Enrich with user data
+    await attach_users(items, 'user_id', 'seller')
+    embed_user_fragments(items, 'seller')
     for item in items:
-        seller = await db.users.find_one({"id": item['user_id']}, {"_id": 0, "password_hash": 0})
-        item['seller'] = seller
+        item['images'] = pick_variants(item['images'], item.get('image_variants'), 'small')
     
-    return {"items": items}
+    return FastJSONResponse({"items": items})
+
+@api_router.delete("/marketplace/{item_id}")
+async def delete_marketplace_item(item_id: str, authorization: str = Query(None)):
+    user = await get_current_identity(authorization)
+    if not user:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    
+    item = await db.marketplace_items.find_one_and_delete(
+        {"id": item_id, "user_id": user.id},
+        projection={"_id": 0, "images": 1}
+    )
+    if not item:
+        raise HTTPException(status_code=404, detail="Item not found")
+    
+    await release_media(item.get('images', []))
+    
+    return {"success": True}
 
 # Event Routes
 @api_router.post("/events")
@@ -1057,7 +3488,7 @@ async def create_event(
     location: str = Form(...),
     authorization: str = Query(None)
 ):
-    user = await get_current_user(authorization)
+    user = await get_current_identity(authorization)
     if not user:
         raise HTTPException(status_code=401, detail="Not authenticated")
     
@@ -1069,20 +3500,18 @@ async def create_event(
         location=location
     )
     
-    doc = event.model_dump()
-    doc['created_at'] = doc['created_at'].isoformat()
-    doc['event_date'] = doc['event_date'].isoformat()
+    doc = to_document(event)
     await db.events.insert_one(doc)
     
     return {"success": True, "event": doc}
 
 @api_router.get("/events")
 async def get_events(authorization: str = Query(None)):
-    user = await get_current_user(authorization)
+    user = await get_current_identity(authorization)
     if not user:
         raise HTTPException(status_code=401, detail="Not authenticated")
     
-    now = datetime.now(timezone.utc).isoformat()
+    now = datetime.now(timezone.utc)
     events = await db.events.find(
         {"event_date": {"$gte": now}},
         {"_id": 0}
@@ -1098,7 +3527,7 @@ async def create_job_profile(
     authorization: str = Query(None),
     resume: Optional[UploadFile] = File(None)
 ):
-    user = await get_current_user(authorization)
+    user = await get_current_identity(authorization)
     if not user:
         raise HTTPException(status_code=401, detail="Not authenticated")
     
@@ -1113,8 +3542,7 @@ async def create_job_profile(
         resume_url=resume_url
     )
     
-    doc = profile.model_dump()
-    doc['created_at'] = doc['created_at'].isoformat()
+    doc = to_document(profile)
     await db.job_profiles.insert_one(doc)
     
     return {"success": True, "profile": doc}
@@ -1128,7 +3556,7 @@ async def create_job_post(
     salary_range: Optional[str] = Form(None),
     authorization: str = Query(None)
 ):
-    user = await get_current_user(authorization)
+    user = await get_current_identity(authorization)
     if not user:
         raise HTTPException(status_code=401, detail="Not authenticated")
     
@@ -1141,15 +3569,14 @@ async def create_job_post(
         salary_range=salary_range
     )
     
-    doc = job_post.model_dump()
-    doc['created_at'] = doc['created_at'].isoformat()
+    doc = to_document(job_post)
     await db.job_posts.insert_one(doc)
     
     return {"success": True, "job_post": doc}
 
 @api_router.get("/jobs/posts")
 async def get_job_posts(authorization: str = Query(None)):
-    user = await get_current_user(authorization)
+    user = await get_current_identity(authorization)
     if not user:
         raise HTTPException(status_code=401, detail="Not authenticated")
     
@@ -1160,23 +3587,52 @@ async def get_job_posts(authorization: str = Query(None)):
     
     return {"job_posts": job_posts}
 
+# Metrics
+@api_router.get("/metrics")
+async def get_metrics(authorization: str = Query(None)):
+    user = await get_current_identity(authorization)
+    if not user:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    
+    return {
+        "auth_cache": auth_cache.stats(),
+        "conversation_cache": conversation_cache.stats(),
+        "story_ring_cache": story_ring_cache.stats(),
+        "user_summary_cache": user_summary_cache.stats(),
+        "user_fragment_cache": user_fragment_cache.stats(),
+        "password_hasher": password_hasher.stats(),
+        "oauth_upstream": oauth_breaker.stats(),
+        "media": media_metrics,
+        "websockets": manager.stats(),
+        "notifications": notification_pipeline.stats()
+    }
+
 # WebSocket endpoint
 @app.websocket("/ws/{user_id}")
 async def websocket_endpoint(websocket: WebSocket, user_id: str):
-    await manager.connect(user_id, websocket)
+    connection = await manager.connect(user_id, websocket)
+    heartbeat = asyncio.create_task(manager.heartbeat(connection))
     try:
+        # Any client frame (including replies to pings) counts as liveness
         while True:
-            data = await websocket.receive_text()
-            # Keep connection alive
-    except WebSocketDisconnect:
-        manager.disconnect(user_id)
+            await websocket.receive_text()
+            connection.last_seen = time.monotonic()
+    except (WebSocketDisconnect, RuntimeError):
+        # RuntimeError: the socket was already closed server-side
+        pass
+    finally:
+        heartbeat.cancel()
+        manager.disconnect(connection)
 
 # Static files
-app.mount("/uploads", StaticFiles(directory="/app/backend/uploads"), name="uploads")
+UPLOAD_ROOT.mkdir(parents=True, exist_ok=True)
+app.mount("/uploads", MediaFiles(UPLOAD_ROOT), name="uploads")
 
 # Include router
 app.include_router(api_router)
 
+app.add_middleware(RequestSizeLimitMiddleware, max_bytes=MAX_UPLOAD_REQUEST_BYTES)
+
 # CORS
 app.add_middleware(
     CORSMiddleware,
@@ -1192,6 +3648,52 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+@app.on_event("startup")
+async def provision_indexes():
+    await ensure_indexes()
+    for collection_name, status in (await index_report()).items():
+        if status['missing']:
+            logger.warning(f"{collection_name}: missing indexes {', '.join(status['missing'])}")
+        if status['undeclared']:
+            logger.info(f"{collection_name}: undeclared indexes {', '.join(status['undeclared'])}")
+        if status['unused']:
+            logger.info(f"{collection_name}: indexes unused since last restart {', '.join(status['unused'])}")
+
+@app.on_event("startup")
+async def start_realtime_bus():
+    await manager.bus.start(manager.deliver_local)
+
+_trending_refresh: Optional[asyncio.Task] = None
+
+@app.on_event("startup")
+async def start_trending_refresh():
+    global _trending_refresh
+    _trending_refresh = asyncio.create_task(refresh_trending_tags())
+
+@app.on_event("startup")
+async def start_notification_workers():
+    notification_pipeline.start()
+
+@app.on_event("shutdown")
+async def stop_notification_workers():
+    await notification_pipeline.stop()
+
+@app.on_event("shutdown")
+async def stop_trending_refresh():
+    if _trending_refresh is not None:
+        _trending_refresh.cancel()
+
+@app.on_event("shutdown")
+async def stop_realtime_bus():
+    await manager.bus.stop()
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
     client.close()
+
+@app.on_event("shutdown")
+async def shutdown_workers():
+    password_hasher.shutdown()
+    if _image_pool is not None:
+        _image_pool.shutdown(wait=False)
+    await http_client.aclose()
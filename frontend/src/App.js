@@ -1,4 +1,4 @@
-import { useEffect, useState } from 'react';
+import { useEffect, useRef, useState } from 'react';
 import { BrowserRouter, Routes, Route, Navigate } from 'react-router-dom';
 import { Toaster } from './components/ui/sonner';
 import { toast } from 'sonner';
@@ -40,7 +40,8 @@ api.interceptors.request.use(config => {
 function App() {
   const [user, setUser] = useState(null);
   const [loading, setLoading] = useState(true);
-  const [ws, setWs] = useState(null);
+  // The live socket; cleared on logout so its close doesn't reconnect
+  const wsRef = useRef(null);
 
   useEffect(() => {
     checkAuth();
@@ -86,27 +87,47 @@ function App() {
     setLoading(false);
   };
 
-  const connectWebSocket = (userId) => {
+  const connectWebSocket = (userId, attempt = 0) => {
     const wsUrl = `${BACKEND_URL.replace('https', 'wss').replace('http', 'ws')}/ws/${userId}`;
     const socket = new WebSocket(wsUrl);
     
+    socket.onopen = () => {
+      attempt = 0;
+    };
+    
     socket.onmessage = (event) => {
       const data = JSON.parse(event.data);
-      if (data.type === 'notification') {
-        toast.info(data.data.content);
+      if (data.type === 'ping') {
+        // The server closes sockets that stay silent past its idle timeout
+        socket.send(JSON.stringify({ type: 'pong', ts: data.ts }));
+      } else if (data.type === 'notifications') {
+        data.data.forEach((notification) => toast.info(notification.content));
       } else if (data.type === 'message') {
         toast('New message received');
       }
     };
     
-    setWs(socket);
+    socket.onclose = () => {
+      if (wsRef.current !== socket) return;
+      // Reconnect with capped exponential backoff
+      const delay = Math.min(30000, 1000 * 2 ** attempt);
+      setTimeout(() => {
+        if (wsRef.current === socket) {
+          connectWebSocket(userId, attempt + 1);
+        }
+      }, delay);
+    };
+    
+    wsRef.current = socket;
   };
 
   const handleLogout = () => {
     localStorage.removeItem('token');
     setUser(null);
-    if (ws) {
-      ws.close();
+    if (wsRef.current) {
+      const socket = wsRef.current;
+      wsRef.current = null;
+      socket.close();
     }
     toast.success('Logged out successfully');
   };
@@ -18,6 +18,10 @@ export default function Notifications({ user, onLogout }) {
     try {
       const response = await api.get('/notifications');
       setNotifications(response.data.notifications);
+      // Only what was shown is marked read; newer arrivals stay unread
+      if (response.data.head_cursor) {
+        api.put('/notifications/read', null, { params: { cursor: response.data.head_cursor } }).catch(() => {});
+      }
     } catch (error) {
       toast.error('Failed to load notifications');
     } finally {
@@ -0,0 +1,46 @@
+import os
+import sys
+import tempfile
+import uuid
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+# Set before server is imported; backend/.env does not override these
+os.environ.setdefault('MONGO_URL', 'mongodb://localhost:27017')
+os.environ['DB_NAME'] = f"test_{uuid.uuid4().hex[:8]}"
+os.environ.setdefault('UPLOAD_DIR', tempfile.mkdtemp(prefix="uploads-"))
+
+import server  # noqa: E402
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture(scope="session")
+def mongo_info():
+    from pymongo import MongoClient
+    from pymongo.errors import PyMongoError
+
+    probe = MongoClient(os.environ['MONGO_URL'], serverSelectionTimeoutMS=1000)
+    try:
+        return probe.admin.command("hello")
+    except PyMongoError:
+        pytest.skip("no mongod available")
+    finally:
+        probe.close()
+
+
+# The app's own client and database, dropped after each test
+@pytest.fixture
+async def db(mongo_info):
+    yield server.db
+    await server.client.drop_database(os.environ['DB_NAME'])
+
+
+@pytest.fixture
+def token():
+    return server.create_jwt_token("test-user", "Test User")
@@ -0,0 +1,58 @@
+import anyio
+import pytest
+
+import server
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(server.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = server.LRUCache(2, 60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert (cache.get("a"), cache.get("c")) == (1, 3)
+    assert cache.stats()["evictions"] == 1
+
+
+def test_entries_expire_after_their_ttl(clock):
+    cache = server.LRUCache(10, 60)
+    cache.set("a", 1)
+    cache.set("b", 2, ttl=5)
+    clock[0] += 10
+    assert cache.get("a") == 1
+    assert cache.get("b") is None
+    clock[0] += 60
+    assert cache.get("a") is None
+
+
+def test_per_entry_ttl_cannot_exceed_the_cache_ttl(clock):
+    cache = server.LRUCache(10, 30)
+    cache.set("a", 1, ttl=3600)
+    cache.set("b", 2, ttl=0)
+    clock[0] += 31
+    assert cache.get("a") is None
+    assert cache.stats()["size"] == 0
+
+
+def test_discard_where_and_counters():
+    cache = server.LRUCache(10, 60)
+    for token, user_id in (("t1", "u1"), ("t2", "u1"), ("t3", "u2")):
+        cache.set(token, user_id)
+    assert cache.discard_where(lambda token, user_id: user_id == "u1") == 2
+    assert cache.get("t1") is None
+    assert cache.pop("t3") == "u2"
+    assert cache.stats() == {"size": 0, "maxsize": 10, "hits": 0, "misses": 1, "evictions": 0}
+
+
+def test_claims_only_tokens_authenticate_without_the_database():
+    token = server.create_jwt_token("u1", "Alice")
+    identity = anyio.run(server.get_current_identity, f"Bearer {token}")
+    assert (identity.id, identity.name) == ("u1", "Alice")
@@ -0,0 +1,112 @@
+"""Every endpoint query shape must be planned as an index scan.
+
+Provisions INDEX_SPECS in the test database and checks the winning plan of
+explain() for each query shape used by server.py.
+"""
+import os
+from datetime import datetime, timezone
+
+import pytest
+
+import server
+
+pytestmark = pytest.mark.anyio
+
+NOW = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+# (label, collection, filter, sort)
+QUERIES = [
+    ("get_current_user session", "user_sessions", {"session_token": "t"}, None),
+    ("get_current_user user", "users", {"id": "u"}, None),
+    ("login", "users", {"email": "a@b.c"}, None),
+    ("mention lookup", "users", {"name": "alice"}, None),
+    ("celebrities", "users", {"follower_count": {"$gte": 10000}}, None),
+    ("search_users", "users", {"search_prefixes": {"$all": ["jo", "sm"]}}, [("follower_count", -1)]),
+    ("search_users exact", "users", {"search_name": "jo smith"}, [("follower_count", -1)]),
+    ("search_users followed", "users", {"search_prefixes": {"$all": ["jo"]}, "id": {"$in": ["u", "v"]}},
+     [("follower_count", -1)]),
+    ("hydrate authors", "users", {"id": {"$in": ["u", "v"]}}, None),
+    ("get_post", "posts", {"id": "p"}, None),
+    ("get_reels", "posts", {"post_type": "reel"}, server.keyset_sort()),
+    ("hashtag posts", "posts", {"hashtags": "python"}, server.keyset_sort()),
+    ("hashtag counts", "hashtag_counts", {"hour": "2024-01-01T00"}, [("count", -1)]),
+    ("celebrity merge", "posts", {"user_id": {"$in": ["u"]}, "post_type": "regular"}, server.keyset_sort()),
+    ("viewer reactions", "reactions", {"post_id": {"$in": ["p"]}, "user_id": "u"}, None),
+    ("reaction counts", "reactions", {"post_id": {"$in": ["p"]}}, None),
+    ("get_comments", "comments", {"post_id": "p"}, server.keyset_sort(False)),
+    ("follow check", "connections", {"user_id": "u", "target_user_id": "v"}, None),
+    ("get_following", "connections", {"user_id": "u"}, server.keyset_sort()),
+    ("get_followers", "connections", {"target_user_id": "u"}, server.keyset_sort()),
+    ("read_timeline", "timelines", {"user_id": "u"}, server.keyset_sort(id_field='post_id')),
+    ("unfollow cleanup", "timelines", {"user_id": "u", "author_id": "v"}, None),
+    ("delete_post cleanup", "timelines", {"post_id": "p"}, None),
+    ("media by hash", "media", {"sha256": "h"}, None),
+    ("release_media", "media", {"url": "/uploads/media/h"}, None),
+    ("media gc", "media", {"ref_count": {"$lte": 0}, "last_acquired_at": {"$lt": NOW}}, None),
+    ("get_conversations", "conversations", {"participants": "u"}, server.keyset_sort(time_field='last_activity_at')),
+    ("direct conversation", "conversations", {"conversation_type": "direct", "participants": {"$all": ["u", "v"]}}, None),
+    ("get_messages", "messages", {"conversation_id": "c"}, server.keyset_sort(False)),
+    ("latest messages", "messages", {"conversation_id": "c"}, server.keyset_sort()),
+    ("read receipt", "messages", {"conversation_id": "c", "sender_id": {"$ne": "u"}, "read_by": {"$ne": "u"},
+                                  "created_at": {"$lt": NOW}}, None),
+    ("get_stories", "stories", {"user_id": {"$in": ["u"]}, "expires_at": {"$gt": NOW}}, None),
+    ("get_notifications", "notifications", {"user_id": "u"}, server.keyset_sort()),
+    ("mark_notification_read", "notifications", {"id": "n", "user_id": "u", "read": False}, None),
+    ("coalesce notifications", "notifications", {"user_id": "u", "type": "reaction", "link": "/post/p", "read": False}, None),
+    ("unread count seed", "notifications", {"user_id": "u", "read": False}, None),
+    ("mark_notifications_read", "notifications", {"user_id": "u", "read": False, "created_at": {"$lt": NOW}}, None),
+    ("unread counter", "notification_counters", {"user_id": "u"}, None),
+    ("get_groups memberships", "group_members", {"user_id": "u"}, None),
+    ("get_groups", "groups", {"id": {"$in": ["g"]}}, None),
+    ("delete_marketplace_item", "marketplace_items", {"id": "m", "user_id": "u"}, None),
+    ("get_marketplace_items", "marketplace_items", {"status": "active"}, [("created_at", -1)]),
+    ("get_events", "events", {"event_date": {"$gte": NOW}}, [("event_date", 1)]),
+    ("get_job_posts", "job_posts", {}, [("created_at", -1)]),
+]
+
+
+def plan_stages(plan):
+    yield plan.get('stage')
+    for key in ('inputStage', 'queryPlan'):
+        if key in plan:
+            yield from plan_stages(plan[key])
+    for child in plan.get('inputStages', []):
+        yield from plan_stages(child)
+
+
+# Provision once for the whole module
+@pytest.fixture(scope="module")
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture(scope="module")
+async def indexed_db(mongo_info):
+    await server.ensure_indexes()
+    yield server.db
+    await server.client.drop_database(os.environ['DB_NAME'])
+
+
+@pytest.mark.parametrize("label, collection, query, sort", QUERIES, ids=[q[0] for q in QUERIES])
+async def test_query_uses_an_index(indexed_db, label, collection, query, sort):
+    cursor = indexed_db[collection].find(query)
+    if sort:
+        cursor = cursor.sort(sort)
+    explain = await cursor.explain()
+    stages = set(plan_stages(explain['queryPlanner']['winningPlan']))
+    assert 'COLLSCAN' not in stages and 'IXSCAN' in stages, f"{collection}: {sorted(filter(None, stages))}"
+
+
+class UnprivilegedCollection:
+    async def index_information(self):
+        return {"_id_": {}, "id_unique": {}}
+
+    def aggregate(self, pipeline):
+        raise server.OperationFailure("not authorized to execute command $indexStats", code=13)
+
+
+async def test_index_report_survives_missing_index_stats_privilege(monkeypatch):
+    monkeypatch.setattr(server, "db", {name: UnprivilegedCollection() for name in server.INDEX_SPECS})
+    report = await server.index_report()
+    assert report["users"]["unused"] == []
+    assert "email_unique" in report["users"]["missing"]
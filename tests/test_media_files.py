@@ -0,0 +1,98 @@
+import pytest
+
+import server
+
+pytestmark = pytest.mark.anyio
+
+BODY = b"0123456789"
+
+
+@pytest.fixture
+def media(tmp_path):
+    (tmp_path / "media" / "ab").mkdir(parents=True)
+    (tmp_path / "media" / "ab" / "abcdef.txt").write_bytes(BODY)
+    (tmp_path / "tmp").mkdir()
+    (tmp_path / "tmp" / "upload.part").write_bytes(b"partial")
+    return server.MediaFiles(tmp_path)
+
+
+async def get(app, path, headers=None):
+    messages = []
+
+    async def send(message):
+        messages.append(message)
+
+    scope = {
+        "type": "http",
+        "method": "GET",
+        "path": path,
+        "headers": [(k.lower().encode(), v.encode()) for k, v in (headers or {}).items()]
+    }
+    await app.serve(scope, send)
+    start = messages[0]
+    body = b"".join(message.get("body", b"") for message in messages[1:])
+    return start["status"], {k.decode(): v.decode() for k, v in start["headers"]}, body
+
+
+@pytest.mark.parametrize("path", ["/tmp/upload.part", "/media/../tmp/upload.part", "/media/ab/../../tmp/upload.part"])
+async def test_partial_uploads_are_never_served(media, path):
+    status, _, _ = await get(media, path)
+    assert status == 404
+
+
+async def test_paths_outside_the_root_are_not_served(media):
+    status, _, _ = await get(media, "/media/../../etc/passwd")
+    assert status == 404
+
+
+async def test_content_addressed_files_are_served_with_a_strong_etag(media):
+    status, headers, body = await get(media, "/media/ab/abcdef.txt")
+    assert (status, body) == (200, BODY)
+    assert headers["etag"] == '"abcdef"'
+
+
+@pytest.mark.parametrize("if_none_match", ['"abcdef"', 'W/"abcdef"', '"other", W/"abcdef"', "*"])
+async def test_if_none_match_uses_weak_comparison(media, if_none_match):
+    status, _, body = await get(media, "/media/ab/abcdef.txt", {"If-None-Match": if_none_match})
+    assert (status, body) == (304, b"")
+
+
+async def test_range_requests(media):
+    status, headers, body = await get(media, "/media/ab/abcdef.txt", {"Range": "bytes=2-5"})
+    assert (status, body, headers["content-range"]) == (206, b"2345", "bytes 2-5/10")
+
+    status, _, body = await get(media, "/media/ab/abcdef.txt", {"Range": "bytes=-3"})
+    assert (status, body) == (206, b"789")
+
+
+async def test_invalid_range_is_ignored(media):
+    status, headers, body = await get(media, "/media/ab/abcdef.txt", {"Range": "bytes=8-2"})
+    assert (status, body) == (200, BODY)
+    assert "content-range" not in headers
+
+
+async def test_unsatisfiable_range_is_416(media):
+    status, headers, _ = await get(media, "/media/ab/abcdef.txt", {"Range": "bytes=10-"})
+    assert status == 416
+    assert headers["content-range"] == "bytes */10"
+
+
+@pytest.mark.parametrize("header, expected", [
+    ("bytes=0-0", (0, 0)),
+    ("bytes=5-", (5, 9)),
+    ("bytes=5-100", (5, 9)),
+    ("bytes=-4", (6, 9)),
+    ("bytes=-100", (0, 9)),
+    ("bytes=8-2", None),
+    ("bytes=0-1,4-5", None),
+    ("items=0-1", None),
+    ("bytes=-", None),
+])
+def test_parse_byte_range(header, expected):
+    assert server.parse_byte_range(header, 10) == expected
+
+
+@pytest.mark.parametrize("header", ["bytes=10-", "bytes=10-12", "bytes=-0"])
+def test_parse_byte_range_unsatisfiable(header):
+    with pytest.raises(server.RangeNotSatisfiable):
+        server.parse_byte_range(header, 10)
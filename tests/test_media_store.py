@@ -0,0 +1,96 @@
+import hashlib
+import io
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from PIL import Image
+
+import server
+
+pytestmark = pytest.mark.anyio
+
+
+def jpeg_with_gps() -> bytes:
+    exif = Image.Exif()
+    # GPSInfo: latitude 52°31'N
+    exif[0x8825] = {1: "N", 2: (52.0, 31.0, 0.0)}
+    buffer = io.BytesIO()
+    Image.new("RGB", (64, 48), "red").save(buffer, "JPEG", exif=exif)
+    return buffer.getvalue()
+
+
+async def store(data: bytes) -> server.StoredUpload:
+    partial = server.UPLOAD_ROOT / "tmp" / f"{uuid.uuid4().hex}.part"
+    partial.parent.mkdir(parents=True, exist_ok=True)
+    partial.write_bytes(data)
+    return await server.store_media(partial, hashlib.sha256(data).hexdigest(), len(data), ".jpg", "image/jpeg", "posts")
+
+
+def local_path(url: str):
+    return server.UPLOAD_ROOT / url.removeprefix("/uploads/")
+
+
+async def test_uploaded_images_are_served_from_the_stripped_render(db):
+    data = jpeg_with_gps()
+    sha256 = hashlib.sha256(data).hexdigest()
+    upload = await store(data)
+
+    assert upload.url == upload.variants['full']
+    with Image.open(local_path(upload.url)) as stored:
+        assert not stored.getexif().get_ifd(0x8825)
+    # The original, metadata and all, is not kept at any URL
+    assert not list(server.UPLOAD_ROOT.glob(f"media/*/{sha256}.jpg"))
+
+    again = await store(data)
+    assert again.url == upload.url
+    assert not list(server.UPLOAD_ROOT.glob(f"media/*/{sha256}.jpg"))
+    media = await db.media.find_one({"sha256": sha256})
+    assert media['ref_count'] == 2
+
+
+def test_render_drops_exif(tmp_path):
+    source = tmp_path / "source.jpg"
+    source.write_bytes(jpeg_with_gps())
+    rendered = server.render_image_variants(str(source), str(tmp_path / "out"), {"full": None}, "JPEG")
+    with Image.open(rendered['full']) as full:
+        assert not full.getexif()
+
+
+async def test_corrupt_images_are_rejected_and_not_recorded(db):
+    data = b"\xff\xd8\xff\xe0 not really a jpeg"
+    sha256 = hashlib.sha256(data).hexdigest()
+    with pytest.raises(server.HTTPException) as error:
+        await store(data)
+    assert error.value.status_code == 400
+    media = await db.media.find_one({"sha256": sha256})
+    assert "variants" not in media and media['ref_count'] == 0
+
+
+def test_render_refuses_images_over_the_pixel_limit(tmp_path, monkeypatch):
+    monkeypatch.setattr(Image, "MAX_IMAGE_PIXELS", 64 * 47)
+    source = tmp_path / "source.jpg"
+    source.write_bytes(jpeg_with_gps())
+    with pytest.raises(Image.DecompressionBombError):
+        server.render_image_variants(str(source), str(tmp_path / "out"), {"full": None}, "JPEG")
+    assert not list(tmp_path.glob("out_*"))
+
+
+async def test_a_broken_image_pool_is_replaced(monkeypatch):
+    class BrokenPool:
+        def submit(self, *args, **kwargs):
+            raise server.BrokenProcessPool("a worker died")
+
+        def shutdown(self, wait=True):
+            pass
+
+    monkeypatch.setattr(server, "_image_pool", BrokenPool())
+    monkeypatch.setattr(server, "ProcessPoolExecutor", ThreadPoolExecutor)
+    source = server.UPLOAD_ROOT / "media" / "bp" / f"{uuid.uuid4().hex}.jpg"
+    source.parent.mkdir(parents=True, exist_ok=True)
+    source.write_bytes(jpeg_with_gps())
+
+    variants = await server.create_image_variants(source.relative_to(server.UPLOAD_ROOT).as_posix())
+    assert local_path(variants['full']).exists()
+    assert isinstance(server._image_pool, ThreadPoolExecutor)
+    server._image_pool.shutdown()
@@ -0,0 +1,60 @@
+from datetime import datetime, timedelta, timezone
+
+import orjson
+import pytest
+
+import server
+
+pytestmark = pytest.mark.anyio
+
+
+async def seed_notifications(db, user_id, count, read=False):
+    await db.notifications.insert_many([
+        server.to_document(server.Notification(user_id=user_id, type="like", content="x", read=read))
+        for _ in range(count)
+    ])
+
+
+async def test_counter_is_seeded_when_first_touched_by_a_write(db):
+    # Three unread notifications predate the counter
+    await seed_notifications(db, "u1", 3)
+    await seed_notifications(db, "u1", 1)
+    await server.adjust_unread_counts({"u1": 1})
+    assert await server.get_unread_count("u1") == 4
+
+    result = await db.notifications.update_many({"user_id": "u1", "read": False}, {"$set": {"read": True}})
+    await server.adjust_unread_counts({"u1": -result.modified_count})
+    assert await server.get_unread_count("u1") == 0
+
+
+async def test_mark_read_before_any_counter_does_not_go_negative(db):
+    await seed_notifications(db, "u2", 5)
+    result = await db.notifications.update_many({"user_id": "u2", "read": False}, {"$set": {"read": True}})
+    await server.adjust_unread_counts({"u2": -result.modified_count})
+    counter = await db.notification_counters.find_one({"user_id": "u2"})
+    assert counter['unread'] == 0
+
+
+async def test_existing_counters_move_by_the_delta(db):
+    await seed_notifications(db, "u3", 2)
+    assert await server.get_unread_count("u3") == 2
+    await seed_notifications(db, "u3", 1)
+    await server.adjust_unread_counts({"u3": 1})
+    assert await server.get_unread_count("u3") == 3
+
+
+async def test_head_cursor_marks_read_up_to_the_newest_shown(db, token):
+    start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    await db.notifications.insert_many([
+        server.to_document(server.Notification(user_id="test-user", type="like", content="x",
+                                               created_at=start + timedelta(minutes=n)))
+        for n in range(3)
+    ])
+    response = await server.get_notifications(authorization=token, cursor=None, limit=2)
+    page = orjson.loads(response.body)
+    assert page['head_cursor'] == server.encode_cursor(start + timedelta(minutes=2), page['notifications'][0]['id'])
+
+    # Arrives after the page was fetched
+    await seed_notifications(db, "test-user", 1)
+    await server.mark_notifications_read(authorization=token, cursor=page['head_cursor'])
+    assert await db.notifications.count_documents({"user_id": "test-user", "read": False}) == 1
@@ -0,0 +1,70 @@
+import os
+
+import pytest
+from pymongo import MongoClient
+
+import server
+
+
+def actor(n):
+    return server.AuthIdentity(id=f"actor-{n}", name=f"Actor {n}")
+
+
+def test_coalesced_content():
+    assert server.coalesced_content("follow", ["A"], 1, "A started following you") == "A started following you"
+    assert server.coalesced_content("follow", ["A", "B"], 2, "B started following you") == \
+        "B and 1 other started following you"
+    assert server.coalesced_content("reaction", ["A", "B", "C"], 3, "") == "C and 2 others reacted to your post"
+    # Types without a summary keep their own text
+    assert server.coalesced_content("message", ["A", "B"], 2, "B sent you a message") == "B sent you a message"
+
+
+@pytest.mark.anyio
+async def test_burst_of_follows_coalesces(db):
+    pipeline = server.NotificationPipeline(1, 100, 100, 0)
+    for n in range(3):
+        pipeline.enqueue("target", "follow", actor(n), f"Actor {n} started following you", "/profile/target")
+    # A repeat by the same actor doesn't grow the count
+    pipeline.enqueue("target", "follow", actor(2), "Actor 2 started following you", "/profile/target")
+    await pipeline.stop()
+
+    pipeline.enqueue("target", "follow", actor(3), "Actor 3 started following you", "/profile/target")
+    await pipeline.stop()
+
+    [notification] = await db.notifications.find({"user_id": "target"}).to_list(None)
+    assert notification['count'] == 4
+    assert notification['actor_ids'] == [f"actor-{n}" for n in range(4)]
+    assert notification['content'] == "Actor 3 and 3 others started following you"
+    assert await server.get_unread_count("target") == 1
+
+
+@pytest.mark.anyio
+async def test_different_links_stay_separate(db):
+    pipeline = server.NotificationPipeline(1, 100, 100, 0)
+    pipeline.enqueue("author", "reaction", actor(1), "Actor 1 reacted like to your post", "/post/a")
+    pipeline.enqueue("author", "reaction", actor(2), "Actor 2 reacted like to your post", "/post/b")
+    await pipeline.stop()
+    assert await db.notifications.count_documents({"user_id": "author"}) == 2
+
+
+@pytest.mark.anyio
+async def test_notification_read_mid_flush_is_not_grown(db, monkeypatch):
+    pipeline = server.NotificationPipeline(1, 100, 100, 0)
+    pipeline.enqueue("target", "follow", actor(1), "Actor 1 started following you", "/profile/target")
+    await pipeline.stop()
+
+    # The user marks it read after the flush looked it up, before the update
+    sync_db = MongoClient(os.environ['MONGO_URL'])[os.environ['DB_NAME']]
+    content = server.coalesced_content
+
+    def read_then_coalesce(*args):
+        sync_db.notifications.update_many({"user_id": "target"}, {"$set": {"read": True}})
+        return content(*args)
+
+    monkeypatch.setattr(server, "coalesced_content", read_then_coalesce)
+    pipeline.enqueue("target", "follow", actor(2), "Actor 2 started following you", "/profile/target")
+    await pipeline.stop()
+
+    old, new = await db.notifications.find({"user_id": "target"}).sort("created_at", 1).to_list(None)
+    assert (old['read'], old['count'], old['actor_ids']) == (True, 1, ["actor-1"])
+    assert (new['read'], new['count'], new['actor_ids']) == (False, 1, ["actor-2"])
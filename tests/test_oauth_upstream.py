@@ -0,0 +1,129 @@
+import httpx
+import pytest
+from fastapi import HTTPException
+
+import server
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(server.time, "monotonic", lambda: now[0])
+    return now
+
+
+@pytest.fixture
+def breaker(monkeypatch):
+    breaker = server.CircuitBreaker(failure_threshold=3, reset_timeout=30)
+    monkeypatch.setattr(server, "oauth_breaker", breaker)
+    return breaker
+
+
+@pytest.fixture
+def backoff(monkeypatch):
+    delays = []
+    real_sleep = server.asyncio.sleep
+
+    # Records backoff delays; zero-length yields (used by the client) still happen
+    async def sleep(delay, *args, **kwargs):
+        if delay:
+            delays.append(delay)
+        else:
+            await real_sleep(0)
+
+    monkeypatch.setattr(server.asyncio, "sleep", sleep)
+    monkeypatch.setattr(server.random, "uniform", lambda low, high: 0)
+    return delays
+
+
+# Stub upstream: answers each request with the next scripted response
+@pytest.fixture
+def upstream(monkeypatch):
+    script, calls = [], []
+
+    def handler(request):
+        calls.append(request)
+        response = script.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+    monkeypatch.setattr(server, "http_client", httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+    return script, calls
+
+
+SESSION = {"id": "g-1", "email": "a@example.com", "name": "A", "session_token": "s"}
+
+
+@pytest.mark.anyio
+async def test_5xx_and_transport_errors_are_retried_with_backoff(upstream, breaker, backoff):
+    script, calls = upstream
+    script += [httpx.Response(503), httpx.ConnectError("refused"), httpx.Response(200, json=SESSION)]
+    assert await server.fetch_oauth_session("abc") == SESSION
+    assert [call.headers["X-Session-ID"] for call in calls] == ["abc"] * 3
+    assert backoff == [0.2, 0.4]
+    assert breaker.state == "closed" and breaker.failures == 0
+
+
+@pytest.mark.anyio
+async def test_4xx_is_not_retried(upstream, breaker, backoff):
+    script, calls = upstream
+    script += [httpx.Response(401)]
+    with pytest.raises(HTTPException) as raised:
+        await server.fetch_oauth_session("abc")
+    assert raised.value.status_code == 400
+    assert len(calls) == 1 and backoff == []
+    # The upstream answered, so it counts as healthy
+    assert breaker.failures == 0
+
+
+@pytest.mark.anyio
+async def test_exhausted_retries_are_a_503(upstream, breaker, backoff):
+    script, calls = upstream
+    script += [httpx.Response(500)] * (server.UPSTREAM_RETRIES + 1)
+    with pytest.raises(HTTPException) as raised:
+        await server.fetch_oauth_session("abc")
+    assert raised.value.status_code == 503
+    assert len(calls) == server.UPSTREAM_RETRIES + 1
+
+
+@pytest.mark.anyio
+async def test_open_breaker_fails_fast_without_calling_upstream(upstream, breaker, backoff, clock):
+    script, calls = upstream
+    for _ in range(breaker.failure_threshold):
+        breaker.record_failure()
+    with pytest.raises(HTTPException) as raised:
+        await server.fetch_oauth_session("abc")
+    assert raised.value.status_code == 503
+    assert calls == []
+
+    # After the reset timeout a single probe goes through and closes it
+    clock[0] += breaker.reset_timeout
+    script += [httpx.Response(200, json=SESSION)]
+    assert await server.fetch_oauth_session("abc") == SESSION
+    assert breaker.state == "closed"
+
+
+def test_breaker_transitions(clock):
+    breaker = server.CircuitBreaker(failure_threshold=2, reset_timeout=30)
+    assert breaker.state == "closed" and breaker.allow()
+
+    breaker.record_failure()
+    assert breaker.state == "closed"
+    breaker.record_failure()
+    assert breaker.state == "open" and not breaker.allow()
+
+    clock[0] += 30
+    assert breaker.state == "half-open"
+    # Exactly one probe is admitted; everyone else waits another timeout
+    assert breaker.allow()
+    assert not breaker.allow()
+
+    # A failed probe re-opens the circuit
+    breaker.record_failure()
+    assert breaker.state == "open"
+
+    clock[0] += 30
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed" and breaker.failures == 0
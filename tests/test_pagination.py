@@ -0,0 +1,59 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from fastapi import HTTPException
+
+import server
+
+
+def test_cursor_round_trips_to_an_aware_datetime():
+    at = datetime(2024, 3, 1, 12, 30, 15, 123456, tzinfo=timezone.utc)
+    cursor = server.encode_cursor(at, "post-1")
+    assert "=" not in cursor
+    assert server.decode_cursor(cursor) == (at, "post-1")
+
+
+def test_cursor_accepts_legacy_string_timestamps():
+    cursor = server.encode_cursor("2024-03-01T12:30:15", "post-1")
+    created_at, _ = server.decode_cursor(cursor)
+    assert created_at == datetime(2024, 3, 1, 12, 30, 15, tzinfo=timezone.utc)
+
+
+@pytest.mark.parametrize("cursor", ["not base64!", "bm90IGpzb24", server.encode_cursor("yesterday", "p")])
+def test_malformed_cursors_are_a_client_error(cursor):
+    with pytest.raises(HTTPException) as raised:
+        server.decode_cursor(cursor)
+    assert raised.value.status_code == 400
+
+
+def test_keyset_filter_breaks_ties_on_id():
+    at = datetime(2024, 3, 1, tzinfo=timezone.utc)
+    query = server.keyset_filter(server.encode_cursor(at, "m"), descending=False, time_field="last_activity_at")
+    assert query == {"$or": [
+        {"last_activity_at": {"$gt": at}},
+        {"last_activity_at": at, "id": {"$gt": "m"}}
+    ]}
+
+
+def test_next_page_cursor_only_for_full_pages():
+    at = datetime(2024, 3, 1, tzinfo=timezone.utc)
+    items = [{"id": "a", "created_at": at}, {"id": "b", "created_at": at}]
+    assert server.next_page_cursor(items, 3) is None
+    assert server.decode_cursor(server.next_page_cursor(items, 2)) == (at, "b")
+
+
+@pytest.mark.anyio
+async def test_find_page_visits_every_item_once_despite_tied_timestamps(db):
+    start = datetime(2024, 3, 1, tzinfo=timezone.utc)
+    # Pairs of items share a timestamp
+    await db.posts.insert_many([
+        {"id": f"p{i:02d}", "created_at": start + timedelta(seconds=i // 2)} for i in range(25)
+    ])
+    seen, cursor = [], None
+    while True:
+        items, cursor = await server.find_page(db.posts, {}, 4, cursor)
+        seen += [item['id'] for item in items]
+        if not cursor:
+            break
+    assert sorted(seen) == [f"p{i:02d}" for i in range(25)]
+    assert len(seen) == len(set(seen))
@@ -0,0 +1,50 @@
+import httpx
+import pytest
+
+import server
+
+
+@pytest.fixture
+async def client():
+    # ASGITransport skips startup hooks (indexes, buses), which need a database
+    transport = httpx.ASGITransport(app=server.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        yield client
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize("reaction_type", ["x.y", "$inc", "reaction_counts", "LIKE"])
+async def test_invalid_reaction_type_is_rejected_before_any_write(client, token, reaction_type):
+    response = await client.post(
+        "/api/reactions/some-post",
+        params={"authorization": f"Bearer {token}"},
+        data={"reaction_type": reaction_type}
+    )
+    assert response.status_code == 400
+
+
+def test_reaction_types_are_plain_field_names():
+    for reaction_type in server.REACTION_TYPES:
+        assert reaction_type and "." not in reaction_type and not reaction_type.startswith("$")
+
+
+@pytest.mark.anyio
+async def test_reconcile_fixes_drift_and_skips_posts_that_moved(db, monkeypatch):
+    await db.posts.insert_many([
+        {"id": "drifted", "reaction_counts": {"like": 5}, "comment_count": 9},
+        {"id": "busy", "reaction_counts": {}, "comment_count": 0},
+    ])
+    await db.reactions.insert_one({"post_id": "drifted", "user_id": "u1", "reaction_type": "love"})
+    await db.reactions.insert_one({"post_id": "busy", "user_id": "u1", "reaction_type": "like"})
+    fetch_comment_counts = server.fetch_comment_counts
+
+    async def react_while_counting(post_ids):
+        # A live reaction lands on "busy" after its counters were read
+        await db.posts.update_one({"id": "busy"}, {"$inc": {"reaction_counts.like": 1}})
+        return await fetch_comment_counts(post_ids)
+
+    monkeypatch.setattr(server, "fetch_comment_counts", react_while_counting)
+    assert await server.reconcile_post_counters() == 1
+    drifted, busy = await db.posts.find({}, {"_id": 0}).sort("id", -1).to_list(None)
+    assert (drifted['reaction_counts'], drifted['comment_count']) == ({"love": 1}, 0)
+    assert busy['reaction_counts'] == {"like": 1}
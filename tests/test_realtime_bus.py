@@ -0,0 +1,133 @@
+import asyncio
+import json
+import multiprocessing
+import time
+
+import pytest
+from anyio import to_thread
+
+import server
+
+pytestmark = pytest.mark.anyio
+
+USER_ID = "bus-check-user"
+MESSAGES = 500
+
+
+class RecordingWebSocket:
+    def __init__(self, received):
+        self.received = received
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, data):
+        self.received.append(json.loads(data))
+
+    async def close(self, code=1000):
+        pass
+
+
+async def drain():
+    # Let writer tasks flush their queues
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+async def test_in_memory_bus_delivers_to_other_hubs_only():
+    broker = server.InMemoryBroker()
+    first, second = (server.ConnectionManager(server.InMemoryBus(broker)) for _ in range(2))
+    for hub in (first, second):
+        await hub.bus.start(hub.deliver_local)
+    on_first, on_second = [], []
+    await first.connect("u1", RecordingWebSocket(on_first))
+    await second.connect("u1", RecordingWebSocket(on_second))
+
+    await first.send_message("u1", {"type": "check"})
+    await drain()
+    assert on_first == [{"type": "check"}]
+    assert on_second == [{"type": "check"}]
+
+
+class GatedPresenceBus(server.RealtimeBus):
+    def __init__(self):
+        self.present = set()
+        self.gate = asyncio.Event()
+
+    async def user_online(self, user_id):
+        self.present.add(user_id)
+
+    async def user_offline(self, user_id):
+        await self.gate.wait()
+        self.present.discard(user_id)
+
+
+async def test_reconnect_during_presence_delete_stays_online():
+    bus = GatedPresenceBus()
+    hub = server.ConnectionManager(bus)
+    connection = await hub.connect("u1", RecordingWebSocket([]))
+    hub.disconnect(connection)
+    await asyncio.sleep(0)
+
+    # The page reloads while the delete is still in flight
+    await hub.connect("u1", RecordingWebSocket([]))
+    bus.gate.set()
+    await drain()
+    assert bus.present == {"u1"}
+
+
+async def test_quick_reconnect_skips_the_presence_delete():
+    bus = GatedPresenceBus()
+    bus.gate.set()
+    hub = server.ConnectionManager(bus)
+    connection = await hub.connect("u1", RecordingWebSocket([]))
+    hub.disconnect(connection)
+    await hub.connect("u1", RecordingWebSocket([]))
+    await drain()
+    assert bus.present == {"u1"}
+
+
+# Cross-process delivery through MongoChangeStreamBus. The receiver runs in
+# a spawned process holding the user's socket; this process publishes.
+def receive(expected, events):
+    asyncio.run(_receive(expected, events))
+
+
+async def _receive(expected, events):
+    received = []
+    hub = server.ConnectionManager(server.MongoChangeStreamBus(server.db, worker_id="receiver"))
+    await hub.bus.start(hub.deliver_local)
+    await hub.connect(USER_ID, RecordingWebSocket(received))
+    # Give the change stream a moment to open before the sender starts
+    await asyncio.sleep(1)
+    events.put("ready")
+    deadline = time.monotonic() + 30
+    while len(received) < expected and time.monotonic() < deadline:
+        await asyncio.sleep(0.05)
+    await hub.bus.stop()
+    events.put(len(received))
+
+
+@pytest.fixture
+def replica_set(mongo_info):
+    if "setName" not in mongo_info:
+        pytest.skip("change streams need a replica set")
+
+
+async def test_pushes_cross_worker_processes(db, replica_set):
+    await server.ensure_indexes()
+    context = multiprocessing.get_context("spawn")
+    events = context.Queue()
+    child = context.Process(target=receive, args=(MESSAGES, events))
+    child.start()
+    try:
+        assert await to_thread.run_sync(events.get, True, 60) == "ready"
+        hub = server.ConnectionManager(server.MongoChangeStreamBus(db, worker_id="sender"))
+        await hub.bus.start(hub.deliver_local)
+        await asyncio.gather(*(hub.send_message(USER_ID, {'type': 'check', 'n': i}) for i in range(MESSAGES)))
+        await hub.bus.stop()
+        assert await to_thread.run_sync(events.get, True, 60) == MESSAGES
+    finally:
+        child.join(60)
+        if child.is_alive():
+            child.terminate()
@@ -0,0 +1,35 @@
+import pytest
+
+import server
+
+pytestmark = pytest.mark.anyio
+
+
+async def call(content_length, max_bytes=100):
+    reached, messages = [], []
+
+    async def app(scope, receive, send):
+        reached.append(scope)
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        messages.append(message)
+
+    scope = {"type": "http", "method": "POST", "path": "/api/posts", "headers": [(b"content-length", content_length)]}
+    await server.RequestSizeLimitMiddleware(app, max_bytes)(scope, receive, send)
+    return messages[0]["status"] if messages else None, bool(reached)
+
+
+@pytest.mark.parametrize("content_length", [b"abc", b"12, 12", b"1e3"])
+async def test_malformed_content_length_is_400(content_length):
+    assert await call(content_length) == (400, False)
+
+
+async def test_declared_oversize_body_is_413():
+    assert await call(b"101") == (413, False)
+
+
+async def test_body_within_limit_reaches_the_app():
+    assert await call(b"100") == (None, True)
@@ -0,0 +1,86 @@
+from datetime import datetime, timezone
+
+import pytest
+
+import server
+
+
+def test_normalize_folds_accents_case_and_punctuation():
+    assert server.normalize_search_text("  José  O'Brien-Straße ") == ["jose", "o", "brien", "strasse"]
+    assert server.normalize_search_text("") == []
+    assert server.normalize_search_text(".*(") == []
+
+
+def test_search_fields_index_name_and_email_prefixes():
+    fields = server.search_fields("Zoë Adams", "zadams99@example.com")
+    assert fields["search_name"] == "zoe adams"
+    assert fields["search_tokens"] == ["zoe", "adams", "zadams99"]
+    assert {"z", "zo", "zoe", "a", "ad", "adams", "zadams99"} <= set(fields["search_prefixes"])
+
+
+def test_prefixes_are_capped():
+    fields = server.search_fields("Wolfeschlegelsteinhausen")
+    assert max(len(prefix) for prefix in fields["search_prefixes"]) == server.SEARCH_MAX_PREFIX
+
+
+def candidate(user_id, name, follower_count=0):
+    fields = server.search_fields(name)
+    return {"id": user_id, "follower_count": follower_count, **fields}
+
+
+def test_rank_prefers_exact_then_whole_tokens_then_prefix():
+    candidates = [
+        candidate("prefix", "Annabelle Smithson", 900),
+        candidate("tokens", "Smith Ann Carter", 50),
+        candidate("starts", "Ann Smithers", 10),
+        candidate("exact", "Ann Smith", 1),
+    ]
+    query_tokens = server.normalize_search_text("ann smith")
+    query = " ".join(query_tokens)
+    ranked = sorted(candidates, key=lambda c: server.search_rank(c, query, query_tokens, set()), reverse=True)
+    assert [c["id"] for c in ranked] == ["exact", "tokens", "starts", "prefix"]
+
+
+def test_followed_users_are_boosted_within_a_tier():
+    query_tokens = ["ann"]
+    popular, friend = candidate("popular", "Annika", 5000), candidate("friend", "Annette", 3)
+    rank = lambda c, followed: server.search_rank(c, "ann", query_tokens, followed)  # noqa: E731
+    assert rank(popular, set()) > rank(friend, set())
+    assert rank(friend, {"friend"}) > rank(popular, {"friend"})
+
+
+@pytest.mark.anyio
+async def test_search_user_index(db):
+    for user_id, name, followers in (("u1", "Ann Smith", 5), ("u2", "Anna Wolfeschlegelsteinhausen", 50),
+                                     ("u3", "Bob Jones", 500)):
+        await db.users.insert_one({
+            "id": user_id, "name": name, "email": f"{user_id}@example.com", "password_hash": "x",
+            "follower_count": followers, "timeline_built": True,
+            **server.search_fields(name, f"{user_id}@example.com")
+        })
+
+    results = await server.search_user_index("ann", None)
+    assert [user["id"] for user in results] == ["u1", "u2"]
+    assert not {"password_hash", "search_tokens", "search_name", "search_prefixes", "timeline_built"} & set(results[0])
+
+    # Past the prefix cap the full token is checked
+    assert [u["id"] for u in await server.search_user_index("wolfeschlegelsteinhausen", None)] == ["u2"]
+    assert await server.search_user_index("wolfeschlegelsteinhaux", None) == []
+    assert [u["id"] for u in await server.search_user_index("u3@example.com", None)] == ["u3"]
+
+
+@pytest.mark.anyio
+async def test_exact_and_followed_matches_survive_the_candidate_cut(db, monkeypatch):
+    monkeypatch.setattr(server, "SEARCH_CANDIDATES", 1)
+    for user_id, name, followers in (("popular", "Ann Smithson", 900), ("exact", "Ann Smith", 1),
+                                     ("friend", "Ann Smithers", 2)):
+        await db.users.insert_one({
+            "id": user_id, "name": name, "email": f"{user_id}@example.com", "follower_count": followers,
+            **server.search_fields(name, f"{user_id}@example.com")
+        })
+    await db.connections.insert_one({"id": "c1", "user_id": "viewer", "target_user_id": "friend",
+                                     "created_at": datetime.now(timezone.utc)})
+
+    results = await server.search_user_index("ann smith", "viewer")
+    assert [user["id"] for user in results] == ["exact", "friend", "popular"]
+    assert [user["followed"] for user in results] == [False, True, False]
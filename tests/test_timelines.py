@@ -0,0 +1,64 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import server
+
+pytestmark = pytest.mark.anyio
+
+
+async def seed_user(db, user_id):
+    await db.users.insert_one({"id": user_id, "name": user_id, "follower_count": 0})
+
+
+async def seed_post(db, post_id, author_id, created_at):
+    doc = {"id": post_id, "user_id": author_id, "post_type": "regular", "created_at": created_at}
+    await db.posts.insert_one(dict(doc))
+    return doc
+
+
+async def test_first_fan_out_does_not_hide_older_followed_posts(db):
+    server._built_timelines.clear()
+    await seed_user(db, "reader")
+    await seed_user(db, "author")
+    await db.connections.insert_one({"user_id": "reader", "target_user_id": "author"})
+    start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    for i in range(5):
+        await seed_post(db, f"old-{i}", "author", start + timedelta(minutes=i))
+
+    # A post written after deploy lands in the reader's (otherwise empty) timeline
+    fresh = await seed_post(db, "fresh", "author", start + timedelta(hours=1))
+    await server.fan_out_post(fresh, follower_count=1)
+
+    post_ids, _ = await server.read_timeline("reader", 10)
+    assert post_ids == ["fresh", "old-4", "old-3", "old-2", "old-1", "old-0"]
+    assert await db.users.find_one({"id": "reader", "timeline_built": True})
+
+
+async def test_fan_out_keeps_timelines_bounded(db, monkeypatch):
+    monkeypatch.setattr(server, "TIMELINE_MAX_ENTRIES", 3)
+    monkeypatch.setattr(server, "TIMELINE_TRIM_INTERVAL", 1)
+    await db.connections.insert_one({"user_id": "reader", "target_user_id": "author"})
+    start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    for i in range(10):
+        post = await seed_post(db, f"post-{i}", "author", start + timedelta(minutes=i))
+        await server.fan_out_post(post, follower_count=1)
+
+    for owner_id in ("reader", "author"):
+        entries = await db.timelines.find({"user_id": owner_id}).sort("created_at", -1).to_list(None)
+        assert [entry['post_id'] for entry in entries] == ["post-9", "post-8", "post-7"]
+
+
+async def test_reconcile_follower_counts(db):
+    await db.users.insert_many([
+        {"id": "author", "name": "author", "follower_count": -1},
+        {"id": "legacy", "name": "legacy"},
+        {"id": "nobody", "name": "nobody", "follower_count": 3},
+    ])
+    await db.connections.insert_many([
+        {"user_id": f"reader-{n}", "target_user_id": target}
+        for n, target in enumerate(["author", "author", "legacy"])
+    ])
+    assert await server.reconcile_follower_counts(batch_size=2) == 3
+    counts = {user['id']: user['follower_count'] async for user in db.users.find({}, {"_id": 0})}
+    assert counts == {"author": 2, "legacy": 1, "nobody": 0}
@@ -0,0 +1,83 @@
+import random
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import server
+
+
+def test_normalize_hashtag_folds_case_and_width():
+    assert server.extract_hashtags("#Python #python #ＰＹＴＨＯＮ and #go!") == ["python", "go"]
+
+
+def test_space_saving_is_exact_under_capacity():
+    sketch = server.SpaceSaving(10)
+    for item, count in {"a": 5, "b": 3, "c": 1}.items():
+        sketch.add(item, count)
+    assert sketch.top(2) == [("a", 5), ("b", 3)]
+    assert set(sketch.errors.values()) == {0}
+
+
+def test_space_saving_keeps_heavy_hitters_with_bounded_error():
+    rng = random.Random(3)
+    stream = ["hot"] * 500 + ["warm"] * 200 + [f"cold{rng.randrange(5000)}" for _ in range(4300)]
+    rng.shuffle(stream)
+    truth = Counter(stream)
+    sketch = server.SpaceSaving(50)
+    for item in stream:
+        sketch.add(item)
+
+    assert [item for item, _ in sketch.top(2)] == ["hot", "warm"]
+    for item, count in sketch.counts.items():
+        # Counts never underestimate and overestimate by at most the recorded error
+        assert truth[item] <= count <= truth[item] + sketch.errors[item]
+        assert sketch.errors[item] <= len(stream) / sketch.capacity
+
+
+def test_top_is_a_sliding_window_across_the_hour_boundary():
+    trending = server.TrendingTags(capacity=100)
+    # Uniform traffic from 11:00 to 12:01: one #python per minute
+    start = datetime(2024, 5, 1, 11, 0, 30, tzinfo=timezone.utc)
+    for minute in range(61):
+        trending.observe(["python"], start + timedelta(minutes=minute))
+
+    now = datetime(2024, 5, 1, 12, 1, 30, tzinfo=timezone.utc)
+    [entry] = trending.top(1, 10, now)
+    # 11:01:30-12:01:30 holds 60 posts, not just the one since 12:00
+    assert entry["tag"] == "python"
+    assert entry["count"] == pytest.approx(60, abs=1)
+
+
+def test_top_excludes_hours_before_the_window():
+    trending = server.TrendingTags(capacity=100)
+    now = datetime(2024, 5, 1, 12, 0, tzinfo=timezone.utc)
+    trending.observe(["old"], now - timedelta(hours=2, minutes=1))
+    trending.observe(["new"], now - timedelta(minutes=5))
+    assert [entry["tag"] for entry in trending.top(1, 10, now)] == ["new"]
+    assert {entry["tag"] for entry in trending.top(6, 10, now)} == {"old", "new"}
+
+
+def test_longest_window_keeps_its_edge_bucket():
+    trending = server.TrendingTags(capacity=100)
+    now = datetime(2024, 5, 1, 12, 30, tzinfo=timezone.utc)
+    longest = max(server.TRENDING_WINDOWS.values())
+    # Inside the 24h window, in the hour bucket that holds its start
+    trending.observe(["edge"], now - timedelta(hours=longest, minutes=-10), count=4)
+    trending.observe(["python"], now)
+    counts = {entry["tag"]: entry["count"] for entry in trending.top(longest, 10, now)}
+    # Half of the edge hour lies inside the window
+    assert counts["edge"] == 2
+
+
+@pytest.mark.anyio
+async def test_load_trending_tags_sees_every_workers_counts(db):
+    now = datetime.now(timezone.utc)
+    # Counts written by other workers, this hour and two hours ago
+    await db.hashtag_counts.insert_many([
+        {"tag": "python", "hour": server.hour_bucket(now), "count": 7},
+        {"tag": "go", "hour": server.hour_bucket(now - timedelta(hours=2)), "count": 3},
+    ])
+    trending = await server.load_trending_tags()
+    assert trending.top(1, 10, now) == [{"tag": "python", "count": 7}]
+    assert {entry["tag"] for entry in trending.top(6, 10, now)} == {"python", "go"}